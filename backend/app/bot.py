@@ -1,11 +1,10 @@
 ﻿# backend/app/bot.py
 import asyncio
-import json
 import logging
 import os
 import re
-import redis
 import socket
+import time
 import uuid
 from datetime import datetime, timezone
 from typing import Any, Dict, List, Optional, TextIO, Tuple, AsyncGenerator
@@ -13,13 +12,18 @@ from typing import Any, Dict, List, Optional, TextIO, Tuple, AsyncGenerator
 import discord
 from discord.ext import commands
 
-from .utils import TokenCalculator, download_image, split_message, transform_memories_for_prompt, matches_trigger_keywords
+from .utils import TokenCalculator, close_image_session, download_images, transform_memories_for_prompt
 from .usage_tracker import usage_tracker
 from .core_logic.persona_manager import determine_bot_persona, build_system_prompt, get_highest_configured_role
-from .core_logic.context_builder import build_context_history, format_user_message_for_llm
+from .core_logic.history_cache import ChannelHistoryCache
+from .core_logic.context_builder import build_context_history, clean_message_text, collect_world_book_candidates, format_user_message_for_llm
+from .core_logic.stream_renderer import DiscordStreamRenderer
 from .core_logic.usage_manager import UsageManager
+from .core_logic.trigger_classifier import TriggerClassifier
 from .core_logic.knowledge_manager import knowledge_manager # Import the singleton instance
+from .config_store import ConfigSnapshot, config_store
 from .debug_capture_store import add_capture
+from .redis_service import message_lock_service, redis_service
 from .llm_providers.factory import get_llm_provider
 from .ocr_service import (
     extract_ocr_text,
@@ -27,6 +31,13 @@ from .ocr_service import (
     has_ocr_model_config,
     is_multimodal_llm,
 )
+from .rerank_service import (
+    RERANK_CANDIDATE_MULTIPLIER,
+    RERANK_MAX_CANDIDATES,
+    is_rerank_enabled,
+    order_by_scores,
+    rerank_scores,
+)
 from plugins.manager import PluginManager
 
 logger = logging.getLogger(__name__)
@@ -43,38 +54,11 @@ except ImportError:
 
 INSTANCE_ID = os.getenv("BOT_INSTANCE_ID") or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
 
-# --- Hardened Redis connection handling ---
-redis_client = None
-try:
-    REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
-    REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
-    
-    # 灏濊瘯杩炴帴 Redis
-    _redis_client = redis.Redis(host=REDIS_HOST, port=REDIS_PORT, db=0, decode_responses=True)
-    _redis_client.ping()
-    redis_client = _redis_client
-    logger.info(f"[instance={INSTANCE_ID}] Successfully connected to Redis at {REDIS_HOST}:{REDIS_PORT}")
-
-except redis.exceptions.ConnectionError as e:
-    logger.error(f"[instance={INSTANCE_ID}] Could not connect to Redis at {REDIS_HOST}:{REDIS_PORT}. Error: {e}")
-    # Check the environment flag to decide between fail-fast and mock fallback behavior.
-    if os.getenv('FAIL_ON_REDIS_ERROR', 'false').lower() == 'true':
-        logger.critical(f"[instance={INSTANCE_ID}] FAIL_ON_REDIS_ERROR is true. Terminating application.")
-        # Raising an explicit exception here prevents bot.start() from running.
-        raise ConnectionAbortedError("Failed to connect to Redis. Aborting.")
-    else:
-        # Use a minimal mock client so local development can continue without Redis.
-        class MockRedis:
-            def set(self, *args, **kwargs): return True
-        redis_client = MockRedis()
-        logger.warning(f"[instance={INSTANCE_ID}] FAIL_ON_REDIS_ERROR is not set to true. Using a mock Redis client. CONCURRENCY PROTECTION IS DISABLED.")
-
-
 from pathlib import Path
 
 # Keep the runtime data directory aligned with main.py.
 DATA_DIR = Path.cwd() / "data"
-CONFIG_FILE = DATA_DIR / "config.json"
+CONFIG_FILE = config_store.path
 BOT_PROCESS_LOCK_FILE = DATA_DIR / "discord_bot.lock"
 bot_instance = None
 current_config = {}
@@ -134,12 +118,15 @@ def _release_bot_process_lock(handle: Optional[TextIO]) -> None:
     finally:
         handle.close()
 
-def load_bot_config():
+def load_bot_config_snapshot() -> ConfigSnapshot:
+    """Return the cached (version, config) snapshot; it is only re-read when config.json changes."""
     global current_config
-    if os.path.exists(CONFIG_FILE):
-        with open(CONFIG_FILE, "r", encoding='utf-8') as f:
-            current_config = json.load(f)
-    return current_config
+    snapshot = config_store.get_snapshot()
+    current_config = snapshot.data
+    return snapshot
+
+def load_bot_config():
+    return load_bot_config_snapshot().data
 
 def collect_image_descriptors(msg: discord.Message, source_label: str) -> List[Dict[str, str]]:
     """
@@ -196,8 +183,190 @@ def build_ocr_prompt_block(ocr_text: str) -> str:
     return f"[Image OCR Context]\n<ocr_output>\n{ocr_text}\n</ocr_output>"
 
 
+# Per-stage timeouts (seconds) for concurrent prompt assembly. None = the stage manages its own
+# timeouts (image downloads use the session timeout, OCR honours ocr_timeout_seconds).
+PROMPT_STAGE_TIMEOUTS: Dict[str, Optional[float]] = {
+    "images": None,
+    "history": 15.0,
+    "system_prompt": 20.0,
+    "world_book": 5.0,
+    "memory": 5.0,
+}
+_STAGE_REQUIRED = object()
 
-def process_memory_tags(message: discord.Message, text: str, bot_config: Dict[str, Any]) -> str:
+
+async def run_prompt_stage(name: str, awaitable: Any, timings: Dict[str, float], fallback: Any = _STAGE_REQUIRED) -> Any:
+    """
+    Awaits one prompt-assembly stage with its configured timeout and records its wall time (ms).
+    Optional stages return `fallback` on timeout/error; required stages re-raise.
+    """
+    started = time.perf_counter()
+    timeout = PROMPT_STAGE_TIMEOUTS.get(name)
+    try:
+        if timeout is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, timeout=timeout)
+    except asyncio.TimeoutError:
+        logger.warning(f"[instance={INSTANCE_ID}] Prompt stage '{name}' timed out after {timeout}s.")
+        if fallback is _STAGE_REQUIRED:
+            raise
+        return fallback
+    except Exception as e:
+        logger.error(f"[instance={INSTANCE_ID}] Prompt stage '{name}' failed: {e}", exc_info=True)
+        if fallback is _STAGE_REQUIRED:
+            raise
+        return fallback
+    finally:
+        timings[name] = round((time.perf_counter() - started) * 1000, 1)
+
+
+async def prepare_image_inputs(message: discord.Message, config: Dict[str, Any]) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Downloads images from the current and replied message, then runs OCR when the main model is text-only.
+    Returns (downloaded_images, ocr_prompt_block_or_None).
+    """
+    image_descriptors = collect_image_descriptors(message, "Current message")
+    if message.reference and isinstance(message.reference.resolved, discord.Message):
+        replied_msg = message.reference.resolved
+        replied_images = collect_image_descriptors(replied_msg, f"Replied message from {replied_msg.author}")
+        image_descriptors.extend(replied_images)
+        if replied_images:
+            logger.info(f"[instance={INSTANCE_ID}] Found {len(replied_images)} images in replied message from {replied_msg.author}")
+    downloaded_images = await download_images(image_descriptors)
+    if downloaded_images:
+        logger.info(f"[instance={INSTANCE_ID}] Downloaded {len(downloaded_images)}/{len(image_descriptors)} images for message {message.id}")
+
+    if not downloaded_images or is_multimodal_llm(config):
+        return downloaded_images, None
+
+    if not has_ocr_model_config(config):
+        logger.warning(
+            "[instance=%s] Main model is text-only but OCR is not configured. Images will not be transcribed.",
+            INSTANCE_ID,
+        )
+        return downloaded_images, build_ocr_prompt_block('Images were attached, but OCR is not configured for the current text-only LLM.')
+
+    timeout_seconds = get_ocr_timeout_seconds(config)
+    try:
+        extraction_task = extract_ocr_text(downloaded_images, config)
+        if timeout_seconds is None:
+            ocr_text, ocr_usage = await extraction_task
+        else:
+            ocr_text, ocr_usage = await asyncio.wait_for(extraction_task, timeout=timeout_seconds)
+        if not ocr_text:
+            logger.warning(
+                "[instance=%s] OCR returned empty output for %s images. Falling back to image note only.",
+                INSTANCE_ID,
+                len(downloaded_images),
+            )
+            return downloaded_images, None
+        logger.info(
+            "[instance=%s] OCR extracted text for %s images using %s/%s.",
+            INSTANCE_ID,
+            len(downloaded_images),
+            config.get("ocr_provider", ""),
+            config.get("ocr_model_name", ""),
+        )
+        if ocr_usage:
+            logger.info(
+                "[instance=%s] OCR usage data: input=%s output=%s",
+                INSTANCE_ID,
+                ocr_usage.get("input_tokens", 0),
+                ocr_usage.get("output_tokens", 0),
+            )
+        return downloaded_images, build_ocr_prompt_block(ocr_text)
+    except asyncio.TimeoutError:
+        logger.warning(
+            "[instance=%s] OCR preprocessing timed out after %s seconds for message %s.",
+            INSTANCE_ID,
+            timeout_seconds,
+            message.id,
+        )
+        return downloaded_images, build_ocr_prompt_block('OCR解析超时，你没有成功获取到图片内容')
+    except Exception as ocr_error:
+        logger.error(
+            "[instance=%s] OCR preprocessing failed for message %s: %s",
+            INSTANCE_ID,
+            message.id,
+            ocr_error,
+            exc_info=True,
+        )
+        return downloaded_images, build_ocr_prompt_block('OCR preprocessing failed. Images were attached but could not be transcribed.')
+
+
+async def recall_memory_block(config: Dict[str, Any], query_text: str) -> Optional[str]:
+    """Recalls long-term memories for the query (optionally reranked) and renders the <long_term_memory> block."""
+    try:
+        recall_top_k = max(1, min(50, int(config.get("auto_memory_recall_top_k", 12))))
+    except (TypeError, ValueError):
+        recall_top_k = 12
+    try:
+        recall_char_limit = max(300, min(20000, int(config.get("auto_memory_recall_char_limit", 2200))))
+    except (TypeError, ValueError):
+        recall_char_limit = 2200
+    try:
+        recall_max_age_days = max(1, min(3650, int(config.get("auto_memory_recall_max_age_days", 365))))
+    except (TypeError, ValueError):
+        recall_max_age_days = 365
+    if is_rerank_enabled(config):
+        # Widen the lexical candidate pool, let the rerank model order it, then apply the usual budget.
+        scored = await knowledge_manager.run(
+            knowledge_manager.rank_memory_candidates,
+            query_text,
+            top_k=min(50, recall_top_k * RERANK_CANDIDATE_MULTIPLIER),
+            max_age_days=recall_max_age_days,
+            config=config,
+            query_vector=await knowledge_manager.embed_query_async(query_text, config),
+        )
+        head = scored[:RERANK_MAX_CANDIDATES]
+        scores = await rerank_scores(query_text, "memory", [(row["id"], row["_plain"]) for _, row in head], config)
+        if scores:
+            scored = order_by_scores([(score, row) for score, (_, row) in zip(scores, head)], scores) + scored[len(head):]
+        relevant_memories = await knowledge_manager.run(
+            knowledge_manager.select_memories, scored, top_k=recall_top_k, char_limit=recall_char_limit
+        )
+    else:
+        relevant_memories = await knowledge_manager.get_relevant_memories_async(
+            query_text,
+            top_k=recall_top_k,
+            char_limit=recall_char_limit,
+            max_age_days=recall_max_age_days,
+            config=config,
+        )
+    if not relevant_memories:
+        return None
+    # We don't know the Discord user's timezone, so we transform using UTC as a neutral default.
+    # The important part is that manually added memories with specific times are preserved correctly.
+    transformed_memories = transform_memories_for_prompt(relevant_memories, target_timezone_str='UTC')
+    logger.info(
+        "[instance=%s] Injected %s relevant memories into the system prompt (top_k=%s, char_limit=%s).",
+        INSTANCE_ID,
+        len(transformed_memories),
+        recall_top_k,
+        recall_char_limit,
+    )
+    # Combine memories into a single block for the system prompt
+    return "\n".join(transformed_memories)
+
+
+
+async def collect_world_book_stage(message: discord.Message, client: discord.Client, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """User-linked world book entries first, then keyword hits (reranked when a rerank model is enabled)."""
+    # An in-memory index lookup that reads discord.py objects: run it on the loop, not the SQLite pool.
+    user_entries, text_entries = collect_world_book_candidates(message, client, config)
+    if len(text_entries) > 1 and is_rerank_enabled(config):
+        head = text_entries[:RERANK_MAX_CANDIDATES]
+        scores = await rerank_scores(
+            clean_message_text(message, client),
+            "world_book",
+            [(entry["id"], f"{entry.get('keywords', '')}: {entry.get('content', '')}") for entry in head],
+            config,
+        )
+        text_entries = order_by_scores(head, scores) + text_entries[len(head):]
+    return user_entries + text_entries
+
+
+async def process_memory_tags(message: discord.Message, text: str, bot_config: Dict[str, Any]) -> str:
     """
     Finds <memory> tags in the text, saves the content with metadata to long-term memory,
     and returns the text with the tags removed.
@@ -218,7 +387,7 @@ def process_memory_tags(message: discord.Message, text: str, bot_config: Dict[st
             user_name = message.author.name
             
             try:
-                ingest_result = knowledge_manager.ingest_memory_candidate(
+                ingest_result = await knowledge_manager.ingest_memory_candidate_async(
                     content=stripped_content,
                     timestamp=timestamp,
                     user_id=user_id,
@@ -325,6 +494,16 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
         logger.info(f"[instance={INSTANCE_ID}] DISCORD_BOT_AUTOSTART is disabled. Skipping Discord bot startup.")
         return
 
+    if await redis_service.get_client() is None:
+        if redis_service.fail_fast:
+            logger.critical(f"[instance={INSTANCE_ID}] Could not connect to Redis and FAIL_ON_REDIS_ERROR is true. Terminating bot startup.")
+            # Raising here prevents bot.start() from running.
+            raise ConnectionAbortedError("Failed to connect to Redis. Aborting.")
+        logger.warning(
+            f"[instance={INSTANCE_ID}] Redis is unavailable. Message locks fall back to in-process locks until it comes back; "
+            "CONCURRENCY PROTECTION ACROSS INSTANCES IS DISABLED."
+        )
+
     bot_process_lock: Optional[TextIO] = None
     for attempt in range(15):
         bot_process_lock = _try_acquire_bot_process_lock()
@@ -378,10 +557,20 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
         return full_response
 
     plugin_manager = PluginManager(config.get("plugins", {}), get_llm_response)
-    knowledge_manager.init_db() # Ensure DB is ready
+    await knowledge_manager.run(knowledge_manager.init_db) # Ensure DB is ready
     usage_manager = UsageManager(token_calculator)
+    history_cache = ChannelHistoryCache()
     auto_message_counts: Dict[int, int] = {}
     repeat_streaks: Dict[int, Dict[str, Any]] = {}
+    plugin_trigger_hints = plugin_manager.get_trigger_hints()
+    trigger_classifier_cache: Dict[str, Any] = {"version": None, "classifier": None}
+
+    def _get_trigger_classifier(snapshot: ConfigSnapshot) -> TriggerClassifier:
+        # Plugins are fixed for the lifetime of this bot session, so the config version is the only key.
+        if trigger_classifier_cache["version"] != snapshot.version:
+            trigger_classifier_cache["classifier"] = TriggerClassifier(snapshot.data, plugin_trigger_hints)
+            trigger_classifier_cache["version"] = snapshot.version
+        return trigger_classifier_cache["classifier"]
 
     def _reset_channel_automation_state(channel_id: int) -> None:
         auto_message_counts[channel_id] = 0
@@ -469,40 +658,49 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
 
     @bot.event
     async def on_ready():
+        # on_ready also fires after a full reconnect, where gateway events may have been missed.
+        history_cache.invalidate()
         logger.info(f"[instance={INSTANCE_ID}] {bot.user} has connected to Discord!")
+
+    @bot.event
+    async def on_message_edit(before, after):
+        history_cache.record_edit(after)
+
+    @bot.event
+    async def on_raw_message_delete(payload):
+        history_cache.record_delete(payload.channel_id, [payload.message_id])
+
+    @bot.event
+    async def on_raw_bulk_message_delete(payload):
+        history_cache.record_delete(payload.channel_id, list(payload.message_ids))
     
     @bot.event
     async def on_message(message):
+        history_cache.record(message)
         if message.author == bot.user:
             return
 
         # Load config at the top of the handler so every downstream step uses fresh values.
-        config = load_bot_config()
+        config_snapshot = load_bot_config_snapshot()
+        config = config_snapshot.data
+        trigger_classifier = _get_trigger_classifier(config_snapshot)
         auto_interject_triggered = _track_auto_interject(message, config)
         repeat_parrot_content = _track_repeat_parrot(message, config)
-        
-                # Trigger detection
-        trigger_keywords = config.get("trigger_keywords", [])
-        trigger_match_mode = config.get("trigger_match_mode", "contains")
-        trigger_case_sensitive = bool(config.get("trigger_case_sensitive", False))
-        is_mentioned = bot.user in message.mentions
-        is_reply_to_bot = (
-            message.reference
-            and isinstance(message.reference.resolved, discord.Message)
-            and message.reference.resolved.author == bot.user
-        )
-        has_trigger_keyword = matches_trigger_keywords(
-            message.content,
-            trigger_keywords,
-            match_mode=trigger_match_mode,
-            case_sensitive=trigger_case_sensitive,
-        )
-        normal_triggered = is_mentioned or is_reply_to_bot or has_trigger_keyword
+
+        # Trigger detection
+        normal_triggered = trigger_classifier.is_normal_triggered(message, bot.user)
+        plugins_may_fire = trigger_classifier.plugins_may_fire(message.content, normal_triggered)
+
+        # Fast path: unrelated chatter never reaches the plugin loop or the config copy below.
+        if not (normal_triggered or auto_interject_triggered or repeat_parrot_content or plugins_may_fire):
+            return
 
         # Plugin processing (receives runtime trigger state)
-        plugin_runtime_config = dict(config)
-        plugin_runtime_config["_runtime_normal_triggered"] = normal_triggered
-        plugin_result = await plugin_manager.process_message(message, plugin_runtime_config)
+        plugin_result = None
+        if plugins_may_fire:
+            plugin_runtime_config = dict(config)
+            plugin_runtime_config["_runtime_normal_triggered"] = normal_triggered
+            plugin_result = await plugin_manager.process_message(message, plugin_runtime_config)
         if plugin_result is True:
             return
 
@@ -540,195 +738,98 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
 
         # --- Distributed lock handling ---
         # Only lock confirmed trigger messages so unrelated chat is never serialized.
-        lock_key = f"discord:message_lock:{message.id}"
-        is_lock_acquired = redis_client.set(lock_key, "processing", nx=True, ex=60)
+        message_lock = await message_lock_service.acquire(message.id)
         
-        if not is_lock_acquired:
+        if message_lock is None:
             logger.info(f"[instance={INSTANCE_ID}] Triggering message {message.id} is already being processed. Skipping.")
             return
         
         logger.info(f"[instance={INSTANCE_ID}] Acquired lock for triggering message {message.id}. Processing...")
-        
-        # Collect image inputs from the current message and any replied message.
-        image_descriptors = collect_image_descriptors(message, "Current message")
-        if message.reference and isinstance(message.reference.resolved, discord.Message):
-            replied_msg = message.reference.resolved
-            replied_images = collect_image_descriptors(replied_msg, f"Replied message from {replied_msg.author}")
-            image_descriptors.extend(replied_images)
-            if replied_images:
-                logger.info(f"[instance={INSTANCE_ID}] Found {len(replied_images)} images in replied message from {replied_msg.author}")
-        downloaded_images: List[Dict[str, Any]] = []
-        for descriptor in image_descriptors:
-            url = descriptor["url"]
-            img_data = await download_image(url)
-            if img_data:
-                downloaded_images.append({**descriptor, "bytes": img_data})
-                logger.info(f"[instance={INSTANCE_ID}] Successfully downloaded image from {url}")
-        llm_images = [item["bytes"] for item in downloaded_images]
-        
-        # Core prompt assembly: context, persona, and final user payload.
-        role_name, role_config = (None, None); 
-        if isinstance(message.author, discord.Member):
-            role_name, role_config = get_highest_configured_role(message.author, config.get("role_based_config", {})) or (None, None)
-        
-        cutoff_timestamp = memory_cutoffs.get(message.channel.id)
-        history_messages, history_for_llm = await build_context_history(bot, config, message, cutoff_timestamp)
-        specific_persona_prompt, situational_prompt, active_directives_log = determine_bot_persona(config, str(message.channel.id), str(message.guild.id) if message.guild else None, role_name, role_config)
-        system_prompt = await build_system_prompt(bot, config, specific_persona_prompt, situational_prompt, message, active_directives_log)
-        final_formatted_content = format_user_message_for_llm(message, bot, config, role_config, injected_data)
-
-        if downloaded_images and not is_multimodal_llm(config):
-            if has_ocr_model_config(config):
-                timeout_seconds = get_ocr_timeout_seconds(config)
-                try:
-                    extraction_task = extract_ocr_text(downloaded_images, config)
-                    if timeout_seconds is None:
-                        ocr_text, ocr_usage = await extraction_task
-                    else:
-                        ocr_text, ocr_usage = await asyncio.wait_for(extraction_task, timeout=timeout_seconds)
-                    if ocr_text:
-                        final_formatted_content = f"{final_formatted_content}\n\n{build_ocr_prompt_block(ocr_text)}"
-                        logger.info(
-                            "[instance=%s] OCR extracted text for %s images using %s/%s.",
-                            INSTANCE_ID,
-                            len(downloaded_images),
-                            config.get("ocr_provider", ""),
-                            config.get("ocr_model_name", ""),
-                        )
-                        if ocr_usage:
-                            logger.info(
-                                "[instance=%s] OCR usage data: input=%s output=%s",
-                                INSTANCE_ID,
-                                ocr_usage.get("input_tokens", 0),
-                                ocr_usage.get("output_tokens", 0),
-                            )
-                    else:
-                        logger.warning(
-                            "[instance=%s] OCR returned empty output for %s images. Falling back to image note only.",
-                            INSTANCE_ID,
-                            len(downloaded_images),
-                        )
-                except asyncio.TimeoutError:
-                    logger.warning(
-                        "[instance=%s] OCR preprocessing timed out after %s seconds for message %s.",
-                        INSTANCE_ID,
-                        timeout_seconds,
-                        message.id,
-                    )
-                    final_formatted_content = (
-                        f"{final_formatted_content}\n\n"
-                        f"{build_ocr_prompt_block('OCR解析超时，你没有成功获取到图片内容')}"
-                    )
-                except Exception as ocr_error:
-                    logger.error(
-                        "[instance=%s] OCR preprocessing failed for message %s: %s",
-                        INSTANCE_ID,
-                        message.id,
-                        ocr_error,
-                        exc_info=True,
-                    )
-                    final_formatted_content = (
-                        f"{final_formatted_content}\n\n"
-                        f"{build_ocr_prompt_block('OCR preprocessing failed. Images were attached but could not be transcribed.')}"
-                    )
-            else:
-                logger.warning(
-                    "[instance=%s] Main model is text-only but OCR is not configured. Images will not be transcribed.",
-                    INSTANCE_ID,
-                )
-                final_formatted_content = (
-                    f"{final_formatted_content}\n\n"
-                    f"{build_ocr_prompt_block('Images were attached, but OCR is not configured for the current text-only LLM.')}"
-                )
-        
-        # --- [NEW] Memory Retrieval and Injection ---
-        try:
-            recall_top_k = max(1, min(50, int(config.get("auto_memory_recall_top_k", 12))))
-        except (TypeError, ValueError):
-            recall_top_k = 12
-        try:
-            recall_char_limit = max(300, min(20000, int(config.get("auto_memory_recall_char_limit", 2200))))
-        except (TypeError, ValueError):
-            recall_char_limit = 2200
+        quota_reservation = None
+        stream_renderer: Optional[DiscordStreamRenderer] = None
         try:
-            recall_max_age_days = max(1, min(3650, int(config.get("auto_memory_recall_max_age_days", 365))))
-        except (TypeError, ValueError):
-            recall_max_age_days = 365
-        relevant_memories = knowledge_manager.get_relevant_memories(
-            query_text=message.content or "",
-            top_k=recall_top_k,
-            char_limit=recall_char_limit,
-            max_age_days=recall_max_age_days,
-        )
-        if relevant_memories:
-            # We don't know the Discord user's timezone, so we transform using UTC as a neutral default.
-            # The important part is that manually added memories with specific times are preserved correctly.
-            transformed_memories = transform_memories_for_prompt(relevant_memories, target_timezone_str='UTC')
-            
-            # Combine memories into a single block for the system prompt
-            memory_knowledge = "\n".join(transformed_memories)
-            
-            # Prepend to the system prompt inside a <knowledge> tag
-            system_prompt = f"<knowledge>\n<long_term_memory>\n{memory_knowledge}\n</long_term_memory>\n</knowledge>\n\n{system_prompt}"
-            logger.info(
-                "[instance=%s] Injected %s relevant memories into the system prompt (top_k=%s, char_limit=%s).",
-                INSTANCE_ID,
-                len(transformed_memories),
-                recall_top_k,
-                recall_char_limit,
+            # Core prompt assembly: independent stages run concurrently, so time-to-first-token is
+            # bounded by the slowest stage instead of the sum of all of them.
+            role_name, role_config = (None, None); 
+            if isinstance(message.author, discord.Member):
+                role_name, role_config = get_highest_configured_role(message.author, config.get("role_based_config", {})) or (None, None)
+
+            cutoff_timestamp = memory_cutoffs.get(message.channel.id)
+            specific_persona_prompt, situational_prompt, active_directives_log = determine_bot_persona(config, str(message.channel.id), str(message.guild.id) if message.guild else None, role_name, role_config)
+            stage_timings: Dict[str, float] = {}
+            assembly_started = time.perf_counter()
+            (
+                (downloaded_images, ocr_block),
+                (history_messages, history_for_llm),
+                system_prompt,
+                world_book_entries,
+                memory_knowledge,
+            ) = await asyncio.gather(
+                run_prompt_stage("images", prepare_image_inputs(message, config), stage_timings, fallback=([], None)),
+                run_prompt_stage("history", build_context_history(bot, config, message, cutoff_timestamp, history_cache), stage_timings, fallback=([], [])),
+                run_prompt_stage("system_prompt", build_system_prompt(bot, config, specific_persona_prompt, situational_prompt, message, active_directives_log), stage_timings),
+                run_prompt_stage("world_book", collect_world_book_stage(message, bot, config), stage_timings, fallback=[]),
+                run_prompt_stage("memory", recall_memory_block(config, message.content or ""), stage_timings, fallback=None),
             )
-        # --- End of Memory Injection ---
+            stage_timings["total"] = round((time.perf_counter() - assembly_started) * 1000, 1)
+            logger.info(f"[instance={INSTANCE_ID}] Prompt assembly timings (ms) for message {message.id}: {stage_timings}")
+
+            llm_images = [item["bytes"] for item in downloaded_images]
+            final_formatted_content = format_user_message_for_llm(message, bot, config, role_config, injected_data, world_book_entries=world_book_entries)
+            if ocr_block:
+                final_formatted_content = f"{final_formatted_content}\n\n{ocr_block}"
+            if memory_knowledge:
+                # Prepend to the system prompt inside a <knowledge> tag
+                system_prompt = f"<knowledge>\n<long_term_memory>\n{memory_knowledge}\n</long_term_memory>\n</knowledge>\n\n{system_prompt}"
+
+            # Quota is reserved up front (estimated input + output budget) and reconciled with the
+            # real usage afterwards, so concurrent requests from one user cannot overspend it.
+            if role_config:
+                # Estimate input tokens for the reservation
+                estimated_input_tokens = token_calculator.get_token_count_for_messages(
+                    [{"role": "system", "content": system_prompt}] + history_for_llm + [{"role": "user", "content": final_formatted_content}],
+                    config.get("llm_provider"),
+                    config.get("model_name")
+                )
 
-        if role_config:
-            user_usage = await usage_manager.check_quota_and_get_usage(message.author.id, role_config)
-            
-            # Estimate input tokens for pre-check
-            estimated_input_tokens = token_calculator.get_token_count_for_messages(
-                [{"role": "system", "content": system_prompt}] + history_for_llm + [{"role": "user", "content": final_formatted_content}],
-                config.get("llm_provider"),
-                config.get("model_name")
-            )
+                quota_reservation, quota_error = await usage_manager.reserve_quota(message.author.id, role_config, estimated_input_tokens)
+                if quota_error:
+                    _reset_channel_automation_state(message.channel.id)
+                    await message.reply(quota_error, mention_author=False)
+                    return
 
-            quota_error = await usage_manager.check_pre_request_quota(message.author.id, role_config, user_usage, estimated_input_tokens)
-            if quota_error:
-                _reset_channel_automation_state(message.channel.id)
-                await message.reply(quota_error, mention_author=False)
-                return
+            llm_messages = [{"role": "system", "content": system_prompt}] + history_for_llm + [{"role": "user", "content": final_formatted_content}]
+            provider, model = config.get("llm_provider"), config.get("model_name")
+            # Placeholder for usage data. Will be updated by the generator if available.
+            usage_data = None
 
-        llm_messages = [{"role": "system", "content": system_prompt}] + history_for_llm + [{"role": "user", "content": final_formatted_content}]
-        provider, model = config.get("llm_provider"), config.get("model_name")
-        # Placeholder for usage data. Will be updated by the generator if available.
-        usage_data = None
-        
-        try:
             full_response = ""
             usage_data = None
             final_response_stages: List[str] = []
             
             async with message.channel.typing():
-                response_message = None
-
-                # Helper function to render the response stream to avoid code duplication
+                # The renderer owns the Discord messages: the provider stream is consumed at full
+                # speed while Discord only sees coalesced, rate-aware edits.
+                stream_renderer = DiscordStreamRenderer(message)
+
+                # Helper function to render the response stream to avoid code duplication
                 async def _render_llm_response(
                     response_generator: AsyncGenerator[Tuple[str, Any], None]
                 ) -> Tuple[str, Optional[Dict[str, int]], List[str]]:
-                    nonlocal response_message
                     _full_response = ""
                     _usage_data = None
                     _final_responses: List[str] = []
+                    # A retry overwrites what the previous attempt streamed.
+                    stream_renderer.end_stage()
                     async for response_type, data in response_generator:
-                        if response_type == "partial":
-                            content_chunks = split_message(data, 2000)
-                            current_chunk = content_chunks[0] if content_chunks else ""
-                            if response_message is None and current_chunk.strip():
-                                response_message = await message.reply(current_chunk, mention_author=False)
-                            elif response_message and current_chunk and current_chunk != response_message.content:
-                                try:
-                                    await response_message.edit(content=current_chunk)
-                                except discord.errors.HTTPException: pass
+                        if response_type == "delta":
+                            stream_renderer.feed(data)
                         elif response_type == "final":
                             _full_response = str(data or "")
                             _final_responses.append(_full_response)
+                            stream_renderer.end_stage()
+                        elif response_type == "tool_calls":
+                            logger.info(f"[instance={INSTANCE_ID}] Tool round for message {message.id}: {[call['name'] for call in data]}")
                         elif response_type == "usage":
                             _usage_data = data
                     return _full_response, _usage_data, _final_responses
@@ -780,13 +881,10 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
                     error_msg_template = config.get("blocked_prompt_response", "Sorry, an error occurred: {reason}")
                     final_error_msg = error_msg_template.format(reason=error_reason)
                     _reset_channel_automation_state(message.channel.id)
-                    if response_message:
-                        await response_message.edit(content=final_error_msg)
-                    else:
-                        await message.reply(final_error_msg, mention_author=False)
+                    await stream_renderer.finalize(final_error_msg)
                     return
 
-                cleaned_response = process_memory_tags(message, full_response, config)
+                cleaned_response = await process_memory_tags(message, full_response, config)
                 cleaned_response = strip_dsml_tool_blocks(cleaned_response)
                 cleaned_response = strip_thinking_sections(cleaned_response)
 
@@ -808,22 +906,12 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
                     "raw_llm_response": full_response,
                     "cleaned_llm_response": cleaned_response,
                     "usage": usage_data,
+                    "stage_timings": stage_timings,
                     "provider": str(config.get("llm_provider", "")),
                     "model": str(config.get("model_name", "")),
                 })
 
-                if response_message:
-                    final_chunks = split_message(cleaned_response, 2000)
-                    await response_message.edit(content=final_chunks[0] if final_chunks else "")
-                    for chunk in final_chunks[1:]:
-                        await message.channel.send(chunk)
-                else:
-                    final_chunks = split_message(cleaned_response, 2000)
-                    for i, chunk in enumerate(final_chunks):
-                        if i == 0 and chunk.strip():
-                            await message.reply(chunk, mention_author=False)
-                        elif i > 0:
-                            await message.channel.send(chunk)
+                await stream_renderer.finalize(cleaned_response)
 
                 _reset_channel_automation_state(message.channel.id)
 
@@ -849,12 +937,9 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
                 guild_name=message.guild.name if message.guild else None
             )
             
-            if role_config:
-                await usage_manager.update_post_request_usage(
-                    user_id=message.author.id,
-                    input_tokens=input_tokens,
-                    output_tokens=output_tokens
-                )
+            if quota_reservation:
+                reservation, quota_reservation = quota_reservation, None
+                await usage_manager.commit_quota(reservation, input_tokens=input_tokens, output_tokens=output_tokens)
                 
         except Exception as e:
             logger.error(f"Error processing message: {e}", exc_info=True)
@@ -863,6 +948,16 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
             error_msg = config.get("blocked_prompt_response", "Sorry, an error occurred: {reason}").format(reason="Internal Server Error")
             _reset_channel_automation_state(message.channel.id)
             await message.reply(error_msg, mention_author=False)
+        finally:
+            # Failed or rejected responses are not charged; hand the reserved quota back.
+            if quota_reservation:
+                try:
+                    await usage_manager.release_quota(quota_reservation)
+                except Exception as e:
+                    logger.warning(f"Failed to release quota reservation for user {message.author.id}: {e}")
+            if stream_renderer is not None:
+                await stream_renderer.aclose()
+            await message_lock.release()
     
     try:
         await bot.start(discord_token)
@@ -878,6 +973,7 @@ async def run_bot(memory_cutoffs: Dict[int, datetime]):
     finally:
         if not bot.is_closed():
             await bot.close()
+        await close_image_session()
         _release_bot_process_lock(bot_process_lock)
 
 
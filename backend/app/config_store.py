@@ -0,0 +1,157 @@
+# backend/app/config_store.py
+import copy
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Keep the runtime data directory aligned with main.py and bot.py.
+DATA_DIR = Path.cwd() / "data"
+CONFIG_FILE = DATA_DIR / "config.json"
+
+FileSignature = Tuple[int, int, int]
+
+
+class ConfigSnapshot(NamedTuple):
+    version: int
+    data: Dict[str, Any]
+
+
+def _apply_defaults(default: Dict[str, Any], config: Dict[str, Any]) -> None:
+    for key, value in default.items():
+        if isinstance(value, dict):
+            nested = config.setdefault(key, {})
+            if isinstance(nested, dict):
+                _apply_defaults(value, nested)
+        else:
+            config.setdefault(key, value)
+
+
+class ConfigStore:
+    """
+    Keeps a parsed copy of config.json in memory.
+
+    The file is only re-read when its (mtime, inode, size) signature changes or
+    when save() is called. Every reload swaps in a brand new dict and bumps
+    `version`, so a snapshot handed out to callers is never mutated afterwards.
+    Callers must treat the returned dict as read-only; use copy() for a private,
+    mutable deep copy.
+    """
+
+    def __init__(self, path: Path = CONFIG_FILE):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._defaults_factory: Optional[Callable[[], Dict[str, Any]]] = None
+        self._snapshot = ConfigSnapshot(0, {})
+        self._signature: Optional[FileSignature] = None
+        self._loaded = False
+
+    def set_defaults_factory(self, factory: Optional[Callable[[], Dict[str, Any]]]) -> None:
+        with self._lock:
+            self._defaults_factory = factory
+            self._loaded = False
+            self._signature = None
+
+    @property
+    def version(self) -> int:
+        return self.get_snapshot().version
+
+    def get(self) -> Dict[str, Any]:
+        return self.get_snapshot().data
+
+    def copy(self) -> Dict[str, Any]:
+        return copy.deepcopy(self.get())
+
+    def get_snapshot(self) -> ConfigSnapshot:
+        signature = self._stat()
+        snapshot = self._snapshot
+        if self._loaded and signature == self._signature:
+            return snapshot
+        with self._lock:
+            signature = self._stat()
+            if self._loaded and signature == self._signature:
+                return self._snapshot
+            self._reload_locked(signature)
+            return self._snapshot
+
+    def save(self, config_data: Dict[str, Any]) -> ConfigSnapshot:
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(config_data, f, indent=2, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            self._publish_locked(copy.deepcopy(config_data), self._stat())
+            return self._snapshot
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._loaded = False
+            self._signature = None
+
+    def _stat(self) -> Optional[FileSignature]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Could not stat config file {self.path}: {e}")
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _reload_locked(self, signature: Optional[FileSignature]) -> None:
+        if signature is None:
+            if self._defaults_factory is None:
+                # Nothing to load yet; keep whatever we had (bot-only usage).
+                self._loaded = True
+                self._signature = None
+                return
+            logger.warning(f"Config file not found at {self.path}. Creating a default one.")
+            default_config = self._defaults_factory()
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "w", encoding="utf-8") as f:
+                json.dump(default_config, f, indent=2, ensure_ascii=False)
+            self._publish_locked(default_config, self._stat())
+            return
+
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise json.JSONDecodeError("Top-level config must be an object", "", 0)
+        except json.JSONDecodeError as e:
+            logger.error(f"FATAL: config.json is corrupted and cannot be parsed. Error: {e}. Please fix it manually.")
+            self._publish_fallback_locked(signature)
+            return
+        except Exception as e:
+            logger.error(f"FATAL: An unexpected error occurred while loading config.json: {e}", exc_info=True)
+            self._publish_fallback_locked(signature)
+            return
+
+        self._publish_locked(data, signature)
+
+    def _publish_fallback_locked(self, signature: Optional[FileSignature]) -> None:
+        # Remember the broken file's signature so we do not re-parse it on every call.
+        if self._snapshot.data:
+            self._loaded = True
+            self._signature = signature
+            return
+        fallback = self._defaults_factory() if self._defaults_factory else {}
+        self._snapshot = ConfigSnapshot(self._snapshot.version + 1, fallback)
+        self._loaded = True
+        self._signature = signature
+
+    def _publish_locked(self, data: Dict[str, Any], signature: Optional[FileSignature]) -> None:
+        if self._defaults_factory is not None:
+            _apply_defaults(self._defaults_factory(), data)
+        self._snapshot = ConfigSnapshot(self._snapshot.version + 1, data)
+        self._loaded = True
+        self._signature = signature
+        logger.debug(f"Config snapshot v{self._snapshot.version} loaded from {self.path}")
+
+
+config_store = ConfigStore()
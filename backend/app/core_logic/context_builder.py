@@ -1,12 +1,14 @@
 # backend/app/core_logic/context_builder.py
 import json
 import re
+from datetime import datetime
 from typing import Dict, Any, List, Optional, Tuple
 import discord
 
 from .persona_manager import get_highest_configured_role, get_rich_identity, find_mentioned_users_by_keywords
 from ..utils import escape_content, matches_trigger_keywords
 from .knowledge_manager import knowledge_manager
+from .history_cache import ChannelHistoryCache
 
 # --- Constants for structured prompts ---
 # Using constants makes the code cleaner, easier to read, and simplifies future modifications.
@@ -24,7 +26,27 @@ DEFAULT_WORLDBOOK_MAX_ENTRIES = 20
 DEFAULT_WORLDBOOK_CHAR_LIMIT = 3000
 
 
-async def build_context_history(client: discord.Client, bot_config: Dict[str, Any], message: discord.Message, cutoff_timestamp: Optional[int]) -> Tuple[List[discord.Message], List[Dict[str, str]]]:
+async def _fetch_recent_history(
+    message: discord.Message,
+    limit: Optional[int],
+    cutoff_timestamp: Optional[datetime],
+    history_cache: Optional[ChannelHistoryCache],
+) -> List[discord.Message]:
+    """优先从内存中的频道历史缓存读取，缓存无法覆盖请求窗口时回退到 REST。"""
+    if history_cache is not None:
+        cached = await history_cache.get_history(message.channel, before=message, after=cutoff_timestamp, limit=limit)
+        if cached is not None:
+            return cached
+    return [msg async for msg in message.channel.history(limit=limit, before=message, after=cutoff_timestamp)]
+
+
+async def build_context_history(
+    client: discord.Client,
+    bot_config: Dict[str, Any],
+    message: discord.Message,
+    cutoff_timestamp: Optional[datetime],
+    history_cache: Optional[ChannelHistoryCache] = None,
+) -> Tuple[List[discord.Message], List[Dict[str, str]]]:
     """根据配置的上下文模式，构建历史消息列表和用于LLM的格式化历史。"""
     history_messages, history_for_llm = [], []
     context_mode = bot_config.get('context_mode', 'none')
@@ -45,13 +67,13 @@ async def build_context_history(client: discord.Client, bot_config: Dict[str, An
     if context_mode == 'channel':
         # 限制历史记录获取数量以避免性能问题
         history_limit = None if unlimited_message_count else min(msg_limit * 2, 100)
-        fetched_history = [msg async for msg in message.channel.history(limit=history_limit, before=message, after=cutoff_timestamp)]
+        fetched_history = await _fetch_recent_history(message, history_limit, cutoff_timestamp, history_cache)
     elif context_mode == 'memory':
         trigger_keywords = bot_config.get("trigger_keywords", [])
         trigger_match_mode = bot_config.get("trigger_match_mode", "contains")
         trigger_case_sensitive = bool(bot_config.get("trigger_case_sensitive", False))
         history_limit = None if unlimited_message_count else max(msg_limit * 3, 50)
-        potential_history = [msg async for msg in message.channel.history(limit=history_limit, before=message, after=cutoff_timestamp)]
+        potential_history = await _fetch_recent_history(message, history_limit, cutoff_timestamp, history_cache)
         relevant_messages, processed_ids = [], set()
         for hist_msg in potential_history:
             if not unlimited_message_count and len(relevant_messages) >= msg_limit:
@@ -146,17 +168,58 @@ async def build_context_history(client: discord.Client, bot_config: Dict[str, An
     history_for_llm = list(reversed(temp_history))
     return fetched_history, history_for_llm
 
-def format_user_message_for_llm(message: discord.Message, client: discord.Client, bot_config: Dict[str, Any], role_config: Optional[Dict[str, Any]], injected_data: Optional[str] = None) -> str:
-    """将用户的当前消息格式化为最终LLM输入块。"""
-    user_personas = bot_config.get("user_personas", {})
-    role_based_configs = bot_config.get("role_based_config", {})
-    
+def clean_message_text(message: discord.Message, client: discord.Client) -> str:
+    """移除对机器人的 mention 与自定义表情文本，得到用于匹配与展示的正文。"""
     # 保留用户 mention token（<@id>），仅移除对机器人的 mention token。
     # 这样模型在回复时可以复用正确的 Discord @ 语法。
     final_text_content = message.content.replace(f'<@{client.user.id}>', '').replace(f'<@!{client.user.id}>', '').strip()
 
     # [NEW] Remove custom emoji text, as they are now sent as images.
-    final_text_content = re.sub(r'<a?:\w+:\d+>', '', final_text_content).strip()
+    return re.sub(r'<a?:\w+:\d+>', '', final_text_content).strip()
+
+
+def collect_world_book_candidates(
+    message: discord.Message, client: discord.Client, bot_config: Dict[str, Any]
+) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+    """返回 (用户关联条目, 正文关键词命中条目)，两组互不重复；关键词命中条目可由调用方再排序。"""
+    user_personas = bot_config.get("user_personas", {})
+    final_text_content = clean_message_text(message, client)
+
+    # Gather all relevant user IDs: author, @mentions, and keyword mentions
+    relevant_user_ids = [str(message.author.id)]
+    for mentioned_user in message.mentions:
+        relevant_user_ids.append(str(mentioned_user.id))
+
+    keyword_mentioned_ids = find_mentioned_users_by_keywords(final_text_content, user_personas)
+    relevant_user_ids.extend(str(user_id) for user_id in keyword_mentioned_ids)
+
+    # User-linked entries and keyword hits in the text come from one in-memory lookup
+    user_wb_entries, text_wb_entries = knowledge_manager.find_world_book_entries(final_text_content, relevant_user_ids)
+    return user_wb_entries, text_wb_entries
+
+
+def collect_world_book_entries(message: discord.Message, client: discord.Client, bot_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """收集与当前消息相关的世界书条目：作者、@提及、人设关键词提及的用户条目，以及正文关键词命中的条目。"""
+    user_wb_entries, text_wb_entries = collect_world_book_candidates(message, client, bot_config)
+    return user_wb_entries + text_wb_entries
+
+
+def format_user_message_for_llm(
+    message: discord.Message,
+    client: discord.Client,
+    bot_config: Dict[str, Any],
+    role_config: Optional[Dict[str, Any]],
+    injected_data: Optional[str] = None,
+    world_book_entries: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    """
+    将用户的当前消息格式化为最终LLM输入块。
+    world_book_entries 可由调用方预先（并发）收集；为 None 时在此处同步查询。
+    """
+    user_personas = bot_config.get("user_personas", {})
+    role_based_configs = bot_config.get("role_based_config", {})
+
+    final_text_content = clean_message_text(message, client)
 
     request_block_parts = []
     
@@ -213,32 +276,9 @@ def format_user_message_for_llm(message: discord.Message, client: discord.Client
 
     # --- New: Inject knowledge base content ---
     # 1. Inject World Book entries (Append Strategy)
-    all_wb_entries = []
-    added_entry_ids = set()
-
-    # Gather all relevant user IDs: author, @mentions, and keyword mentions
-    relevant_user_ids = {str(message.author.id)}
-    for mentioned_user in message.mentions:
-        relevant_user_ids.add(str(mentioned_user.id))
-    
-    keyword_mentioned_ids = find_mentioned_users_by_keywords(final_text_content, user_personas)
-    relevant_user_ids.update(keyword_mentioned_ids)
-
-    # a. Load entries linked to users
-    for user_id in relevant_user_ids:
-        user_entries = knowledge_manager.get_world_book_entries_for_user(user_id)
-        for entry in user_entries:
-            if entry['id'] not in added_entry_ids:
-                all_wb_entries.append(entry)
-                added_entry_ids.add(entry['id'])
-
-    # b. Load entries triggered by keywords in the text
-    text_triggered_entries = knowledge_manager.find_world_book_entries_for_text(final_text_content)
-    for entry in text_triggered_entries:
-        # With knowledge_manager now returning full entries, this check is valid.
-        if entry['id'] not in added_entry_ids:
-            all_wb_entries.append(entry)
-            added_entry_ids.add(entry['id'])
+    if world_book_entries is None:
+        world_book_entries = collect_world_book_entries(message, client, bot_config)
+    all_wb_entries = world_book_entries
 
     if all_wb_entries:
         max_entries = int(bot_config.get("world_book_context_max_entries", DEFAULT_WORLDBOOK_MAX_ENTRIES))
@@ -0,0 +1,149 @@
+# backend/app/core_logic/history_cache.py
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, List, Optional
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CACHE_MAX_MESSAGES = 200
+HISTORY_CACHE_MAX_CHANNELS = 256
+
+
+class _ChannelBuffer:
+    __slots__ = ("messages", "warm", "truncated", "lock")
+
+    def __init__(self, max_messages: int):
+        # Oldest -> newest. Snowflake ids are chronological, so ordering by id == ordering by time.
+        self.messages: Deque[discord.Message] = deque(maxlen=max_messages)
+        self.warm = False
+        self.truncated = False
+        self.lock = asyncio.Lock()
+
+
+class ChannelHistoryCache:
+    """
+    Bounded per-channel ring buffer of recent messages, fed by gateway events.
+
+    A channel is backfilled over REST once (the first time its history is needed); after that
+    on_message / on_message_edit / on_raw_message_delete keep it current and context is built
+    from memory. get_history() returns None whenever the buffer cannot prove it holds the
+    requested window, so callers fall back to REST.
+    """
+
+    def __init__(self, max_messages: int = HISTORY_CACHE_MAX_MESSAGES, max_channels: int = HISTORY_CACHE_MAX_CHANNELS):
+        self.max_messages = max(1, max_messages)
+        self.max_channels = max(1, max_channels)
+        self._channels: "OrderedDict[int, _ChannelBuffer]" = OrderedDict()
+
+    def _buffer(self, channel_id: int, create: bool = True) -> Optional[_ChannelBuffer]:
+        buffer = self._channels.get(channel_id)
+        if buffer is not None:
+            self._channels.move_to_end(channel_id)
+            return buffer
+        if not create:
+            return None
+        buffer = _ChannelBuffer(self.max_messages)
+        self._channels[channel_id] = buffer
+        while len(self._channels) > self.max_channels:
+            self._channels.popitem(last=False)
+        return buffer
+
+    def _append(self, buffer: _ChannelBuffer, message: discord.Message) -> None:
+        messages = buffer.messages
+        if messages and messages[-1].id >= message.id:
+            # Out-of-order or duplicate delivery: rebuild in id order (buffers are small).
+            merged = {m.id: m for m in messages}
+            merged[message.id] = message
+            ordered = sorted(merged.values(), key=lambda m: m.id)
+            if len(ordered) > self.max_messages:
+                buffer.truncated = True
+            messages.clear()
+            messages.extend(ordered[-self.max_messages:])
+            return
+        if len(messages) == messages.maxlen:
+            buffer.truncated = True
+        messages.append(message)
+
+    def record(self, message: discord.Message) -> None:
+        self._append(self._buffer(message.channel.id), message)
+
+    def record_edit(self, message: discord.Message) -> None:
+        buffer = self._buffer(message.channel.id, create=False)
+        if buffer is None:
+            return
+        for index, cached in enumerate(buffer.messages):
+            if cached.id == message.id:
+                buffer.messages[index] = message
+                return
+
+    def record_delete(self, channel_id: int, message_ids: List[int]) -> None:
+        buffer = self._buffer(channel_id, create=False)
+        if buffer is None or not message_ids:
+            return
+        doomed = set(message_ids)
+        kept = [m for m in buffer.messages if m.id not in doomed]
+        if len(kept) != len(buffer.messages):
+            buffer.messages.clear()
+            buffer.messages.extend(kept)
+
+    def invalidate(self) -> None:
+        """Forget everything, e.g. after a gateway reconnect where events may have been missed."""
+        self._channels.clear()
+
+    async def _backfill(self, channel: discord.abc.Messageable, buffer: _ChannelBuffer) -> bool:
+        async with buffer.lock:
+            if buffer.warm:
+                return True
+            try:
+                fetched = [msg async for msg in channel.history(limit=self.max_messages)]
+            except (discord.HTTPException, discord.Forbidden) as e:
+                logger.warning(f"History cache backfill failed for channel {getattr(channel, 'id', '?')}: {e}")
+                return False
+            merged = {m.id: m for m in fetched}
+            for m in buffer.messages:
+                merged[m.id] = m  # gateway copies are at least as fresh as REST ones
+            ordered = sorted(merged.values(), key=lambda m: m.id)
+            buffer.truncated = len(fetched) >= self.max_messages or len(ordered) > self.max_messages
+            buffer.messages.clear()
+            buffer.messages.extend(ordered[-self.max_messages:])
+            buffer.warm = True
+            logger.info(f"History cache backfilled {len(fetched)} messages for channel {getattr(channel, 'id', '?')}.")
+            return True
+
+    async def get_history(
+        self,
+        channel: discord.abc.Messageable,
+        before: discord.Message,
+        after: Optional[datetime],
+        limit: Optional[int],
+    ) -> Optional[List[discord.Message]]:
+        """
+        Newest-first messages older than `before` (and newer than `after`, the MEMORY_CUTOFFS
+        timestamp), at most `limit` of them. Returns None when REST must be used instead.
+        """
+        if limit is None or limit > self.max_messages:
+            return None
+        buffer = self._buffer(channel.id)
+        if not buffer.warm and not await self._backfill(channel, buffer):
+            return None
+
+        window: List[discord.Message] = []
+        reached_cutoff = False
+        for cached in reversed(buffer.messages):
+            if cached.id >= before.id:
+                continue
+            if after is not None and cached.created_at <= after:
+                reached_cutoff = True
+                break
+            window.append(cached)
+            if len(window) >= limit:
+                return window
+
+        if reached_cutoff or not buffer.truncated:
+            return window
+        # The buffer ran out before `limit` and older messages may exist on the server.
+        return None
@@ -0,0 +1,237 @@
+# backend/app/core_logic/keyword_index.py
+import logging
+import re
+import threading
+from collections import deque
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+KEYWORD_MODES = ("contains", "starts_with", "exact")
+
+
+class KeywordIndex:
+    """
+    Multi-keyword matcher: an Aho-Corasick automaton over literal keywords plus one
+    precompiled regex union for pattern keywords.
+
+    Every keyword carries a payload (e.g. a persona user id or a world book entry id), so a
+    single scan over the text returns all hits regardless of how many keywords are indexed.
+    Keywords are lowercased unless the index is case-sensitive, matching the behaviour of the
+    linear `kw in text.lower()` scans this replaces.
+    """
+
+    def __init__(self, case_sensitive: bool = False):
+        self.case_sensitive = case_sensitive
+        self._lock = threading.Lock()
+        self._keyword_ids: Dict[str, int] = {}
+        self._keywords: List[str] = []
+        self._keyword_payloads: List[List[Tuple[Any, str]]] = []
+        self._exact: Dict[str, List[Any]] = {}
+        self._patterns: List[Tuple["re.Pattern[str]", Any]] = []
+        self._union: Optional["re.Pattern[str]"] = None
+        self._union_covers_all = False
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Tuple[int, ...]] = [()]
+        self._built = True
+
+    def __len__(self) -> int:
+        return len(self._keywords) + len(self._exact) + len(self._patterns)
+
+    def _norm(self, text: str) -> str:
+        return text if self.case_sensitive else text.lower()
+
+    def add(self, keyword: str, payload: Any, mode: str = "contains") -> bool:
+        """Index a literal keyword. Empty keywords are ignored."""
+        kw = self._norm(str(keyword or ""))
+        if not kw:
+            return False
+        mode = mode if mode in KEYWORD_MODES else "contains"
+        with self._lock:
+            if mode == "exact":
+                self._exact.setdefault(kw, []).append(payload)
+                return True
+            keyword_id = self._keyword_ids.get(kw)
+            if keyword_id is None:
+                keyword_id = len(self._keywords)
+                self._keyword_ids[kw] = keyword_id
+                self._keywords.append(kw)
+                self._keyword_payloads.append([])
+                self._insert(kw, keyword_id)
+            self._keyword_payloads[keyword_id].append((payload, mode))
+            self._built = False
+        return True
+
+    def add_pattern(self, pattern: str, payload: Any) -> bool:
+        """Index a regex keyword. Invalid patterns are skipped and reported via the return value."""
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        try:
+            compiled = re.compile(pattern, flags)
+        except re.error:
+            return False
+        with self._lock:
+            self._patterns.append((compiled, payload))
+            self._built = False
+        return True
+
+    def _insert(self, keyword: str, keyword_id: int) -> None:
+        node = 0
+        for ch in keyword:
+            nxt = self._goto[node].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(())
+            node = nxt
+
+    def build(self) -> None:
+        with self._lock:
+            if self._built:
+                return
+            self._build_automaton()
+            self._build_union()
+            self._built = True
+
+    def _build_automaton(self) -> None:
+        # Outputs are rebuilt from scratch so repeated builds do not accumulate suffix outputs.
+        own_out: List[Tuple[int, ...]] = [()] * len(self._goto)
+        for keyword_id, keyword in enumerate(self._keywords):
+            node = 0
+            for ch in keyword:
+                node = self._goto[node][ch]
+            own_out[node] = own_out[node] + (keyword_id,)
+        self._out = list(own_out)
+        self._fail = [0] * len(self._goto)
+
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and ch not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(ch, 0)
+                self._fail[child] = target if target != child else 0
+                self._out[child] = own_out[child] + self._out[self._fail[child]]
+
+    def _build_union(self) -> None:
+        # Patterns with capture groups keep their own numbering, so only group-free patterns
+        # are folded into the union; the rest are searched individually.
+        simple = [pattern for pattern, _ in self._patterns if pattern.groups == 0]
+        self._union = None
+        self._union_covers_all = bool(self._patterns) and len(simple) == len(self._patterns)
+        if not simple:
+            return
+        flags = 0 if self.case_sensitive else re.IGNORECASE
+        try:
+            self._union = re.compile("|".join(f"(?:{pattern.pattern})" for pattern in simple), flags)
+        except re.error:
+            self._union = None
+            self._union_covers_all = False
+
+    def _iter_literal_hits(self, normalized: str) -> Iterator[Tuple[Any, str]]:
+        exact = self._exact.get(normalized)
+        if exact:
+            for payload in exact:
+                yield payload, normalized
+
+        goto, fail, out = self._goto, self._fail, self._out
+        if not goto[0]:
+            return
+        node = 0
+        for index, ch in enumerate(normalized):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            if not out[node]:
+                continue
+            for keyword_id in out[node]:
+                keyword = self._keywords[keyword_id]
+                start = index - len(keyword) + 1
+                for payload, mode in self._keyword_payloads[keyword_id]:
+                    if mode == "contains" or (mode == "starts_with" and start == 0):
+                        yield payload, keyword
+
+    def _iter_pattern_hits(self, text: str) -> Iterator[Tuple[Any, str]]:
+        if not self._patterns:
+            return
+        if self._union_covers_all and self._union is not None and self._union.search(text) is None:
+            return
+        for pattern, payload in self._patterns:
+            if pattern.search(text):
+                yield payload, pattern.pattern
+
+    def iter_hits(self, text: str) -> Iterator[Tuple[Any, str]]:
+        """Yield (payload, keyword) for every hit; a payload may be yielded more than once."""
+        if not text:
+            return
+        if not self._built:
+            self.build()
+        yield from self._iter_literal_hits(self._norm(text))
+        yield from self._iter_pattern_hits(text)
+
+    def find(self, text: str) -> List[Any]:
+        """Return the distinct payloads that match `text`, in first-hit order."""
+        seen = set()
+        matched: List[Any] = []
+        for payload, _ in self.iter_hits(text):
+            if payload in seen:
+                continue
+            seen.add(payload)
+            matched.append(payload)
+        return matched
+
+    def matches_any(self, text: str) -> bool:
+        for _ in self.iter_hits(text):
+            return True
+        return False
+
+
+def build_trigger_index(trigger_keywords: List[str], match_mode: str = "contains", case_sensitive: bool = False) -> KeywordIndex:
+    """Compile the bot trigger keyword list (modes: contains, starts_with, exact, regex)."""
+    mode = (match_mode or "contains").strip().lower()
+    index = KeywordIndex(case_sensitive=case_sensitive)
+    for keyword in trigger_keywords or []:
+        if not keyword:
+            continue
+        kw = str(keyword).strip()
+        if not kw:
+            continue
+        if mode == "regex":
+            if not index.add_pattern(kw, kw):
+                logger.warning("Invalid trigger keyword regex skipped: %s", kw)
+        else:
+            index.add(kw, kw, mode=mode if mode in KEYWORD_MODES else "contains")
+    index.build()
+    return index
+
+
+def build_persona_index(personas: Dict[str, Any]) -> KeywordIndex:
+    """Persona trigger keywords and nicknames -> persona user id."""
+    index = KeywordIndex(case_sensitive=False)
+    for persona_cfg in (personas or {}).values():
+        if not isinstance(persona_cfg, dict):
+            continue
+        user_id = persona_cfg.get("id")
+        if not user_id:
+            continue
+        for keyword in persona_cfg.get("trigger_keywords", []) or []:
+            if isinstance(keyword, str):
+                index.add(keyword, user_id)
+        nickname = persona_cfg.get("nickname")
+        if isinstance(nickname, str):
+            index.add(nickname, user_id)
+    index.build()
+    return index
+
+
+def split_world_book_keywords(raw_keywords: Optional[str]) -> List[str]:
+    return [k.strip().lower() for k in str(raw_keywords or "").split(",") if k.strip()]
+
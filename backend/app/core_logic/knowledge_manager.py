@@ -1,14 +1,54 @@
+import asyncio
 import json
-import math
+import logging
 import os
 import re
 import sqlite3
+import threading
+import time
 from datetime import datetime, timezone
-from typing import Any, Dict, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Set, Tuple
+
+import numpy as np
+
+from ..embedding_service import build_embedding_runtime_config, embed_texts, embedding_model_key, has_embedding_config
+from .sqlite_pool import SQLitePool
+from .world_book_index import WorldBookIndex
+
+logger = logging.getLogger(__name__)
+
+RECALL_FLUSH_INTERVAL_SECONDS = 5.0
+RECALL_FLUSH_MAX_PENDING = 256
+
+# Share of the final recall score taken by cosine similarity when vector recall is enabled.
+VECTOR_RECALL_WEIGHT = 0.4
+EMBED_PENDING_BATCH = 64
+# After a failed embedding call, memory embedding and query embedding pause with exponential backoff.
+EMBED_RETRY_INITIAL_SECONDS = 5.0
+EMBED_RETRY_MAX_SECONDS = 300.0
+# A query embedding slower than this is abandoned and recall ranks lexically.
+QUERY_EMBED_TIMEOUT_SECONDS = 1.5
+
+RECALL_SOURCES = ("conversation", "tool", "manual")
+
+
+class MemoryArrays(NamedTuple):
+    """Column-wise view of the memory table used by recall scoring, rebuilt per memory revision."""
+
+    revision: int
+    ids: np.ndarray  # int64, ascending
+    positions: Dict[int, int]
+    ts_epoch: np.ndarray  # float64
+    source_boost: np.ndarray  # float64
+    recall_counts: np.ndarray  # float64, kept current by flush_recall_stats()
+    has_text: np.ndarray  # bool
+    postings: Dict[str, np.ndarray]  # token -> row positions
 
 
 class KnowledgeManager:
     MEMORY_TAG_RE = re.compile(r"^\[memory\s+.*?\]\s*", re.I | re.S)
+    # Only used to migrate legacy rows whose attributes exist solely inside the tag.
+    MEMORY_TAG_ATTR_RE = re.compile(r'(\w+)="(.*?)"(?=\s|\]|$)')
     TOKEN_RE = re.compile(r"[0-9A-Za-z_\u4e00-\u9fff]+")
 
     POLICY_DEFAULTS: Dict[str, Any] = {
@@ -22,21 +62,49 @@ class KnowledgeManager:
         "auto_memory_recall_top_k": 12,
         "auto_memory_recall_char_limit": 2200,
         "auto_memory_recall_max_age_days": 365,
+        "memory_vector_recall_enabled": False,
     }
 
     def __init__(self, db_path: Optional[str] = None):
+        self._world_book_index = WorldBookIndex()
+        self._world_book_load_lock = threading.Lock()
+        # memory_id -> (pending recall count, last recalled at, last recall score)
+        self._pending_recalls: Dict[int, Tuple[int, str, float]] = {}
+        self._recall_lock = threading.Lock()
+        self._recall_flush_wakeup = threading.Event()
+        self._recall_flusher: Optional[threading.Thread] = None
+        self._memory_lock = threading.Lock()
+        self._memory_revision = 0
+        # Bumped by memory changes and by newly written vectors; only the vector cache depends on it.
+        self._vector_revision = 0
+        # (model key, vector revision, memory ids, unit-norm float32 matrix)
+        self._memory_vector_cache: Optional[Tuple[str, int, np.ndarray, np.ndarray]] = None
+        # model key -> memory revision at which no memory was left without a vector
+        self._embedded_revision: Dict[str, int] = {}
+        self._memory_arrays: Optional[MemoryArrays] = None
+        # Memories are embedded by a background thread, never on the recall path.
+        self._embed_lock = threading.Lock()
+        self._embed_config: Optional[Dict[str, Any]] = None
+        self._embed_wakeup = threading.Event()
+        self._embedder: Optional[threading.Thread] = None
+        self._embed_failures = 0
+        self._embed_retry_at = 0.0
         if db_path is None:
             db_dir = "data"
             os.makedirs(db_dir, exist_ok=True)
             self.db_path = os.path.join(db_dir, "knowledge_base.sqlite")
         else:
             self.db_path = db_path
+        self._pool = SQLitePool(self.db_path)
         self.init_db()
 
-    def get_conn(self):
-        conn = sqlite3.connect(self.db_path, timeout=15)
-        conn.row_factory = sqlite3.Row
-        return conn
+    def close(self) -> None:
+        self.flush_recall_stats()
+        self._pool.close()
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """Run a blocking knowledge base call (or a helper built on one) on the pool's executor."""
+        return await self._pool.run(func, *args, **kwargs)
 
     def init_db(self):
         scripts_dir = "/app/scripts"
@@ -47,16 +115,13 @@ class KnowledgeManager:
         if not os.path.exists(init_script_path):
             print(f"CRITICAL: Database initialization script not found at {init_script_path}")
             return
-        with self.get_conn() as conn:
+        with open(init_script_path, "r", encoding="utf-8") as f:
+            init_script = f.read()
+        with self._pool.write() as conn:
             cursor = conn.cursor()
-            try:
-                with open(init_script_path, "r", encoding="utf-8") as f:
-                    cursor.executescript(f.read())
-                self._ensure_runtime_schema(cursor)
-                conn.commit()
-            except sqlite3.Error:
-                conn.rollback()
-                raise
+            cursor.executescript(init_script)
+            self._ensure_runtime_schema(cursor)
+        self._load_world_book_index()
 
     def _ensure_runtime_schema(self, cursor: sqlite3.Cursor) -> None:
         cursor.execute("PRAGMA table_info(memory_candidates)")
@@ -67,6 +132,69 @@ class KnowledgeManager:
             if "last_user_name" not in cols:
                 cursor.execute("ALTER TABLE memory_candidates ADD COLUMN last_user_name TEXT")
 
+        cursor.execute("PRAGMA table_info(memory)")
+        cols = {row[1] for row in cursor.fetchall()}
+        if cols:
+            if "normalized_content" not in cols:
+                cursor.execute("ALTER TABLE memory ADD COLUMN normalized_content TEXT")
+            for column, ddl in (("plain_content", "TEXT"), ("tokens", "TEXT"), ("ts_epoch", "REAL")):
+                if column not in cols:
+                    cursor.execute(f"ALTER TABLE memory ADD COLUMN {column} {ddl}")
+            self._backfill_memory_normalized_content(cursor)
+            self._backfill_memory_columns(cursor)
+            # '' marks rows that are empty or duplicates of an older memory; they stay out of the index.
+            cursor.execute(
+                "CREATE UNIQUE INDEX IF NOT EXISTS idx_memory_normalized_content ON memory(normalized_content) WHERE normalized_content <> ''"
+            )
+
+    def _memory_tag(self, timestamp: str, source: str, user_name: Optional[str], user_id: Optional[str]) -> str:
+        safe_user = (user_name or "Unknown").replace('"', '""')
+        return f'[memory timestamp="{timestamp}" source="{source}" user_name="{safe_user}" user_id="{user_id}"]'
+
+    def _memory_recall_features(self, plain: str, timestamp: Optional[str]) -> Tuple[str, float]:
+        """(space-joined recall tokens, epoch seconds) stored alongside each memory's plain text."""
+        return " ".join(self._tokens(plain, 24)), self._dt(timestamp).timestamp()
+
+    def _backfill_memory_columns(self, cursor: sqlite3.Cursor) -> None:
+        """Split legacy rows into plain text + attribute columns so reads never parse the tag."""
+        cursor.execute(
+            "SELECT id, content, timestamp, user_id, user_name, source FROM memory WHERE plain_content IS NULL OR ts_epoch IS NULL"
+        )
+        updates = []
+        for row in cursor.fetchall():
+            content = str(row[1] or "")
+            tag = self.MEMORY_TAG_RE.match(content)
+            attrs = dict(self.MEMORY_TAG_ATTR_RE.findall(tag.group(0))) if tag else {}
+            timestamp = row[2] or attrs.get("timestamp") or datetime.now(timezone.utc).isoformat()
+            user_id = row[3] or attrs.get("user_id")
+            user_name = row[4] or (attrs["user_name"].replace('""', '"') if "user_name" in attrs else None)
+            source = row[5] or attrs.get("source")
+            plain = content[tag.end():].strip() if tag else content.strip()
+            tokens, ts_epoch = self._memory_recall_features(plain, timestamp)
+            updates.append((timestamp, user_id, user_name, source, plain, tokens, ts_epoch, row[0]))
+        if updates:
+            cursor.executemany(
+                "UPDATE memory SET timestamp=?, user_id=?, user_name=?, source=?, plain_content=?, tokens=?, ts_epoch=? WHERE id=?",
+                updates,
+            )
+
+    def _backfill_memory_normalized_content(self, cursor: sqlite3.Cursor) -> None:
+        cursor.execute("SELECT id, content FROM memory WHERE normalized_content IS NULL ORDER BY id")
+        pending = cursor.fetchall()
+        if not pending:
+            return
+        cursor.execute("SELECT normalized_content FROM memory WHERE normalized_content IS NOT NULL AND normalized_content <> ''")
+        taken = {row[0] for row in cursor.fetchall()}
+        updates: List[Tuple[str, int]] = []
+        for row in pending:
+            normalized = self._normalize(row[1])
+            if not normalized or normalized in taken:
+                normalized = ""
+            else:
+                taken.add(normalized)
+            updates.append((normalized, row[0]))
+        cursor.executemany("UPDATE memory SET normalized_content=? WHERE id=?", updates)
+
     def _safe_int(self, value: Any, default: int, lo: int, hi: int) -> int:
         try:
             return max(lo, min(hi, int(value)))
@@ -104,6 +232,7 @@ class KnowledgeManager:
             "auto_memory_recall_top_k": self._safe_int(cfg.get("auto_memory_recall_top_k"), d["auto_memory_recall_top_k"], 1, 50),
             "auto_memory_recall_char_limit": self._safe_int(cfg.get("auto_memory_recall_char_limit"), d["auto_memory_recall_char_limit"], 300, 20000),
             "auto_memory_recall_max_age_days": self._safe_int(cfg.get("auto_memory_recall_max_age_days"), d["auto_memory_recall_max_age_days"], 1, 3650),
+            "memory_vector_recall_enabled": self._safe_bool(cfg.get("memory_vector_recall_enabled"), d["memory_vector_recall_enabled"]),
         }
 
     def _strip_tag(self, content: str) -> str:
@@ -171,7 +300,7 @@ class KnowledgeManager:
         return max(0.0, min(1.0, 0.25 * s_len + 0.35 * s_seen + 0.25 * s_users + 0.15 * s_clean))
 
     def _find_existing_memory(self, normalized: str) -> Optional[int]:
-        with self.get_conn() as conn:
+        with self._pool.read() as conn:
             c = conn.cursor()
             c.execute(
                 "SELECT promoted_memory_id FROM memory_candidates WHERE normalized_content=? AND promoted=1 AND promoted_memory_id IS NOT NULL LIMIT 1",
@@ -180,24 +309,28 @@ class KnowledgeManager:
             row = c.fetchone()
             if row and row["promoted_memory_id"]:
                 return int(row["promoted_memory_id"])
-            c.execute("SELECT id, content FROM memory")
-            for r in c.fetchall():
-                if self._normalize(r["content"]) == normalized:
-                    return int(r["id"])
+            # The "<> ''" term lets SQLite use the partial unique index.
+            c.execute("SELECT id FROM memory WHERE normalized_content=? AND normalized_content <> '' LIMIT 1", (normalized,))
+            row = c.fetchone()
+            if row:
+                return int(row["id"])
         return None
 
     # Memory CRUD
     def add_memory(self, content: str, timestamp: str, user_id: str, user_name: str, source: str) -> Optional[int]:
         try:
-            safe_user = (user_name or "Unknown").replace('"', '""')
-            tag = f'[memory timestamp="{timestamp}" source="{source}" user_name="{safe_user}" user_id="{user_id}"]'
-            tagged_content = f"{tag} {content}".strip()
-            normalized = self._normalize(content)
-            with self.get_conn() as conn:
+            plain = self._strip_tag(content)
+            tagged_content = f"{self._memory_tag(timestamp, source, user_name, user_id)} {plain}".strip()
+            normalized = self._normalize(plain)
+            tokens, ts_epoch = self._memory_recall_features(plain, timestamp)
+            with self._pool.write() as conn:
                 c = conn.cursor()
                 c.execute(
-                    "INSERT INTO memory (content, timestamp, user_id, user_name, source) VALUES (?, ?, ?, ?, ?)",
-                    (tagged_content, timestamp, user_id, user_name, source),
+                    """
+                    INSERT INTO memory (content, timestamp, user_id, user_name, source, normalized_content, plain_content, tokens, ts_epoch)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    """,
+                    (tagged_content, timestamp, user_id, user_name, source, normalized, plain, tokens, ts_epoch),
                 )
                 memory_id = c.lastrowid
                 c.execute(
@@ -225,7 +358,7 @@ class KnowledgeManager:
                         """,
                         (
                             normalized,
-                            self._strip_tag(content),
+                            plain,
                             timestamp,
                             timestamp,
                             str(user_id or "unknown_user"),
@@ -237,8 +370,8 @@ class KnowledgeManager:
                             "direct_add_promoted",
                         ),
                     )
-                conn.commit()
-                return memory_id
+            self._bump_memory_revision()
+            return memory_id
         except sqlite3.IntegrityError:
             return None
 
@@ -273,7 +406,7 @@ class KnowledgeManager:
         uid = str(user_id or "unknown_user")
         cid = str(channel_id) if channel_id is not None else ""
 
-        with self.get_conn() as conn:
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute("SELECT * FROM memory_candidates WHERE normalized_content=? LIMIT 1", (normalized,))
             row = c.fetchone()
@@ -344,7 +477,6 @@ class KnowledgeManager:
                     ),
                 )
                 candidate_id = c.lastrowid
-            conn.commit()
 
         score = self._quality_score(cleaned, seen_count, distinct_users, p)
         should_promote = force_promote or (source == "ai_tag" and p["auto_memory_direct_promote_ai_tag"]) or (
@@ -356,13 +488,14 @@ class KnowledgeManager:
         if should_promote:
             memory_id = self.add_memory(cleaned, now_ts, uid, user_name, source)
             if memory_id:
-                with self.get_conn() as conn:
+                with self._pool.write() as conn:
                     c = conn.cursor()
                     c.execute(
                         "UPDATE memory_candidates SET promoted=1, promoted_memory_id=?, promoted_at=?, last_reason=? WHERE id=?",
                         (memory_id, datetime.now(timezone.utc).isoformat(), "auto_promoted", candidate_id),
                     )
-                    conn.commit()
+                if p["memory_vector_recall_enabled"] and config:
+                    self.schedule_embedding(config)
                 return {"status": "promoted", "candidate_id": candidate_id, "memory_id": memory_id, "score": score}
             existing_id = self._find_existing_memory(normalized)
             if existing_id:
@@ -372,70 +505,176 @@ class KnowledgeManager:
         return {"status": "staged", "candidate_id": candidate_id, "score": score, "seen_count": seen_count, "distinct_user_count": distinct_users}
 
     def get_all_memories(self) -> List[Dict[str, Any]]:
-        with self.get_conn() as conn:
+        with self._pool.read() as conn:
             c = conn.cursor()
             c.execute("SELECT * FROM memory ORDER BY timestamp DESC")
             return [dict(r) for r in c.fetchall()]
 
-    def get_relevant_memories(self, query_text: str, top_k: int = 12, char_limit: int = 2200, max_age_days: int = 365) -> List[Dict[str, Any]]:
+    def get_relevant_memories(
+        self,
+        query_text: str,
+        top_k: int = 12,
+        char_limit: int = 2200,
+        max_age_days: int = 365,
+        config: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+    ) -> List[Dict[str, Any]]:
+        scored = self.rank_memory_candidates(
+            query_text, top_k=top_k, max_age_days=max_age_days, config=config, query_vector=query_vector
+        )
+        return self.select_memories(scored, top_k=top_k, char_limit=char_limit)
+
+    def rank_memory_candidates(
+        self,
+        query_text: str,
+        top_k: int = 12,
+        max_age_days: int = 365,
+        config: Optional[Dict[str, Any]] = None,
+        query_vector: Optional[np.ndarray] = None,
+    ) -> List[Tuple[float, Dict[str, Any]]]:
+        """
+        Candidate memories scored best-first; `top_k` sizes the candidate pool (6x).
+
+        Every memory inside the age window is scored at once over the cached column arrays
+        (tokens, epoch timestamps and plain text are precomputed when a memory is written), so
+        only the FTS hits and the final `top_k * 6` rows are read from SQLite per query.
+        `query_vector` comes from embed_query_async(); without it recall is lexical only.
+        """
         top_k = max(1, min(50, int(top_k)))
-        char_limit = max(300, min(20000, int(char_limit)))
         max_age_days = max(1, min(3650, int(max_age_days)))
+        pool_size = top_k * 6
         q_tokens = set(self._tokens(query_text, 20))
-        rows: List[Dict[str, Any]] = []
-        seen: Set[int] = set()
-        with self.get_conn() as conn:
+        semantic: Dict[int, float] = {}
+        if config and self._resolve_policy(config)["memory_vector_recall_enabled"]:
+            semantic = self._semantic_scores(query_vector, config, pool_size)
+        arrays = self._get_memory_arrays()
+        if arrays.ids.shape[0] == 0:
+            return []
+
+        age = (time.time() - arrays.ts_epoch) / 86400.0
+        eligible = np.flatnonzero(arrays.has_text & (age <= max_age_days))
+        if eligible.shape[0] == 0:
+            return []
+        recency = np.exp(-np.maximum(age, 0.0) / 45.0)
+        novelty = 1.0 / (1.0 + np.log1p(arrays.recall_counts))
+        if q_tokens:
+            overlap = np.zeros(arrays.ids.shape[0], dtype=np.float64)
+            for token in q_tokens:
+                hits = arrays.postings.get(token)
+                if hits is not None:
+                    overlap[hits] += 1.0
+            overlap /= len(q_tokens)
+            # Rows outside the FTS hits keep an fts_rank of 0, as they always have.
+            fts = np.ones(arrays.ids.shape[0], dtype=np.float64)
+            for memory_id, rank in self._fts_memory_ranks(q_tokens, pool_size):
+                pos = arrays.positions.get(memory_id)
+                if pos is not None:
+                    fts[pos] = 1.0 / (1.0 + abs(rank))
+            scores = 0.50 * overlap + 0.20 * recency + 0.15 * novelty + 0.10 * fts + arrays.source_boost
+        else:
+            scores = 0.65 * recency + 0.25 * novelty + arrays.source_boost
+        if semantic:
+            similarity = np.zeros(arrays.ids.shape[0], dtype=np.float64)
+            for memory_id, value in semantic.items():
+                pos = arrays.positions.get(memory_id)
+                if pos is not None:
+                    similarity[pos] = value
+            scores = (1.0 - VECTOR_RECALL_WEIGHT) * scores + VECTOR_RECALL_WEIGHT * similarity
+
+        candidate_scores = scores[eligible]
+        if eligible.shape[0] > pool_size:
+            keep = np.argpartition(-candidate_scores, pool_size - 1)[:pool_size]
+            eligible, candidate_scores = eligible[keep], candidate_scores[keep]
+        order = np.argsort(-candidate_scores, kind="stable")
+        ranked_ids = [int(arrays.ids[i]) for i in eligible[order]]
+        rows = self._fetch_memory_rows(ranked_ids)
+        scored: List[Tuple[float, Dict[str, Any]]] = []
+        for memory_id, score in zip(ranked_ids, candidate_scores[order]):
+            row = rows.get(memory_id)
+            if row is None:
+                continue
+            row["_plain"] = row.get("plain_content") or ""
+            scored.append((float(score), row))
+        return scored
+
+    def _fts_memory_ranks(self, q_tokens: Set[str], limit: int) -> List[Tuple[int, float]]:
+        match = " OR ".join(f'"{t}"' for t in q_tokens)
+        with self._pool.read() as conn:
+            c = conn.cursor()
+            try:
+                c.execute(
+                    "SELECT rowid, bm25(memory_fts) AS fts_rank FROM memory_fts WHERE memory_fts MATCH ? ORDER BY fts_rank ASC LIMIT ?",
+                    (match, limit),
+                )
+            except sqlite3.Error:
+                return []
+            return [(int(r[0]), float(r[1] or 0.0)) for r in c.fetchall()]
+
+    def _fetch_memory_rows(self, memory_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        if not memory_ids:
+            return {}
+        placeholders = ",".join("?" * len(memory_ids))
+        with self._pool.read() as conn:
             c = conn.cursor()
-            if q_tokens:
-                match = " OR ".join(f'"{t}"' for t in q_tokens)
-                try:
-                    c.execute(
-                        """
-                        SELECT m.*, COALESCE(ms.recall_count,0) AS recall_count, bm25(memory_fts) AS fts_rank
-                        FROM memory m JOIN memory_fts ON memory_fts.rowid=m.id
-                        LEFT JOIN memory_stats ms ON ms.memory_id=m.id
-                        WHERE memory_fts MATCH ? ORDER BY fts_rank ASC LIMIT ?
-                        """,
-                        (match, top_k * 6),
-                    )
-                    for r in c.fetchall():
-                        d = dict(r)
-                        rows.append(d)
-                        seen.add(int(d["id"]))
-                except sqlite3.Error:
-                    pass
             c.execute(
-                """
-                SELECT m.*, COALESCE(ms.recall_count,0) AS recall_count, 0 AS fts_rank
+                f"""
+                SELECT m.*, COALESCE(ms.recall_count,0) AS recall_count
                 FROM memory m LEFT JOIN memory_stats ms ON ms.memory_id=m.id
-                ORDER BY m.timestamp DESC LIMIT ?
+                WHERE m.id IN ({placeholders})
                 """,
-                (max(100, top_k * 6),),
+                memory_ids,
             )
-            for r in c.fetchall():
-                d = dict(r)
-                mid = int(d["id"])
-                if mid not in seen:
-                    rows.append(d)
-        now = datetime.now(timezone.utc)
-        scored: List[Tuple[float, Dict[str, Any]]] = []
-        for row in rows:
-            age = (now - self._dt(row.get("timestamp"))).total_seconds() / 86400.0
-            if age > max_age_days:
-                continue
-            plain = self._strip_tag(str(row.get("content", "")))
-            if not plain:
-                continue
-            mt = set(self._tokens(plain, 24))
-            overlap = (len(q_tokens & mt) / max(1, len(q_tokens))) if q_tokens else 0.0
-            recency = math.exp(-max(0.0, age) / 45.0)
-            novelty = 1.0 / (1.0 + math.log1p(int(row.get("recall_count", 0))))
-            fts = 1.0 / (1.0 + abs(float(row.get("fts_rank") or 0.0)))
-            source_boost = 0.06 if str(row.get("source") or "") in {"conversation", "tool", "manual"} else 0.02
-            score = (0.50 * overlap + 0.20 * recency + 0.15 * novelty + 0.10 * fts + source_boost) if q_tokens else (0.65 * recency + 0.25 * novelty + source_boost)
-            row["_plain"] = plain
-            scored.append((score, row))
-        scored.sort(key=lambda x: x[0], reverse=True)
+            return {int(r["id"]): dict(r) for r in c.fetchall()}
+
+    def _get_memory_arrays(self) -> MemoryArrays:
+        """Scoring columns for every memory, reloaded only when memories change."""
+        with self._memory_lock:
+            cached = self._memory_arrays
+            revision = self._memory_revision
+            if cached is not None and cached.revision == revision:
+                return cached
+        with self._pool.read() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT m.id, m.source, m.tokens, m.ts_epoch,
+                       COALESCE(m.plain_content, '') <> '' AS has_text,
+                       COALESCE(ms.recall_count, 0) AS recall_count
+                FROM memory m LEFT JOIN memory_stats ms ON ms.memory_id=m.id
+                ORDER BY m.id
+                """
+            )
+            rows = c.fetchall()
+        count = len(rows)
+        now = time.time()
+        ids = np.fromiter((int(r["id"]) for r in rows), dtype=np.int64, count=count)
+        ts_epoch = np.fromiter((now if r["ts_epoch"] is None else float(r["ts_epoch"]) for r in rows), dtype=np.float64, count=count)
+        source_boost = np.fromiter((0.06 if str(r["source"] or "") in RECALL_SOURCES else 0.02 for r in rows), dtype=np.float64, count=count)
+        recall_counts = np.fromiter((int(r["recall_count"]) for r in rows), dtype=np.float64, count=count)
+        has_text = np.fromiter((bool(r["has_text"]) for r in rows), dtype=bool, count=count)
+        postings_lists: Dict[str, List[int]] = {}
+        for pos, r in enumerate(rows):
+            for token in (r["tokens"] or "").split():
+                postings_lists.setdefault(token, []).append(pos)
+        arrays = MemoryArrays(
+            revision=revision,
+            ids=ids,
+            positions={int(memory_id): pos for pos, memory_id in enumerate(ids)},
+            ts_epoch=ts_epoch,
+            source_boost=source_boost,
+            recall_counts=recall_counts,
+            has_text=has_text,
+            postings={token: np.asarray(positions, dtype=np.int64) for token, positions in postings_lists.items()},
+        )
+        with self._memory_lock:
+            if self._memory_revision == revision:
+                self._memory_arrays = arrays
+        return arrays
+
+    def select_memories(self, scored: List[Tuple[float, Dict[str, Any]]], top_k: int = 12, char_limit: int = 2200) -> List[Dict[str, Any]]:
+        """Take scored candidates in order within the top_k / character budget and record the recall."""
+        top_k = max(1, min(50, int(top_k)))
+        char_limit = max(300, min(20000, int(char_limit)))
         chosen: List[Dict[str, Any]] = []
         payload: List[Tuple[int, float]] = []
         chars = 0
@@ -452,29 +691,214 @@ class KnowledgeManager:
         self._record_recall(payload)
         return chosen
 
+    def _bump_memory_revision(self) -> None:
+        with self._memory_lock:
+            self._memory_revision += 1
+            self._vector_revision += 1
+
+    def _bump_vector_revision(self) -> None:
+        with self._memory_lock:
+            self._vector_revision += 1
+
+    def embed_pending_memories(self, config: Dict[str, Any], limit: int = EMBED_PENDING_BATCH) -> int:
+        """Embed up to `limit` memories that have no vector for the configured model yet."""
+        runtime_config = build_embedding_runtime_config(config)
+        if not has_embedding_config(runtime_config):
+            return 0
+        model_key = embedding_model_key(runtime_config)
+        with self._memory_lock:
+            revision = self._memory_revision
+            if self._embedded_revision.get(model_key) == revision:
+                return 0
+        with self._pool.read() as conn:
+            c = conn.cursor()
+            c.execute(
+                """
+                SELECT m.id, m.plain_content FROM memory m
+                LEFT JOIN memory_embeddings e ON e.memory_id=m.id AND e.model_key=?
+                WHERE e.memory_id IS NULL ORDER BY m.id DESC LIMIT ?
+                """,
+                (model_key, max(1, int(limit))),
+            )
+            pending = [(int(r["id"]), r["plain_content"] or "") for r in c.fetchall()]
+        if not pending:
+            with self._memory_lock:
+                if self._memory_revision == revision:
+                    self._embedded_revision[model_key] = revision
+            return 0
+        vectors = embed_texts([text for _, text in pending], config)
+        if vectors is None:
+            self._note_embed_result(False)
+            return 0
+        self._note_embed_result(True)
+        now = datetime.now(timezone.utc).isoformat()
+        with self._pool.write() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO memory_embeddings (memory_id, model_key, dim, vector, created_at) VALUES (?, ?, ?, ?, ?)",
+                [
+                    (memory_id, model_key, int(vector.shape[0]), vector.astype("<f4").tobytes(), now)
+                    for (memory_id, _), vector in zip(pending, vectors)
+                ],
+            )
+        # New vectors leave the memory rows (and the MemoryArrays built from them) unchanged.
+        self._bump_vector_revision()
+        return len(pending)
+
+    def schedule_embedding(self, config: Dict[str, Any]) -> None:
+        """Have the background embedder pick up memories without a vector. Never blocks."""
+        with self._embed_lock:
+            self._embed_config = config
+            if self._embedder is None or not self._embedder.is_alive():
+                self._embedder = threading.Thread(target=self._embed_loop, name="memory-embed", daemon=True)
+                self._embedder.start()
+        self._embed_wakeup.set()
+
+    def _embed_loop(self) -> None:
+        while True:
+            self._embed_wakeup.wait()
+            self._embed_wakeup.clear()
+            with self._embed_lock:
+                delay = self._embed_retry_at - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self._embed_lock:
+                config = self._embed_config
+            if not config or not self._resolve_policy(config)["memory_vector_recall_enabled"]:
+                continue
+            try:
+                while self.embed_pending_memories(config) > 0:
+                    pass
+            except Exception as e:
+                logger.error(f"Failed to embed pending memories: {e}", exc_info=True)
+                self._note_embed_result(False)
+            with self._embed_lock:
+                if self._embed_failures:
+                    # Retry once the backoff has passed, even if no new memory arrives.
+                    self._embed_wakeup.set()
+
+    def _note_embed_result(self, ok: bool) -> None:
+        with self._embed_lock:
+            if ok:
+                self._embed_failures = 0
+                self._embed_retry_at = 0.0
+                return
+            self._embed_failures += 1
+            backoff = min(EMBED_RETRY_MAX_SECONDS, EMBED_RETRY_INITIAL_SECONDS * 2 ** (self._embed_failures - 1))
+            self._embed_retry_at = time.monotonic() + backoff
+
+    def _get_memory_vectors(self, model_key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """(memory ids, matrix) for one embedding model, reloaded only when memories or vectors change."""
+        with self._memory_lock:
+            cached = self._memory_vector_cache
+            revision = self._vector_revision
+            if cached and cached[0] == model_key and cached[1] == revision:
+                return cached[2], cached[3]
+        with self._pool.read() as conn:
+            c = conn.cursor()
+            c.execute("SELECT memory_id, dim, vector FROM memory_embeddings WHERE model_key=? ORDER BY memory_id", (model_key,))
+            rows = c.fetchall()
+        if not rows:
+            return None
+        dim = int(rows[-1]["dim"])
+        rows = [r for r in rows if int(r["dim"]) == dim]
+        ids = np.fromiter((int(r["memory_id"]) for r in rows), dtype=np.int64, count=len(rows))
+        matrix = np.frombuffer(b"".join(r["vector"] for r in rows), dtype="<f4").reshape(len(rows), dim)
+        with self._memory_lock:
+            if self._vector_revision == revision:
+                self._memory_vector_cache = (model_key, revision, ids, matrix)
+        return ids, matrix
+
+    def _semantic_scores(self, query: Optional[np.ndarray], config: Dict[str, Any], limit: int) -> Dict[int, float]:
+        """Cosine similarity of the query vector against stored memory vectors, top `limit` only."""
+        runtime_config = build_embedding_runtime_config(config)
+        if not has_embedding_config(runtime_config):
+            return {}
+        self.schedule_embedding(config)
+        if query is None:
+            return {}
+        vectors = self._get_memory_vectors(embedding_model_key(runtime_config))
+        if vectors is None:
+            return {}
+        ids, matrix = vectors
+        if query is None or query.shape[1] != matrix.shape[1]:
+            return {}
+        sims = matrix @ query[0]
+        k = min(max(1, limit), sims.shape[0])
+        top = np.argpartition(-sims, k - 1)[:k]
+        return {int(ids[i]): float(sims[i]) for i in top if sims[i] > 0}
+
     def _record_recall(self, payload: List[Tuple[int, float]]) -> None:
+        """Buffer recall stats; the flusher thread writes them in batches."""
         if not payload:
             return
         now = datetime.now(timezone.utc).isoformat()
-        with self.get_conn() as conn:
-            c = conn.cursor()
+        with self._recall_lock:
             for memory_id, score in payload:
-                c.execute(
+                count = self._pending_recalls.get(memory_id, (0, now, score))[0]
+                self._pending_recalls[memory_id] = (count + 1, now, score)
+            pending = len(self._pending_recalls)
+            self._ensure_recall_flusher_locked()
+        if pending >= RECALL_FLUSH_MAX_PENDING:
+            self._recall_flush_wakeup.set()
+
+    def _ensure_recall_flusher_locked(self) -> None:
+        if self._recall_flusher is not None and self._recall_flusher.is_alive():
+            return
+        self._recall_flusher = threading.Thread(target=self._recall_flush_loop, name="memory-recall-flush", daemon=True)
+        self._recall_flusher.start()
+
+    def _recall_flush_loop(self) -> None:
+        while True:
+            self._recall_flush_wakeup.wait(RECALL_FLUSH_INTERVAL_SECONDS)
+            self._recall_flush_wakeup.clear()
+            try:
+                self.flush_recall_stats()
+            except Exception as e:
+                logger.error(f"Failed to flush memory recall stats: {e}", exc_info=True)
+
+    def flush_recall_stats(self) -> int:
+        """Write buffered recall stats in one transaction. Returns the number of rows written."""
+        with self._recall_lock:
+            if not self._pending_recalls:
+                return 0
+            batch = self._pending_recalls
+            self._pending_recalls = {}
+        rows = [(memory_id, count, last_at, score) for memory_id, (count, last_at, score) in batch.items()]
+        try:
+            with self._pool.write() as conn:
+                conn.executemany(
                     """
                     INSERT INTO memory_stats (memory_id, recall_count, last_recalled_at, last_recall_score)
-                    VALUES (?, 1, ?, ?)
+                    VALUES (?, ?, ?, ?)
                     ON CONFLICT(memory_id) DO UPDATE SET
-                        recall_count = memory_stats.recall_count + 1,
+                        recall_count = memory_stats.recall_count + excluded.recall_count,
                         last_recalled_at = excluded.last_recalled_at,
                         last_recall_score = excluded.last_recall_score
                     """,
-                    (memory_id, now, score),
+                    rows,
                 )
-            conn.commit()
+        except sqlite3.Error:
+            # Put the batch back (merged with anything recorded meanwhile) so counts are not lost.
+            with self._recall_lock:
+                for memory_id, (count, last_at, score) in batch.items():
+                    newer = self._pending_recalls.get(memory_id)
+                    if newer:
+                        self._pending_recalls[memory_id] = (count + newer[0], newer[1], newer[2])
+                    else:
+                        self._pending_recalls[memory_id] = (count, last_at, score)
+            raise
+        with self._memory_lock:
+            arrays = self._memory_arrays
+            if arrays is not None:
+                for memory_id, (count, _, _) in batch.items():
+                    pos = arrays.positions.get(memory_id)
+                    if pos is not None:
+                        arrays.recall_counts[pos] += count
+        return len(rows)
 
     def get_memory_candidates(self, include_promoted: bool = False, limit: int = 200) -> List[Dict[str, Any]]:
         limit = max(1, min(2000, int(limit)))
-        with self.get_conn() as conn:
+        with self._pool.read() as conn:
             c = conn.cursor()
             if include_promoted:
                 c.execute("SELECT * FROM memory_candidates ORDER BY promoted ASC, seen_count DESC, last_seen DESC LIMIT ?", (limit,))
@@ -491,14 +915,13 @@ class KnowledgeManager:
         return rows
 
     def delete_memory_candidate(self, candidate_id: int) -> bool:
-        with self.get_conn() as conn:
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute("DELETE FROM memory_candidates WHERE id=?", (candidate_id,))
-            conn.commit()
             return c.rowcount > 0
 
     def promote_memory_candidate(self, candidate_id: int, source: str = "manual_promote") -> Optional[int]:
-        with self.get_conn() as conn:
+        with self._pool.read() as conn:
             c = conn.cursor()
             c.execute("SELECT * FROM memory_candidates WHERE id=? LIMIT 1", (candidate_id,))
             row = c.fetchone()
@@ -516,141 +939,189 @@ class KnowledgeManager:
             source=source,
         )
         if memory_id:
-            with self.get_conn() as conn:
+            with self._pool.write() as conn:
                 c = conn.cursor()
                 c.execute(
                     "UPDATE memory_candidates SET promoted=1, promoted_memory_id=?, promoted_at=?, last_reason=? WHERE id=?",
                     (memory_id, ts, "manual_promoted", candidate_id),
                 )
-                conn.commit()
             return memory_id
         return self._find_existing_memory(str(item.get("normalized_content") or ""))
 
     def delete_memory(self, memory_id: int) -> bool:
-        with self.get_conn() as conn:
+        with self._recall_lock:
+            self._pending_recalls.pop(memory_id, None)
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute("DELETE FROM memory WHERE id=?", (memory_id,))
             deleted = c.rowcount > 0
             c.execute("DELETE FROM memory_stats WHERE memory_id=?", (memory_id,))
+            c.execute("DELETE FROM memory_embeddings WHERE memory_id=?", (memory_id,))
             c.execute(
                 "UPDATE memory_candidates SET promoted=0, promoted_memory_id=NULL, promoted_at=NULL, last_reason=? WHERE promoted_memory_id=?",
                 ("promoted_memory_deleted", memory_id),
             )
-            conn.commit()
-            return deleted
+        self._bump_memory_revision()
+        return deleted
 
     def update_memory(self, memory_id: int, new_content: str) -> bool:
-        with self.get_conn() as conn:
-            c = conn.cursor()
-            c.execute("SELECT content FROM memory WHERE id=?", (memory_id,))
-            row = c.fetchone()
-            if not row:
-                return False
-            content = row["content"]
-            try:
-                tag, _ = content.split("]", 1)
-                tag += "]"
-            except ValueError:
-                return False
-            c.execute("UPDATE memory SET content=? WHERE id=?", (f"{tag} {new_content}".strip(), memory_id))
-            conn.commit()
-            return c.rowcount > 0
+        try:
+            with self._pool.write() as conn:
+                c = conn.cursor()
+                c.execute("SELECT timestamp, user_id, user_name, source FROM memory WHERE id=?", (memory_id,))
+                row = c.fetchone()
+                if not row:
+                    return False
+                plain = self._strip_tag(new_content)
+                tag = self._memory_tag(row["timestamp"], row["source"], row["user_name"], row["user_id"])
+                tokens, ts_epoch = self._memory_recall_features(plain, row["timestamp"])
+                c.execute(
+                    "UPDATE memory SET content=?, normalized_content=?, plain_content=?, tokens=?, ts_epoch=? WHERE id=?",
+                    (f"{tag} {plain}".strip(), self._normalize(plain), plain, tokens, ts_epoch, memory_id),
+                )
+                changed = c.rowcount > 0
+                # The stored vector no longer matches the text; it is re-embedded on the next recall.
+                c.execute("DELETE FROM memory_embeddings WHERE memory_id=?", (memory_id,))
+            self._bump_memory_revision()
+            return changed
+        except sqlite3.IntegrityError:
+            # The new text duplicates another memory.
+            return False
 
     # World Book methods
     def add_world_book_entry(self, keywords: str, content: str, linked_user_id: Optional[str] = None, source: Optional[str] = None) -> int:
-        with self.get_conn() as conn:
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute("INSERT INTO world_book (keywords, content, linked_user_id, source) VALUES (?, ?, ?, ?)", (keywords, content, linked_user_id, source))
-            conn.commit()
-            return c.lastrowid
+            entry_id = c.lastrowid
+        self._world_book_index.upsert({"id": entry_id, "keywords": keywords, "content": content, "enabled": 1, "linked_user_id": linked_user_id})
+        return entry_id
 
     def get_all_world_book_entries(self) -> List[Dict[str, Any]]:
-        with self.get_conn() as conn:
+        with self._pool.read() as conn:
             c = conn.cursor()
             c.execute("SELECT * FROM world_book ORDER BY id")
             return [dict(r) for r in c.fetchall()]
 
     def update_world_book_entry(self, entry_id: int, keywords: str, content: str, enabled: bool, linked_user_id: Optional[str] = None) -> bool:
-        with self.get_conn() as conn:
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute(
                 "UPDATE world_book SET keywords=?, content=?, enabled=?, linked_user_id=? WHERE id=?",
                 (keywords, content, 1 if enabled else 0, linked_user_id, entry_id),
             )
-            conn.commit()
-            return c.rowcount > 0
+            changed = c.rowcount > 0
+        if changed:
+            self._world_book_index.upsert(
+                {"id": entry_id, "keywords": keywords, "content": content, "enabled": 1 if enabled else 0, "linked_user_id": linked_user_id}
+            )
+        return changed
 
     def delete_world_book_entry(self, entry_id: int) -> bool:
-        with self.get_conn() as conn:
+        with self._pool.write() as conn:
             c = conn.cursor()
             c.execute("DELETE FROM world_book WHERE id=?", (entry_id,))
-            conn.commit()
-            return c.rowcount > 0
+            changed = c.rowcount > 0
+        self._world_book_index.remove(entry_id)
+        return changed
+
+    def find_world_book_entries(self, text: str, user_ids: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """(entries linked to `user_ids`, entries whose keywords occur in `text`) from the in-memory index."""
+        return self._get_world_book_index().lookup(text or "", user_ids)
 
     def get_world_book_entries_for_user(self, user_id: str) -> List[Dict[str, Any]]:
-        with self.get_conn() as conn:
-            c = conn.cursor()
-            c.execute("SELECT id, keywords, content FROM world_book WHERE enabled=1 AND linked_user_id=?", (user_id,))
-            return [dict(r) for r in c.fetchall()]
+        return self.find_world_book_entries("", [user_id])[0]
 
     def find_world_book_entries_for_text(self, text: str) -> List[Dict[str, Any]]:
-        lower = (text or "").lower()
-        if not lower.strip():
-            return []
-        tokens = self._extract_search_tokens(lower)
-        if not tokens:
-            return []
+        return self.find_world_book_entries(text)[1]
+
+    def _get_world_book_index(self) -> WorldBookIndex:
+        if not self._world_book_index.loaded:
+            self._load_world_book_index()
+        return self._world_book_index
+
+    def _load_world_book_index(self) -> None:
+        """Load every enabled entry; afterwards the index is kept current by the write methods."""
+        with self._world_book_load_lock:
+            if self._world_book_index.loaded:
+                return
+            with self._pool.read() as conn:
+                c = conn.cursor()
+                c.execute("SELECT id, keywords, content, enabled, linked_user_id FROM world_book WHERE enabled = 1")
+                entries = [dict(r) for r in c.fetchall()]
+            self._world_book_index.load(entries)
+
+    # Async API: same operations, executed off the event loop.
+    async def add_memory_async(self, content: str, timestamp: str, user_id: str, user_name: str, source: str) -> Optional[int]:
+        return await self.run(self.add_memory, content, timestamp, user_id, user_name, source)
+
+    async def ingest_memory_candidate_async(self, content: str, timestamp: str, user_id: str, user_name: str, source: str, **kwargs: Any) -> Dict[str, Any]:
+        return await self.run(self.ingest_memory_candidate, content, timestamp, user_id, user_name, source, **kwargs)
+
+    async def get_all_memories_async(self) -> List[Dict[str, Any]]:
+        return await self.run(self.get_all_memories)
+
+    async def embed_query_async(self, query_text: str, config: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """
+        Query vector for vector recall, or None when it is off, unconfigured, backing off after a
+        failure or slower than QUERY_EMBED_TIMEOUT_SECONDS. The provider call runs on the event
+        loop's default executor, so a slow embedding never holds a SQLite pool worker.
+        """
+        if not config or not (query_text or "").strip() or not self._resolve_policy(config)["memory_vector_recall_enabled"]:
+            return None
+        if not has_embedding_config(build_embedding_runtime_config(config)):
+            return None
+        with self._embed_lock:
+            if time.monotonic() < self._embed_retry_at:
+                return None
         try:
-            entries = self._find_world_book_candidates_via_fts(tokens)
-        except sqlite3.Error:
-            entries = self._find_world_book_candidates_full_scan()
-        return self._filter_keyword_matches(entries, lower)
-
-    def _extract_search_tokens(self, text: str) -> List[str]:
-        raw = re.findall(r"[0-9A-Za-z_\u4e00-\u9fff]+", text)
-        out, seen = [], set()
-        for token in raw:
-            t = token.strip().lower()
-            if not t or len(t) < 2 or t in seen:
-                continue
-            seen.add(t)
-            out.append(t)
-            if len(out) >= 12:
-                break
-        return out
+            query = await asyncio.wait_for(asyncio.to_thread(embed_texts, [query_text], config), QUERY_EMBED_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning(f"Query embedding took longer than {QUERY_EMBED_TIMEOUT_SECONDS:g}s; ranking memories lexically.")
+            query = None
+        self._note_embed_result(query is not None)
+        return query
 
-    def _find_world_book_candidates_via_fts(self, query_tokens: List[str]) -> List[Dict[str, Any]]:
-        match_query = " OR ".join(f'"{t}"' for t in query_tokens)
-        with self.get_conn() as conn:
-            c = conn.cursor()
-            c.execute(
-                """
-                SELECT wb.id, wb.keywords, wb.content
-                FROM world_book wb
-                JOIN world_book_fts fts ON wb.id = fts.rowid
-                WHERE wb.enabled = 1 AND world_book_fts MATCH ?
-                """,
-                (match_query,),
-            )
-            return [dict(r) for r in c.fetchall()]
+    async def get_relevant_memories_async(self, query_text: str, **kwargs: Any) -> List[Dict[str, Any]]:
+        if "query_vector" not in kwargs:
+            kwargs["query_vector"] = await self.embed_query_async(query_text, kwargs.get("config"))
+        return await self.run(self.get_relevant_memories, query_text, **kwargs)
 
-    def _find_world_book_candidates_full_scan(self) -> List[Dict[str, Any]]:
-        with self.get_conn() as conn:
-            c = conn.cursor()
-            c.execute("SELECT id, keywords, content FROM world_book WHERE enabled = 1")
-            return [dict(r) for r in c.fetchall()]
+    async def get_memory_candidates_async(self, include_promoted: bool = False, limit: int = 200) -> List[Dict[str, Any]]:
+        return await self.run(self.get_memory_candidates, include_promoted, limit)
+
+    async def delete_memory_candidate_async(self, candidate_id: int) -> bool:
+        return await self.run(self.delete_memory_candidate, candidate_id)
+
+    async def promote_memory_candidate_async(self, candidate_id: int, source: str = "manual_promote") -> Optional[int]:
+        return await self.run(self.promote_memory_candidate, candidate_id, source)
+
+    async def delete_memory_async(self, memory_id: int) -> bool:
+        return await self.run(self.delete_memory, memory_id)
+
+    async def update_memory_async(self, memory_id: int, new_content: str) -> bool:
+        return await self.run(self.update_memory, memory_id, new_content)
+
+    async def add_world_book_entry_async(self, keywords: str, content: str, linked_user_id: Optional[str] = None, source: Optional[str] = None) -> int:
+        return await self.run(self.add_world_book_entry, keywords, content, linked_user_id, source)
+
+    async def get_all_world_book_entries_async(self) -> List[Dict[str, Any]]:
+        return await self.run(self.get_all_world_book_entries)
+
+    async def update_world_book_entry_async(self, entry_id: int, keywords: str, content: str, enabled: bool, linked_user_id: Optional[str] = None) -> bool:
+        return await self.run(self.update_world_book_entry, entry_id, keywords, content, enabled, linked_user_id)
+
+    async def delete_world_book_entry_async(self, entry_id: int) -> bool:
+        return await self.run(self.delete_world_book_entry, entry_id)
+
+    async def get_world_book_entries_for_user_async(self, user_id: str) -> List[Dict[str, Any]]:
+        return await self.run(self.get_world_book_entries_for_user, user_id)
+
+    async def find_world_book_entries_for_text_async(self, text: str) -> List[Dict[str, Any]]:
+        return await self.run(self.find_world_book_entries_for_text, text)
 
-    def _filter_keyword_matches(self, entries: List[Dict[str, Any]], lower_text: str) -> List[Dict[str, Any]]:
-        matched, added = [], set()
-        for entry in entries:
-            keywords = [k.strip().lower() for k in entry.get("keywords", "").split(",") if k.strip()]
-            for keyword in keywords:
-                if keyword in lower_text:
-                    if entry["id"] not in added:
-                        matched.append(entry)
-                        added.add(entry["id"])
-                    break
-        return matched
+    async def find_world_book_entries_async(self, text: str, user_ids: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        return await self.run(self.find_world_book_entries, text, list(user_ids))
 
 
 knowledge_manager = KnowledgeManager()
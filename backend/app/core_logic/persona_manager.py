@@ -1,10 +1,14 @@
 ﻿# backend/app/core_logic/persona_manager.py
+import functools
 import re
 from datetime import datetime
 from typing import Any, Dict, Optional, Set, Tuple, Union
 
 import discord
 
+from ..config_store import config_store
+from .keyword_index import KeywordIndex, build_persona_index
+
 
 def get_highest_configured_role(
     member: discord.Member,
@@ -83,29 +87,50 @@ def determine_bot_persona(
     return specific_persona_prompt or "", situational_prompt or "", active_directives_log
 
 
-def find_mentioned_users_by_keywords(text: str, personas: Dict[str, Any]) -> Set[str]:
-    """Find user IDs by persona trigger keywords in plain text."""
-    mentioned_user_ids: Set[str] = set()
-    if not text or not personas:
-        return mentioned_user_ids
-
-    lower_text = text.lower()
+def _persona_keyword_spec(personas: Dict[str, Any]) -> Tuple:
+    spec = []
     for persona_cfg in personas.values():
-        user_id = persona_cfg.get("id")
-        if not user_id:
+        if not isinstance(persona_cfg, dict) or not persona_cfg.get("id"):
             continue
-
-        trigger_keywords = set(k.lower() for k in persona_cfg.get("trigger_keywords", []))
         nickname = persona_cfg.get("nickname")
-        if nickname:
-            trigger_keywords.add(nickname.lower())
+        spec.append((
+            persona_cfg.get("id"),
+            tuple(k for k in persona_cfg.get("trigger_keywords", []) or [] if isinstance(k, str)),
+            nickname if isinstance(nickname, str) else None,
+        ))
+    return tuple(spec)
+
+
+@functools.lru_cache(maxsize=8)
+def _get_persona_index(spec: Tuple) -> KeywordIndex:
+    """Persona keyword automaton, rebuilt only when persona keywords/nicknames change."""
+    return build_persona_index({
+        str(i): {"id": user_id, "trigger_keywords": list(keywords), "nickname": nickname}
+        for i, (user_id, keywords, nickname) in enumerate(spec)
+    })
 
-        for keyword in trigger_keywords:
-            if keyword and keyword in lower_text:
-                mentioned_user_ids.add(user_id)
-                break
 
-    return mentioned_user_ids
+# Index for the personas dict of the current config snapshot. Snapshots are never mutated,
+# so while the version and the dict are the same the keyword spec need not be walked again.
+_persona_index_cache: Tuple[Optional[int], Optional[Dict[str, Any]], Optional[KeywordIndex]] = (None, None, None)
+
+
+def _persona_index_for(personas: Dict[str, Any]) -> KeywordIndex:
+    global _persona_index_cache
+    version = config_store.version
+    cached_version, cached_personas, cached_index = _persona_index_cache
+    if cached_version == version and cached_personas is personas:
+        return cached_index
+    index = _get_persona_index(_persona_keyword_spec(personas))
+    _persona_index_cache = (version, personas, index)
+    return index
+
+
+def find_mentioned_users_by_keywords(text: str, personas: Dict[str, Any]) -> Set[str]:
+    """Find user IDs by persona trigger keywords in plain text."""
+    if not text or not personas:
+        return set()
+    return set(_persona_index_for(personas).find(text))
 
 
 async def build_system_prompt(
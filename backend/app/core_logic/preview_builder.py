@@ -195,9 +195,9 @@ async def generate_preview(request: PromptPreviewRequest, bot_config: Dict[str,
     if "世界设定" in mock_message.content:
         log.add("模拟知识库注入...", 1)
         log.add("检测到关键词，注入 '世界设定' 上下文", 2)
-        knowledge_manager.find_world_book_entries_for_text = lambda x: [{'content': '这是一个关于这个世界的设定条目。', 'keywords': '世界设定'}]
+        simulated_wb_entries = [{'content': '这是一个关于这个世界的设定条目。', 'keywords': '世界设定'}]
     else:
-        knowledge_manager.find_world_book_entries_for_text = lambda x: []
+        simulated_wb_entries = []
 
     if "长期记忆" in mock_message.content:
         log.add("模拟知识库注入...", 1)
@@ -218,7 +218,8 @@ async def generate_preview(request: PromptPreviewRequest, bot_config: Dict[str,
         client=MagicMock(), # Not used for preview
         bot_config=simulated_bot_config,
         role_config=author_role_config,
-        injected_data=injected_data_str
+        injected_data=injected_data_str,
+        world_book_entries=simulated_wb_entries
     )
     log.add("调用 `format_user_message_for_llm`...", 2)
     if mock_message.reference:
@@ -0,0 +1,452 @@
+# backend/app/core_logic/quota_store.py
+import logging
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, NamedTuple, Optional, Set, Tuple
+
+from .sqlite_pool import SQLitePool
+
+logger = logging.getLogger(__name__)
+
+# Users idle for longer than this are evicted from the store; their quota starts fresh.
+QUOTA_IDLE_TTL_SECONDS = 31 * 24 * 3600
+QUOTA_EVICT_INTERVAL_SECONDS = 3600.0
+QUOTA_KEY_PREFIX = "discord:quota:"
+QUOTA_RESERVATION_KEY_PREFIX = "discord:quota_reservations:"
+# Reservations not committed or released within this window (e.g. a crashed instance) stop counting.
+QUOTA_RESERVATION_TTL_SECONDS = 600.0
+
+QUOTA_SCHEMA = """
+CREATE TABLE IF NOT EXISTS user_quota (
+    user_id TEXT PRIMARY KEY,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    total_tokens INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_user_quota_updated_at ON user_quota(updated_at);
+
+CREATE TABLE IF NOT EXISTS quota_reservations (
+    reservation_id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    messages INTEGER NOT NULL,
+    tokens INTEGER NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_quota_reservations_user ON quota_reservations(user_id, expires_at);
+"""
+
+
+class QuotaReservation(NamedTuple):
+    user_id: str
+    reservation_id: str
+    tokens: int
+
+
+def _usage_dict(message_count: Any, total_tokens: Any, updated_at: Any, reserved_messages: Any = 0, reserved_tokens: Any = 0) -> Dict[str, Any]:
+    return {
+        "message_count": int(message_count or 0),
+        "total_tokens": int(total_tokens or 0),
+        "timestamp": datetime.fromtimestamp(float(updated_at), tz=timezone.utc),
+        "reserved_messages": int(reserved_messages or 0),
+        "reserved_tokens": int(reserved_tokens or 0),
+    }
+
+
+def _within_limits(usage: Dict[str, Any], message_limit: Optional[int], token_limit: Optional[int], tokens: int) -> bool:
+    if message_limit is not None and usage["message_count"] + usage["reserved_messages"] + 1 > message_limit:
+        return False
+    if token_limit is not None and usage["total_tokens"] + usage["reserved_tokens"] + tokens > token_limit:
+        return False
+    return True
+
+
+class QuotaStore(ABC):
+    """
+    Per-user quota counters shared by every bot instance using the same backend.
+
+    Each operation is atomic in the backend itself (one SQLite write transaction or one Redis
+    Lua script), so callers need no per-user locks. A user's counters reset when they have
+    been idle for longer than the refresh window passed to get_usage().
+    """
+
+    @abstractmethod
+    async def get_usage(self, user_id: str, reset_after_seconds: Optional[float]) -> Dict[str, Any]:
+        """Current usage, creating the user or resetting an expired window in the same step."""
+
+    @abstractmethod
+    async def add_usage(self, user_id: str, messages: int, tokens: int) -> Dict[str, Any]:
+        """Add to the user's counters, mark them active now and return the new usage."""
+
+    @abstractmethod
+    async def reserve(
+        self,
+        user_id: str,
+        reset_after_seconds: Optional[float],
+        message_limit: Optional[int],
+        token_limit: Optional[int],
+        tokens: int,
+    ) -> Tuple[Optional[QuotaReservation], Dict[str, Any]]:
+        """
+        Atomically check one message plus `tokens` against the limits (None = unlimited),
+        counting usage and other live reservations, and hold them if they fit. Returns
+        (reservation or None when over quota, usage as seen by the check).
+        """
+
+    @abstractmethod
+    async def commit(self, reservation: QuotaReservation, messages: int, tokens: int) -> Dict[str, Any]:
+        """Drop the reservation and add the real usage in one step (also if it already expired)."""
+
+    @abstractmethod
+    async def release(self, reservation: QuotaReservation) -> None:
+        """Drop the reservation without charging anything."""
+
+    async def close(self) -> None:
+        return None
+
+
+class SQLiteQuotaStore(QuotaStore):
+    """Quota counters in a WAL SQLite file; also the stand-in used for local runs and tests."""
+
+    def __init__(self, db_path: str = "data/quota.sqlite", idle_ttl_seconds: float = QUOTA_IDLE_TTL_SECONDS):
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._pool = SQLitePool(db_path, max_readers=1)
+        self._evict_lock = threading.Lock()
+        self._last_evicted_at = 0.0
+        with self._pool.write() as conn:
+            conn.executescript(QUOTA_SCHEMA)
+
+    def _maybe_evict(self, conn, now: float) -> None:
+        with self._evict_lock:
+            if now - self._last_evicted_at < QUOTA_EVICT_INTERVAL_SECONDS:
+                return
+            self._last_evicted_at = now
+        conn.execute("DELETE FROM user_quota WHERE updated_at < ?", (now - self.idle_ttl_seconds,))
+        conn.execute("DELETE FROM quota_reservations WHERE expires_at < ?", (now,))
+
+    def _touch_locked(self, conn, user_id: str, now: float, reset_after_seconds: Optional[float]):
+        reset_after = -1.0 if reset_after_seconds is None else float(reset_after_seconds)
+        # A single UPSERT takes the write lock, so the reads that follow see exactly what it wrote.
+        conn.execute(
+            """
+            INSERT INTO user_quota (user_id, message_count, total_tokens, updated_at) VALUES (:user_id, 0, 0, :now)
+            ON CONFLICT(user_id) DO UPDATE SET
+                message_count = CASE WHEN :reset_after >= 0 AND :now - updated_at > :reset_after THEN 0 ELSE message_count END,
+                total_tokens = CASE WHEN :reset_after >= 0 AND :now - updated_at > :reset_after THEN 0 ELSE total_tokens END,
+                updated_at = CASE WHEN :reset_after >= 0 AND :now - updated_at > :reset_after THEN :now ELSE updated_at END
+            """,
+            {"user_id": user_id, "now": now, "reset_after": reset_after},
+        )
+        return conn.execute("SELECT message_count, total_tokens, updated_at FROM user_quota WHERE user_id=?", (user_id,)).fetchone()
+
+    def _get_usage(self, user_id: str, reset_after_seconds: Optional[float]) -> Dict[str, Any]:
+        now = time.time()
+        with self._pool.write() as conn:
+            self._maybe_evict(conn, now)
+            row = self._touch_locked(conn, user_id, now, reset_after_seconds)
+        return _usage_dict(row["message_count"], row["total_tokens"], row["updated_at"])
+
+    def _reserve(
+        self, user_id: str, reset_after_seconds: Optional[float], message_limit: Optional[int], token_limit: Optional[int], tokens: int
+    ) -> Tuple[Optional[QuotaReservation], Dict[str, Any]]:
+        now = time.time()
+        with self._pool.write() as conn:
+            self._maybe_evict(conn, now)
+            row = self._touch_locked(conn, user_id, now, reset_after_seconds)
+            conn.execute("DELETE FROM quota_reservations WHERE user_id=? AND expires_at < ?", (user_id, now))
+            held = conn.execute(
+                "SELECT COALESCE(SUM(messages), 0), COALESCE(SUM(tokens), 0) FROM quota_reservations WHERE user_id=?", (user_id,)
+            ).fetchone()
+            usage = _usage_dict(row["message_count"], row["total_tokens"], row["updated_at"], held[0], held[1])
+            if not _within_limits(usage, message_limit, token_limit, tokens):
+                return None, usage
+            reservation = QuotaReservation(user_id, uuid.uuid4().hex, int(tokens))
+            conn.execute(
+                "INSERT INTO quota_reservations (reservation_id, user_id, messages, tokens, expires_at) VALUES (?, ?, 1, ?, ?)",
+                (reservation.reservation_id, user_id, reservation.tokens, now + QUOTA_RESERVATION_TTL_SECONDS),
+            )
+        return reservation, usage
+
+    def _commit(self, reservation: QuotaReservation, messages: int, tokens: int) -> Dict[str, Any]:
+        with self._pool.write() as conn:
+            conn.execute("DELETE FROM quota_reservations WHERE reservation_id=?", (reservation.reservation_id,))
+            return self._add_usage_locked(conn, reservation.user_id, messages, tokens)
+
+    def _release(self, reservation: QuotaReservation) -> None:
+        with self._pool.write() as conn:
+            conn.execute("DELETE FROM quota_reservations WHERE reservation_id=?", (reservation.reservation_id,))
+
+    def _add_usage_locked(self, conn, user_id: str, messages: int, tokens: int) -> Dict[str, Any]:
+        conn.execute(
+            """
+            INSERT INTO user_quota (user_id, message_count, total_tokens, updated_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                message_count = message_count + excluded.message_count,
+                total_tokens = total_tokens + excluded.total_tokens,
+                updated_at = excluded.updated_at
+            """,
+            (user_id, int(messages), int(tokens), time.time()),
+        )
+        row = conn.execute("SELECT message_count, total_tokens, updated_at FROM user_quota WHERE user_id=?", (user_id,)).fetchone()
+        return _usage_dict(row["message_count"], row["total_tokens"], row["updated_at"])
+
+    def _add_usage(self, user_id: str, messages: int, tokens: int) -> Dict[str, Any]:
+        with self._pool.write() as conn:
+            return self._add_usage_locked(conn, user_id, messages, tokens)
+
+    async def get_usage(self, user_id: str, reset_after_seconds: Optional[float]) -> Dict[str, Any]:
+        return await self._pool.run(self._get_usage, str(user_id), reset_after_seconds)
+
+    async def add_usage(self, user_id: str, messages: int, tokens: int) -> Dict[str, Any]:
+        return await self._pool.run(self._add_usage, str(user_id), messages, tokens)
+
+    async def reserve(
+        self,
+        user_id: str,
+        reset_after_seconds: Optional[float],
+        message_limit: Optional[int],
+        token_limit: Optional[int],
+        tokens: int,
+    ) -> Tuple[Optional[QuotaReservation], Dict[str, Any]]:
+        return await self._pool.run(self._reserve, str(user_id), reset_after_seconds, message_limit, token_limit, tokens)
+
+    async def commit(self, reservation: QuotaReservation, messages: int, tokens: int) -> Dict[str, Any]:
+        return await self._pool.run(self._commit, reservation, messages, tokens)
+
+    async def release(self, reservation: QuotaReservation) -> None:
+        await self._pool.run(self._release, reservation)
+
+    async def close(self) -> None:
+        self._pool.close()
+
+
+class RedisQuotaStore(QuotaStore):
+    """
+    Quota counters as Redis hashes updated by Lua scripts; keys expire after the idle TTL.
+
+    Commands go through the shared RedisService, so they respect its reconnect backoff. While
+    Redis is unreachable the store degrades to a local SQLite store the same way the message
+    lock degrades to in-process locks: quotas are then counted per instance until Redis is back.
+    Reservations made on the fallback are committed and released there.
+    """
+
+    GET_USAGE_LUA = """
+    local data = redis.call('HMGET', KEYS[1], 'message_count', 'total_tokens', 'updated_at')
+    local now = tonumber(ARGV[1])
+    local reset_after = tonumber(ARGV[2])
+    if not data[3] or (reset_after >= 0 and now - tonumber(data[3]) > reset_after) then
+        redis.call('HSET', KEYS[1], 'message_count', 0, 'total_tokens', 0, 'updated_at', ARGV[1])
+        data = {'0', '0', ARGV[1]}
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    return data
+    """
+
+    ADD_USAGE_LUA = """
+    if KEYS[2] then
+        redis.call('HDEL', KEYS[2], ARGV[5])
+    end
+    local message_count = redis.call('HINCRBY', KEYS[1], 'message_count', ARGV[1])
+    local total_tokens = redis.call('HINCRBY', KEYS[1], 'total_tokens', ARGV[2])
+    redis.call('HSET', KEYS[1], 'updated_at', ARGV[3])
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return {tostring(message_count), tostring(total_tokens), ARGV[3]}
+    """
+
+    # Reservations are "messages:tokens:expires_at" fields of a per-user hash.
+    RESERVE_LUA = """
+    local now = tonumber(ARGV[1])
+    local reset_after = tonumber(ARGV[2])
+    local data = redis.call('HMGET', KEYS[1], 'message_count', 'total_tokens', 'updated_at')
+    if not data[3] or (reset_after >= 0 and now - tonumber(data[3]) > reset_after) then
+        redis.call('HSET', KEYS[1], 'message_count', 0, 'total_tokens', 0, 'updated_at', ARGV[1])
+        data = {'0', '0', ARGV[1]}
+    end
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+    local held_messages, held_tokens = 0, 0
+    local held = redis.call('HGETALL', KEYS[2])
+    for i = 1, #held, 2 do
+        local messages, tokens, expires_at = string.match(held[i + 1], '^(%d+):(%d+):([%d%.]+)$')
+        if not expires_at or tonumber(expires_at) < now then
+            redis.call('HDEL', KEYS[2], held[i])
+        else
+            held_messages = held_messages + tonumber(messages)
+            held_tokens = held_tokens + tonumber(tokens)
+        end
+    end
+    local message_limit = tonumber(ARGV[4])
+    local token_limit = tonumber(ARGV[5])
+    local tokens = tonumber(ARGV[6])
+    local ok = 1
+    if message_limit >= 0 and tonumber(data[1]) + held_messages + 1 > message_limit then
+        ok = 0
+    end
+    if token_limit >= 0 and tonumber(data[2]) + held_tokens + tokens > token_limit then
+        ok = 0
+    end
+    if ok == 1 then
+        redis.call('HSET', KEYS[2], ARGV[7], '1:' .. ARGV[6] .. ':' .. ARGV[8])
+        redis.call('EXPIRE', KEYS[2], ARGV[3])
+    end
+    return {data[1], data[2], data[3], tostring(held_messages), tostring(held_tokens), ok}
+    """
+
+    def __init__(
+        self,
+        redis: Any,
+        fallback: Optional[QuotaStore] = None,
+        idle_ttl_seconds: float = QUOTA_IDLE_TTL_SECONDS,
+    ):
+        self._redis = redis
+        self._fallback = fallback
+        self._owns_fallback = fallback is None
+        self.idle_ttl_seconds = int(idle_ttl_seconds)
+        self._scripts: Optional[Dict[str, Any]] = None
+        self._scripts_client: Any = None
+        self._fallback_reservations: Set[str] = set()
+        self._degraded = False
+
+    def _scripts_for(self, client: Any) -> Dict[str, Any]:
+        if self._scripts is None or self._scripts_client is not client:
+            self._scripts = {
+                "get_usage": client.register_script(self.GET_USAGE_LUA),
+                "add_usage": client.register_script(self.ADD_USAGE_LUA),
+                "reserve": client.register_script(self.RESERVE_LUA),
+            }
+            self._scripts_client = client
+        return self._scripts
+
+    def _local(self) -> QuotaStore:
+        if self._fallback is None:
+            self._fallback = SQLiteQuotaStore()
+        return self._fallback
+
+    async def _call(self, op: Callable[[Any, Dict[str, Any]], Awaitable[Any]]) -> Tuple[bool, Any]:
+        """(True, result) from Redis, or (False, None) when the caller should use the fallback."""
+        client = await self._redis.get_client()
+        if client is not None:
+            try:
+                result = await op(client, self._scripts_for(client))
+            except Exception as e:
+                self._redis.mark_failure(e)
+            else:
+                if self._degraded:
+                    logger.info("Redis is back; quota counters are shared again.")
+                    self._degraded = False
+                return True, result
+        if not self._degraded:
+            logger.warning("Redis unavailable; counting quotas in the local SQLite store until it returns.")
+            self._degraded = True
+        return False, None
+
+    async def get_usage(self, user_id: str, reset_after_seconds: Optional[float]) -> Dict[str, Any]:
+        reset_after = -1 if reset_after_seconds is None else float(reset_after_seconds)
+        ok, data = await self._call(lambda client, scripts: scripts["get_usage"](
+            keys=[f"{QUOTA_KEY_PREFIX}{user_id}"],
+            args=[repr(time.time()), repr(reset_after), self.idle_ttl_seconds],
+        ))
+        if not ok:
+            return await self._local().get_usage(user_id, reset_after_seconds)
+        return _usage_dict(*data)
+
+    async def add_usage(self, user_id: str, messages: int, tokens: int) -> Dict[str, Any]:
+        ok, data = await self._call(lambda client, scripts: scripts["add_usage"](
+            keys=[f"{QUOTA_KEY_PREFIX}{user_id}"],
+            args=[int(messages), int(tokens), repr(time.time()), self.idle_ttl_seconds],
+        ))
+        if not ok:
+            return await self._local().add_usage(user_id, messages, tokens)
+        return _usage_dict(*data)
+
+    async def reserve(
+        self,
+        user_id: str,
+        reset_after_seconds: Optional[float],
+        message_limit: Optional[int],
+        token_limit: Optional[int],
+        tokens: int,
+    ) -> Tuple[Optional[QuotaReservation], Dict[str, Any]]:
+        now = time.time()
+        reservation = QuotaReservation(str(user_id), uuid.uuid4().hex, int(tokens))
+        ok, data = await self._call(lambda client, scripts: scripts["reserve"](
+            keys=[f"{QUOTA_KEY_PREFIX}{user_id}", f"{QUOTA_RESERVATION_KEY_PREFIX}{user_id}"],
+            args=[
+                repr(now),
+                repr(-1 if reset_after_seconds is None else float(reset_after_seconds)),
+                self.idle_ttl_seconds,
+                -1 if message_limit is None else int(message_limit),
+                -1 if token_limit is None else int(token_limit),
+                reservation.tokens,
+                reservation.reservation_id,
+                repr(now + QUOTA_RESERVATION_TTL_SECONDS),
+            ],
+        ))
+        if not ok:
+            local_reservation, usage = await self._local().reserve(user_id, reset_after_seconds, message_limit, token_limit, tokens)
+            if local_reservation is not None:
+                self._fallback_reservations.add(local_reservation.reservation_id)
+            return local_reservation, usage
+        usage = _usage_dict(*data[:5])
+        return (reservation if int(data[5]) == 1 else None), usage
+
+    async def commit(self, reservation: QuotaReservation, messages: int, tokens: int) -> Dict[str, Any]:
+        if reservation.reservation_id in self._fallback_reservations:
+            self._fallback_reservations.discard(reservation.reservation_id)
+            return await self._local().commit(reservation, messages, tokens)
+        ok, data = await self._call(lambda client, scripts: scripts["add_usage"](
+            keys=[f"{QUOTA_KEY_PREFIX}{reservation.user_id}", f"{QUOTA_RESERVATION_KEY_PREFIX}{reservation.user_id}"],
+            args=[int(messages), int(tokens), repr(time.time()), self.idle_ttl_seconds, reservation.reservation_id],
+        ))
+        if not ok:
+            # The Redis reservation expires on its own; the usage is still counted locally.
+            return await self._local().add_usage(reservation.user_id, messages, tokens)
+        return _usage_dict(*data)
+
+    async def release(self, reservation: QuotaReservation) -> None:
+        if reservation.reservation_id in self._fallback_reservations:
+            self._fallback_reservations.discard(reservation.reservation_id)
+            await self._local().release(reservation)
+            return
+        # Nothing to do without Redis: an unreleased reservation expires on its own.
+        await self._call(lambda client, scripts: client.hdel(
+            f"{QUOTA_RESERVATION_KEY_PREFIX}{reservation.user_id}", reservation.reservation_id
+        ))
+
+    async def close(self) -> None:
+        # The Redis client belongs to the shared Redis service, which closes it.
+        if self._owns_fallback and self._fallback is not None:
+            await self._fallback.close()
+
+
+_quota_store: Optional[QuotaStore] = None
+_quota_store_lock = threading.Lock()
+
+
+def create_quota_store() -> QuotaStore:
+    """Backend chosen by QUOTA_STORE_BACKEND: "sqlite" (default) or "redis" (REDIS_HOST / REDIS_PORT)."""
+    backend = os.getenv("QUOTA_STORE_BACKEND", "sqlite").strip().lower()
+    if backend == "redis":
+        from ..redis_service import redis_service
+
+        logger.info("Using Redis quota store.")
+        # Shares the bot's pooled connection and its reconnect backoff instead of opening a second pool.
+        return RedisQuotaStore(redis_service)
+    if backend != "sqlite":
+        logger.warning(f"Unknown QUOTA_STORE_BACKEND '{backend}'; using SQLite.")
+    return SQLiteQuotaStore()
+
+
+def get_quota_store() -> QuotaStore:
+    """Process-wide store, created on first use and reused across bot restarts."""
+    global _quota_store
+    if _quota_store is None:
+        with _quota_store_lock:
+            if _quota_store is None:
+                _quota_store = create_quota_store()
+    return _quota_store
@@ -0,0 +1,142 @@
+# backend/app/core_logic/sqlite_pool.py
+import asyncio
+import functools
+import logging
+import queue
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, List, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SQLITE_BUSY_TIMEOUT_MS = 15000
+SQLITE_CACHE_SIZE_KIB = 16 * 1024
+SQLITE_MMAP_SIZE = 128 * 1024 * 1024
+SQLITE_STATEMENT_CACHE = 256
+
+
+class SQLitePool:
+    """
+    Long-lived SQLite connections for one database file.
+
+    The database runs in WAL mode so readers never block the writer and vice versa. All
+    writes go through a single connection guarded by a lock (SQLite only allows one writer
+    anyway, so queueing here avoids "database is locked" retries); reads are served from a
+    small set of reader connections. Connections keep their prepared-statement cache for the
+    life of the process instead of re-parsing every query on a fresh connect().
+
+    run() executes a blocking callable on the pool's own executor, which is sized to the
+    number of connections so async callers queue instead of piling up threads.
+    """
+
+    def __init__(self, db_path: str, max_readers: int = 4, busy_timeout_ms: int = SQLITE_BUSY_TIMEOUT_MS):
+        self.db_path = db_path
+        self.max_readers = max(1, max_readers)
+        self.busy_timeout_ms = max(0, busy_timeout_ms)
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.RLock()
+        self._readers: "queue.LifoQueue[sqlite3.Connection]" = queue.LifoQueue()
+        self._all_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000.0,
+            check_same_thread=False,
+            cached_statements=SQLITE_STATEMENT_CACHE,
+        )
+        conn.row_factory = sqlite3.Row
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        return conn
+
+    def _writer_conn(self) -> sqlite3.Connection:
+        if self._writer is None:
+            self._writer = self._connect()
+        return self._writer
+
+    def _acquire_reader(self) -> sqlite3.Connection:
+        try:
+            return self._readers.get_nowait()
+        except queue.Empty:
+            pass
+        with self._readers_lock:
+            if len(self._all_readers) < self.max_readers:
+                conn = self._connect()
+                self._all_readers.append(conn)
+                return conn
+        return self._readers.get()
+
+    def _release_reader(self, conn: sqlite3.Connection) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._readers_lock:
+            if not any(conn is known for known in self._all_readers):
+                # Checked out across close(); do not let it back into the pool.
+                conn.close()
+                return
+        self._readers.put(conn)
+
+    @contextmanager
+    def write(self) -> Iterator[sqlite3.Connection]:
+        """Serialized write transaction: commits on success, rolls back on any exception."""
+        with self._writer_lock:
+            conn = self._writer_conn()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def read(self) -> Iterator[sqlite3.Connection]:
+        """A pooled reader; it sees the last committed state of the database."""
+        conn = self._acquire_reader()
+        try:
+            yield conn
+        finally:
+            self._release_reader(conn)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_readers + 1,
+                        thread_name_prefix="sqlite-pool",
+                    )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking database callable off the event loop."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_executor(), functools.partial(func, *args, **kwargs))
+
+    def close(self) -> None:
+        """Close every idle connection. The pool stays usable and reconnects lazily."""
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+        with self._readers_lock:
+            self._all_readers.clear()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
@@ -0,0 +1,177 @@
+# backend/app/core_logic/stream_renderer.py
+import asyncio
+import logging
+import time
+from typing import List, Optional
+
+import discord
+
+from ..utils import split_message
+
+logger = logging.getLogger(__name__)
+
+DISCORD_MESSAGE_LIMIT = 2000
+STREAM_EDIT_MIN_INTERVAL_SECONDS = 1.0
+STREAM_EDIT_MAX_INTERVAL_SECONDS = 8.0
+# An edit slower than this was almost certainly held back by discord.py's rate limiter.
+STREAM_EDIT_THROTTLED_SECONDS = 1.5
+
+
+def _first_cut(text: str, limit: int) -> int:
+    """Where split_message() would cut `text` for its first chunk."""
+    cut_index = text.rfind('\n', 0, limit)
+    if cut_index == -1:
+        cut_index = text.rfind(' ', 0, limit)
+    if cut_index == -1:
+        cut_index = limit
+    return cut_index
+
+
+class DiscordStreamRenderer:
+    """
+    Shows a streamed reply in Discord without letting Discord pace the model.
+
+    feed() only updates in-memory state: text that no longer fits the current message is
+    sealed into finished chunks right away (so replies longer than 2000 characters roll over
+    into follow-up messages while streaming) and the rest stays as the live tail. A background
+    task pushes the latest state to Discord, coalescing everything that arrived since the last
+    edit. Its interval adapts to how Discord responds: edits that come back slowly or with a
+    429 double it, fast edits let it decay back to the minimum.
+    """
+
+    def __init__(
+        self,
+        message: discord.Message,
+        min_interval: float = STREAM_EDIT_MIN_INTERVAL_SECONDS,
+        max_interval: float = STREAM_EDIT_MAX_INTERVAL_SECONDS,
+        limit: int = DISCORD_MESSAGE_LIMIT,
+    ):
+        self._message = message
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.limit = limit
+        self.interval = min_interval
+        self._chunks: List[str] = []
+        self._tail = ""
+        self._stage_pending = False
+        # Discord messages shown so far and the text each one currently displays.
+        self._sent: List[discord.Message] = []
+        self._shown: List[str] = []
+        self._dirty = asyncio.Event()
+        self._io_lock = asyncio.Lock()
+        self._closed = False
+        self._task: Optional[asyncio.Task] = None
+        self.edits = 0
+
+    @property
+    def has_output(self) -> bool:
+        return bool(self._sent)
+
+    def feed(self, piece: str) -> None:
+        """Add a streamed delta. Never waits on Discord."""
+        if not piece or self._closed:
+            return
+        if self._stage_pending:
+            # A new response stage overwrites what the previous one displayed.
+            self._chunks = []
+            self._tail = ""
+            self._stage_pending = False
+        self._tail += piece
+        while len(self._tail) > self.limit:
+            cut = _first_cut(self._tail, self.limit)
+            sealed = self._tail[:cut].strip()
+            if sealed:
+                self._chunks.append(sealed)
+            self._tail = self._tail[cut:].lstrip()
+        self._dirty.set()
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def end_stage(self) -> None:
+        """The current response is complete; deltas that follow start a fresh rendering."""
+        self._stage_pending = True
+
+    def _desired(self) -> List[str]:
+        tail = self._tail.strip()
+        return self._chunks + [tail] if tail else list(self._chunks)
+
+    async def _run(self) -> None:
+        try:
+            while not self._closed:
+                await self._dirty.wait()
+                self._dirty.clear()
+                async with self._io_lock:
+                    if self._closed:
+                        return
+                    await self._sync(self._desired())
+                await asyncio.sleep(self.interval)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Streaming preview for message {self._message.id} stopped: {e}")
+
+    async def _sync(self, desired: List[str], delete_extra: bool = False) -> None:
+        for index, content in enumerate(desired):
+            if index < len(self._shown) and self._shown[index] == content:
+                continue
+            await self._write(index, content)
+        if delete_extra:
+            while len(self._sent) > len(desired):
+                stale = self._sent.pop()
+                self._shown.pop()
+                try:
+                    await stale.delete()
+                except discord.errors.HTTPException:
+                    pass
+
+    async def _write(self, index: int, content: str) -> None:
+        started = time.monotonic()
+        throttled = False
+        try:
+            if index < len(self._sent):
+                await self._sent[index].edit(content=content)
+                self.edits += 1
+            elif not self._sent:
+                self._sent.append(await self._message.reply(content, mention_author=False))
+            else:
+                self._sent.append(await self._message.channel.send(content))
+            if index < len(self._shown):
+                self._shown[index] = content
+            else:
+                self._shown.append(content)
+        except discord.errors.HTTPException as e:
+            throttled = e.status == 429
+            if index >= len(self._sent):
+                raise
+        finally:
+            self._adapt(time.monotonic() - started, throttled)
+
+    def _adapt(self, elapsed: float, throttled: bool) -> None:
+        if throttled or elapsed > STREAM_EDIT_THROTTLED_SECONDS:
+            self.interval = min(self.max_interval, self.interval * 2)
+        else:
+            self.interval = max(self.min_interval, self.interval * 0.8)
+
+    async def _stop(self) -> None:
+        self._closed = True
+        task, self._task = self._task, None
+        if task is not None:
+            self._dirty.set()
+            # Let an in-flight Discord call finish so the message list stays accurate.
+            async with self._io_lock:
+                task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def finalize(self, text: str) -> None:
+        """Replace whatever was streamed with the final `text`, splitting it across messages as needed."""
+        await self._stop()
+        chunks = [chunk for chunk in split_message(text, self.limit) if chunk.strip()]
+        async with self._io_lock:
+            await self._sync(chunks, delete_extra=True)
+
+    async def aclose(self) -> None:
+        """Stop the background flusher without touching what is already shown."""
+        await self._stop()
@@ -0,0 +1,98 @@
+# backend/app/core_logic/trigger_classifier.py
+import logging
+from typing import Any, Dict, List, Optional
+
+import discord
+
+from ..utils import compile_trigger_matcher
+from .keyword_index import KeywordIndex
+
+logger = logging.getLogger(__name__)
+
+
+class TriggerClassifier:
+    """
+    Answers "could anything fire on this message?" before the expensive pipeline runs.
+
+    Built once per config version: trigger keywords are compiled into a single matcher and
+    plugin trigger hints (command prefixes / keyword sets) are merged into one prefix tuple
+    and one keyword automaton. Plugins that cannot describe their triggers force the
+    plugin loop to run for every message, exactly as before.
+    """
+
+    def __init__(self, bot_config: Dict[str, Any], plugin_hints: List[Optional[Dict[str, Any]]]):
+        self._match_trigger_keywords = compile_trigger_matcher(
+            bot_config.get("trigger_keywords", []),
+            match_mode=bot_config.get("trigger_match_mode", "contains"),
+            case_sensitive=bool(bot_config.get("trigger_case_sensitive", False)),
+        )
+
+        self._plugins_always_run = False
+        self._gated_always_run = False
+        prefixes: List[str] = []
+        keywords: List[str] = []
+        gated_prefixes: List[str] = []
+        gated_keywords: List[str] = []
+
+        for hints in plugin_hints:
+            if hints is None:
+                self._plugins_always_run = True
+                continue
+            if hints.get("requires_main_trigger"):
+                gated_prefixes.extend(hints.get("prefixes") or [])
+                gated_keywords.extend(hints.get("keywords") or [])
+            else:
+                prefixes.extend(hints.get("prefixes") or [])
+                keywords.extend(hints.get("keywords") or [])
+
+        self._prefixes = tuple(prefixes)
+        self._keywords = self._compile_keywords(keywords)
+        self._gated_prefixes = tuple(gated_prefixes)
+        self._gated_keywords = self._compile_keywords(gated_keywords)
+
+    @staticmethod
+    def _compile_keywords(keywords: List[str]) -> Optional[KeywordIndex]:
+        index = KeywordIndex(case_sensitive=False)
+        always = False
+        for keyword in keywords:
+            keyword = str(keyword)
+            if not keyword:
+                always = True  # "" is a substring of everything
+                continue
+            index.add(keyword, keyword)
+        if always:
+            index.add_pattern("", "")
+        if not len(index):
+            return None
+        index.build()
+        return index
+
+    def is_normal_triggered(self, message: discord.Message, bot_user: Optional[discord.ClientUser]) -> bool:
+        """Mention, reply-to-bot or trigger keyword."""
+        if bot_user is not None and bot_user in message.mentions:
+            return True
+        reference = message.reference
+        if (
+            reference
+            and isinstance(reference.resolved, discord.Message)
+            and reference.resolved.author == bot_user
+        ):
+            return True
+        return self._match_trigger_keywords(message.content)
+
+    def plugins_may_fire(self, message_content: Optional[str], normal_triggered: bool) -> bool:
+        """Cheap superset check for plugin triggers; plugins still make the final decision."""
+        if self._plugins_always_run:
+            return True
+        content = message_content or ""
+        if self._hits(content, self._prefixes, self._keywords):
+            return True
+        if normal_triggered and self._hits(content, self._gated_prefixes, self._gated_keywords):
+            return True
+        return False
+
+    @staticmethod
+    def _hits(content: str, prefixes: tuple, keywords: Optional[KeywordIndex]) -> bool:
+        if prefixes and content.startswith(prefixes):
+            return True
+        return keywords is not None and keywords.matches_any(content)
@@ -1,76 +1,43 @@
 # backend/app/core_logic/usage_manager.py
-import asyncio
 import logging
-from collections import defaultdict
-from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, Optional
-
-import discord
+from typing import Dict, Any, Optional, Tuple
 
 from ..utils import TokenCalculator
+from .quota_store import QuotaReservation, QuotaStore, get_quota_store
 
 logger = logging.getLogger(__name__)
 
 class UsageManager:
     """
-    一个线程安全的类，用于管理用户用量和配额。
-    它封装了所有与配额相关的逻辑，并使用锁来防止并发访问下的竞态条件。
+    管理用户用量和配额。
+    计数保存在 QuotaStore（SQLite 或 Redis）中：重启后不丢失，并在多个实例之间共享；
+    每个操作在存储端原子执行，因此不再需要进程内的逐用户锁。
+
+    请求流程为 reserve_quota → commit_quota / release_quota：请求前原子地预留
+    估算的输入 token 与输出预算，请求后按真实用量结算，因此同一用户的并发请求
+    不会共同透支配额，也无需把整个请求串行化。
     """
-    def __init__(self, token_calculator: TokenCalculator):
-        self._usage_tracker: Dict[int, Dict[str, Any]] = {}
-        self._user_locks = defaultdict(asyncio.Lock)
+    def __init__(self, token_calculator: TokenCalculator, quota_store: Optional[QuotaStore] = None):
+        self._store = quota_store or get_quota_store()
         self._token_calculator = token_calculator
 
-    def _get_initial_usage_data(self) -> Dict[str, Any]:
-        """返回一个初始化的用户用量字典。"""
-        return {
-            "message_count": 0,
-            "total_tokens": 0,
-            "timestamp": datetime.now(timezone.utc)
-        }
-
-    def _should_reset_quota(self, usage_data: Dict[str, Any], role_config: Dict[str, Any]) -> bool:
-        """根据角色配置和上次使用时间，判断是否应该重置配额。"""
-        now = datetime.now(timezone.utc)
-        last_timestamp = usage_data.get("timestamp", now)
-        
-        # 兼容旧的'chars'命名
-        if 'chars' in usage_data and 'total_tokens' not in usage_data:
-            usage_data['total_tokens'] = usage_data['chars']
-
+    def _reset_after_seconds(self, role_config: Dict[str, Any]) -> Optional[float]:
+        """根据角色配置返回配额刷新周期（秒）；未启用任何限制时返回 None（永不重置）。"""
+        windows = []
         # 检查消息数刷新周期
         if role_config.get('enable_message_limit'):
-            refresh_minutes = role_config.get('message_refresh_minutes', 60)
-            if now - last_timestamp > timedelta(minutes=refresh_minutes):
-                return True
-        
+            windows.append(role_config.get('message_refresh_minutes', 60))
         # 检查Token数刷新周期 (旧称char_limit)
         if role_config.get('enable_char_limit'):
-            refresh_minutes = role_config.get('char_refresh_minutes', 60)
-            if now - last_timestamp > timedelta(minutes=refresh_minutes):
-                return True
-                
-        return False
+            windows.append(role_config.get('char_refresh_minutes', 60))
+        return min(float(minutes) for minutes in windows) * 60 if windows else None
 
     async def check_quota_and_get_usage(self, user_id: int, role_config: Dict[str, Any]) -> Dict[str, Any]:
         """
         获取用户的当前用量数据。如果需要，会自动重置配额。
         这是一个原子操作。
         """
-        async with self._user_locks[user_id]:
-            current_usage = self._usage_tracker.get(user_id)
-            
-            if not current_usage:
-                current_usage = self._get_initial_usage_data()
-                self._usage_tracker[user_id] = current_usage
-                return current_usage
-
-            if self._should_reset_quota(current_usage, role_config):
-                logger.info(f"Usage quota for user {user_id} has been reset.")
-                current_usage = self._get_initial_usage_data()
-                self._usage_tracker[user_id] = current_usage
-            
-            return current_usage.copy() # 返回副本以防止外部修改
+        return await self._store.get_usage(str(user_id), self._reset_after_seconds(role_config))
 
     async def check_pre_request_quota(self, user_id: int, role_config: Dict[str, Any], current_usage: Dict[str, Any], estimated_input_tokens: int) -> Optional[str]:
         """
@@ -79,7 +46,8 @@ class UsageManager:
         # 检查消息数限制
         if role_config.get('enable_message_limit'):
             limit = role_config.get('message_limit', 0)
-            if (current_usage.get('message_count', 0) + 1) > limit:
+            # 已预留但尚未结算的请求同样占用配额
+            if (current_usage.get('message_count', 0) + current_usage.get('reserved_messages', 0) + 1) > limit:
                 return f"Sorry, your message quota ({limit} messages) would be exceeded. Please try again later."
 
         # 检查Token数限制 (旧称char_limit)
@@ -89,7 +57,7 @@ class UsageManager:
             output_budget = role_config.get('char_output_budget', 500)
             
             # 兼容旧的'chars'命名
-            tokens_used = current_usage.get('total_tokens') or current_usage.get('chars', 0)
+            tokens_used = (current_usage.get('total_tokens') or current_usage.get('chars', 0)) + current_usage.get('reserved_tokens', 0)
             
             if (tokens_used + estimated_input_tokens + output_budget) > token_limit:
                 remaining_quota = token_limit - tokens_used
@@ -101,24 +69,42 @@ class UsageManager:
         """
         在LLM响应后，精确更新用户的用量。这是一个原子操作。
         """
-        async with self._user_locks[user_id]:
-            usage = self._usage_tracker.get(user_id)
-            if not usage:
-                 # 如果用量数据不存在，可能是因为机器人重启了。创建一个新的。
-                usage = self._get_initial_usage_data()
-                self._usage_tracker[user_id] = usage
+        usage = await self._store.add_usage(str(user_id), 1, input_tokens + output_tokens)
+        logger.info(
+            f"User {user_id} usage updated: +1 msg, +{input_tokens + output_tokens} tokens. "
+            f"New total: {usage['message_count']} msgs, {usage['total_tokens']} tokens."
+        )
 
-            usage['message_count'] += 1
-            
-            # 兼容旧的'chars'命名
-            if 'chars' in usage and 'total_tokens' not in usage:
-                usage['total_tokens'] = usage.get('chars', 0)
+    async def reserve_quota(self, user_id: int, role_config: Dict[str, Any], estimated_input_tokens: int) -> Tuple[Optional[QuotaReservation], Optional[str]]:
+        """
+        在发送LLM请求前原子地检查并预留配额（1 条消息 + 估算输入 token + 输出预算）。
+        返回 (预留凭据, None)；超额时返回 (None, 错误消息)。
+        """
+        output_budget = role_config.get('char_output_budget', 500)
+        message_limit = role_config.get('message_limit', 0) if role_config.get('enable_message_limit') else None
+        token_limit = role_config.get('char_limit', 0) if role_config.get('enable_char_limit') else None
+        reservation, usage = await self._store.reserve(
+            str(user_id),
+            self._reset_after_seconds(role_config),
+            message_limit,
+            token_limit,
+            estimated_input_tokens + output_budget,
+        )
+        if reservation is not None:
+            return reservation, None
+        error = await self.check_pre_request_quota(user_id, role_config, usage, estimated_input_tokens)
+        return None, error or "Sorry, your quota would be exceeded. Please try again later."
 
-            usage['total_tokens'] += input_tokens + output_tokens
-            # 更新时间戳以用于刷新逻辑
-            usage['timestamp'] = datetime.now(timezone.utc)
-            
-            logger.info(
-                f"User {user_id} usage updated: +1 msg, +{input_tokens + output_tokens} tokens. "
-                f"New total: {usage['message_count']} msgs, {usage['total_tokens']} tokens."
-            )
\ No newline at end of file
+    async def commit_quota(self, reservation: QuotaReservation, input_tokens: int, output_tokens: int) -> None:
+        """
+        在LLM响应后用真实用量结算预留。即使预留已过期也会计入用量。
+        """
+        usage = await self._store.commit(reservation, 1, input_tokens + output_tokens)
+        logger.info(
+            f"User {reservation.user_id} usage committed: +1 msg, +{input_tokens + output_tokens} tokens "
+            f"(reserved {reservation.tokens}). New total: {usage['message_count']} msgs, {usage['total_tokens']} tokens."
+        )
+
+    async def release_quota(self, reservation: QuotaReservation) -> None:
+        """请求失败或被取消时归还预留，不计入任何用量。"""
+        await self._store.release(reservation)
@@ -0,0 +1,145 @@
+# backend/app/core_logic/world_book_index.py
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, Iterable, List, Tuple
+
+from .keyword_index import KeywordIndex, split_world_book_keywords
+
+logger = logging.getLogger(__name__)
+
+# Removed entries leave dead keywords in the automaton; it is rebuilt once they outnumber live ones.
+WORLD_BOOK_MIN_STALE_BEFORE_REBUILD = 32
+
+
+class WorldBookIndex:
+    """
+    In-memory view of the enabled world book entries.
+
+    Holds a linked user id -> entries map and one keyword automaton over every entry's
+    comma-separated keywords, so all hits for a message come from a single scan of its text
+    with no database access. KnowledgeManager loads it once and keeps it current through
+    upsert()/remove() after each committed write.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._entries: Dict[int, Dict[str, Any]] = {}
+        self._by_user: Dict[str, List[int]] = {}
+        self._keyword_sets: Dict[int, FrozenSet[str]] = {}
+        self._keywords = KeywordIndex(case_sensitive=False)
+        self._stale_keywords = 0
+        self._live_keywords = 0
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """Replace the index contents with `entries` (rows with id, keywords, content, linked_user_id)."""
+        with self._lock:
+            self._entries = {}
+            self._by_user = {}
+            self._keyword_sets = {}
+            for entry in entries:
+                if entry.get("enabled", 1):
+                    self._store_locked(entry)
+            self._rebuild_keywords_locked()
+            self._loaded = True
+
+    def upsert(self, entry: Dict[str, Any]) -> None:
+        """Index a new or edited entry; disabled entries are dropped from the index."""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._discard_locked(int(entry["id"]))
+            if entry.get("enabled", 1):
+                stored = self._store_locked(entry)
+                for keyword in split_world_book_keywords(stored["keywords"]):
+                    if self._keywords.add(keyword, stored["id"]):
+                        self._live_keywords += 1
+                self._keywords.build()
+            self._maybe_compact_locked()
+
+    def remove(self, entry_id: int) -> None:
+        with self._lock:
+            if not self._loaded:
+                return
+            self._discard_locked(int(entry_id))
+            self._maybe_compact_locked()
+
+    def lookup(self, text: str, user_ids: Iterable[str] = ()) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        """
+        (entries linked to `user_ids`, entries whose keywords occur in `text`).
+
+        The two lists never share an entry; user entries follow the order of `user_ids`,
+        keyword hits are ordered by entry id.
+        """
+        with self._lock:
+            seen = set()
+            user_entries: List[Dict[str, Any]] = []
+            for user_id in user_ids:
+                for entry_id in self._by_user.get(str(user_id), ()):
+                    if entry_id not in seen:
+                        seen.add(entry_id)
+                        user_entries.append(dict(self._entries[entry_id]))
+            text_entries: List[Dict[str, Any]] = []
+            if text and text.strip():
+                # An id can carry dead keywords from before an edit; only its current keywords count.
+                hits = {
+                    entry_id
+                    for entry_id, keyword in self._keywords.iter_hits(text)
+                    if keyword in self._keyword_sets.get(entry_id, ())
+                }
+                for entry_id in sorted(hits):
+                    if entry_id not in seen:
+                        seen.add(entry_id)
+                        text_entries.append(dict(self._entries[entry_id]))
+            return user_entries, text_entries
+
+    def _store_locked(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        stored = {
+            "id": int(entry["id"]),
+            "keywords": str(entry.get("keywords") or ""),
+            "content": str(entry.get("content") or ""),
+            "linked_user_id": entry.get("linked_user_id") or None,
+        }
+        self._entries[stored["id"]] = stored
+        self._keyword_sets[stored["id"]] = frozenset(split_world_book_keywords(stored["keywords"]))
+        if stored["linked_user_id"]:
+            self._by_user.setdefault(str(stored["linked_user_id"]), []).append(stored["id"])
+        return stored
+
+    def _discard_locked(self, entry_id: int) -> None:
+        stored = self._entries.pop(entry_id, None)
+        if stored is None:
+            return
+        self._keyword_sets.pop(entry_id, None)
+        user_id = stored["linked_user_id"]
+        if user_id:
+            remaining = [other for other in self._by_user.get(str(user_id), []) if other != entry_id]
+            if remaining:
+                self._by_user[str(user_id)] = remaining
+            else:
+                self._by_user.pop(str(user_id), None)
+        # The entry's keywords stay in the automaton until the next rebuild; lookup() ignores them.
+        dead = len(split_world_book_keywords(stored["keywords"]))
+        self._live_keywords -= dead
+        self._stale_keywords += dead
+
+    def _maybe_compact_locked(self) -> None:
+        if self._stale_keywords > max(WORLD_BOOK_MIN_STALE_BEFORE_REBUILD, self._live_keywords):
+            self._rebuild_keywords_locked()
+
+    def _rebuild_keywords_locked(self) -> None:
+        index = KeywordIndex(case_sensitive=False)
+        live = 0
+        for entry_id, entry in self._entries.items():
+            for keyword in split_world_book_keywords(entry["keywords"]):
+                if index.add(keyword, entry_id):
+                    live += 1
+        index.build()
+        self._keywords = index
+        self._live_keywords = live
+        self._stale_keywords = 0
+
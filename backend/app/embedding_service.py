@@ -0,0 +1,139 @@
+# backend/app/embedding_service.py
+import functools
+import hashlib
+import logging
+import re
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import openai
+from google import genai
+
+from .provider_config import build_endpoint, fallback_base_url, normalize_provider
+from .xai_sdk_utils import create_xai_sync_client, embed_xai_texts
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_TIMEOUT_SECONDS = 4.0
+EMBEDDING_BATCH_SIZE = 64
+LOCAL_EMBEDDING_PROVIDER = "local"
+
+_LOCAL_TOKEN_RE = re.compile(r"[0-9a-z_]+|[\u4e00-\u9fff]")
+
+
+def _normalize_embedding_provider(provider: str) -> str:
+    normalized = normalize_provider(provider)
+    if normalized in {"local", "hash", "local_hash"}:
+        return LOCAL_EMBEDDING_PROVIDER
+    return normalized
+
+
+def build_embedding_runtime_config(config: Dict[str, Any]) -> Dict[str, Any]:
+    provider = _normalize_embedding_provider(str(config.get("embedding_provider") or "openai"))
+    endpoint = build_endpoint(config.get("embedding_base_url"), config.get("embedding_port")) or fallback_base_url(
+        config, provider
+    )
+    try:
+        dimensions = max(1, min(8192, int(config.get("embedding_dimensions", 1536))))
+    except (TypeError, ValueError):
+        dimensions = 1536
+    return {
+        "provider": provider,
+        "api_key": config.get("embedding_api_key") or config.get("api_key") or "",
+        "base_url": endpoint,
+        "model_name": str(config.get("embedding_model_name") or "").strip(),
+        "dimensions": dimensions,
+    }
+
+
+def has_embedding_config(runtime_config: Dict[str, Any]) -> bool:
+    if runtime_config["provider"] == LOCAL_EMBEDDING_PROVIDER:
+        return True
+    return bool(runtime_config.get("api_key") and runtime_config.get("model_name"))
+
+
+def embedding_model_key(runtime_config: Dict[str, Any]) -> str:
+    """Identifies the vector space; vectors stored under another key are ignored and re-embedded."""
+    model_name = runtime_config["model_name"] if runtime_config["provider"] != LOCAL_EMBEDDING_PROVIDER else "hash"
+    return f"{runtime_config['provider']}:{model_name}:{runtime_config['dimensions']}"
+
+
+def _l2_normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+def _local_embed(texts: List[str], dimensions: int) -> np.ndarray:
+    """Deterministic feature-hashing embedding (tokens + character trigrams). No network, stable across runs."""
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for token in _LOCAL_TOKEN_RE.findall((text or "").lower()):
+            features = [token]
+            if len(token) > 3:
+                features.extend(token[i:i + 3] for i in range(len(token) - 2))
+            for feature in features:
+                digest = hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest()
+                value = int.from_bytes(digest, "little")
+                matrix[row, value % dimensions] += 1.0 if (value >> 63) & 1 else -1.0
+    return matrix
+
+
+@functools.lru_cache(maxsize=4)
+def _openai_client(api_key: str, base_url: Optional[str]) -> openai.OpenAI:
+    return openai.OpenAI(api_key=api_key, base_url=base_url or None, timeout=EMBEDDING_TIMEOUT_SECONDS, max_retries=1)
+
+
+@functools.lru_cache(maxsize=4)
+def _google_client(api_key: str) -> genai.Client:
+    return genai.Client(api_key=api_key)
+
+
+@functools.lru_cache(maxsize=4)
+def _xai_client(api_key: str, base_url: Optional[str]):
+    return create_xai_sync_client(api_key, base_url, timeout=EMBEDDING_TIMEOUT_SECONDS)
+
+
+def _remote_embed(texts: List[str], runtime_config: Dict[str, Any]) -> List[List[float]]:
+    provider = runtime_config["provider"]
+    model_name = runtime_config["model_name"]
+    if provider == "openai":
+        kwargs: Dict[str, Any] = {"model": model_name, "input": texts}
+        if model_name.startswith("text-embedding-3"):
+            kwargs["dimensions"] = runtime_config["dimensions"]
+        response = _openai_client(runtime_config["api_key"], runtime_config["base_url"]).embeddings.create(**kwargs)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+    if provider == "google":
+        response = _google_client(runtime_config["api_key"]).models.embed_content(model=model_name, contents=texts)
+        return [list(getattr(item, "values", None) or []) for item in (getattr(response, "embeddings", None) or [])]
+    if provider == "grok":
+        return embed_xai_texts(_xai_client(runtime_config["api_key"], runtime_config["base_url"]), model_name, texts)
+    raise ValueError(f"Embedding provider '{provider}' is not supported.")
+
+
+def embed_texts(texts: List[str], config: Dict[str, Any]) -> Optional[np.ndarray]:
+    """
+    Embed `texts` with the configured embedding model.
+
+    Returns an L2-normalized float32 matrix with one row per text, or None when embeddings
+    are not configured or the provider call fails (callers fall back to lexical recall).
+    """
+    if not texts:
+        return None
+    runtime_config = build_embedding_runtime_config(config)
+    if not has_embedding_config(runtime_config):
+        return None
+    if runtime_config["provider"] == LOCAL_EMBEDDING_PROVIDER:
+        return _l2_normalize(_local_embed(texts, runtime_config["dimensions"]))
+
+    rows: List[List[float]] = []
+    try:
+        for start in range(0, len(texts), EMBEDDING_BATCH_SIZE):
+            rows.extend(_remote_embed(texts[start:start + EMBEDDING_BATCH_SIZE], runtime_config))
+    except Exception as e:
+        logger.warning(f"Embedding request to '{runtime_config['provider']}' failed: {e}")
+        return None
+    if len(rows) != len(texts) or not rows or any(len(row) != len(rows[0]) or not row for row in rows):
+        logger.warning("Embedding provider returned an unexpected number or shape of vectors; ignoring them.")
+        return None
+    return _l2_normalize(np.asarray(rows, dtype=np.float32))
@@ -5,11 +5,12 @@ import json
 import logging
 from typing import Any, Dict, List, AsyncGenerator, Tuple, Optional
 
-from .base import LLMProvider
+from .base import ToolLoopProvider
+from .tool_executor import ToolCall, ToolResult
 
 logger = logging.getLogger(__name__)
 
-class AnthropicProvider(LLMProvider):
+class AnthropicProvider(ToolLoopProvider):
     """
     LLMProvider implementation for Anthropic's Claude API.
     """
@@ -51,6 +52,67 @@ class AnthropicProvider(LLMProvider):
         prepared_messages[-1] = {"role": last_message["role"], "content": content}
         return prepared_messages
 
+    def _round_kwargs(self, state: Dict[str, Any], allow_tools: bool) -> Dict[str, Any]:
+        api_kwargs = {
+            "model": self.model,
+            "messages": state["messages"],
+            **self.custom_params,
+        }
+        if state["system"]:
+            api_kwargs["system"] = state["system"]
+        if state["tools"]:
+            # Tools stay declared once tool_use blocks are in the history; "none" forces a text answer.
+            api_kwargs["tools"] = state["tools"]
+            api_kwargs["tool_choice"] = {"type": "auto" if allow_tools else "none"}
+        return api_kwargs
+
+    @staticmethod
+    def _usage_dict(usage: Any) -> Optional[Dict[str, int]]:
+        if not usage:
+            return None
+        return {"input_tokens": int(usage.input_tokens or 0), "output_tokens": int(usage.output_tokens or 0)}
+
+    async def _stream_round(self, state: Dict[str, Any], allow_tools: bool) -> AsyncGenerator[Tuple[str, Any], None]:
+        api_kwargs = self._round_kwargs(state, allow_tools)
+        if self.stream:
+            async with self.client.messages.stream(**api_kwargs) as stream:
+                async for text in stream.text_stream:
+                    yield "delta", text
+                response = await stream.get_final_message()
+        else:
+            response = await self.client.messages.create(**api_kwargs)
+            text_content = "".join([block.text for block in response.content if block.type == 'text'])
+            if text_content:
+                yield "delta", text_content
+
+        state["last_content"] = response.content
+        for block in response.content:
+            if block.type == 'tool_use':
+                yield "tool_call", ToolCall(block.id, block.name, block.input)
+        usage = self._usage_dict(getattr(response, "usage", None))
+        if usage:
+            yield "usage", usage
+
+    def _append_tool_results(self, state: Dict[str, Any], text: str, calls: List[ToolCall], results: List[ToolResult]) -> None:
+        # Append the assistant's turn exactly as returned, then the results in one user turn
+        state["messages"].append({"role": "assistant", "content": state.pop("last_content")})
+        tool_results = []
+        for result in results:
+            if result.ok:
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": result.call.id,
+                    "content": str(result.output),
+                })
+            else:
+                tool_results.append({
+                    "type": "tool_result",
+                    "tool_use_id": result.call.id,
+                    "content": f"Error: {result.error}",
+                    "is_error": True,
+                })
+        state["messages"].append({"role": "user", "content": tool_results})
+
     async def get_response_stream(
         self,
         messages: List[Dict[str, Any]],
@@ -66,104 +128,15 @@ class AnthropicProvider(LLMProvider):
         else:
             llm_messages = messages
             
-        llm_messages = self._prepare_messages(llm_messages, images)
-        
-        api_kwargs = {
-            "model": self.model,
-            "messages": llm_messages,
-            **self.custom_params,
+        state = {
+            "system": system_prompt,
+            # A private copy: tool rounds append to it and callers may retry with the same messages.
+            "messages": list(self._prepare_messages(llm_messages, images)),
+            "tools": tools or None,
         }
-        if system_prompt:
-            api_kwargs["system"] = system_prompt
-        if tools:
-            api_kwargs["tools"] = tools
-            api_kwargs["tool_choice"] = {"type": "auto"}
 
         try:
-            if self.stream:
-                # Anthropic's streaming for tool use is complex.
-                # We'll use a non-streaming approach for the first call when tools are present
-                # to simplify logic, then stream the final text response.
-                if tools and tool_functions:
-                    # Make a non-streaming call to check for tool usage
-                    response = await self.client.messages.create(**api_kwargs, stream=False)
-                    # Now handle the response, which might contain tool calls or text
-                    async for response_type, content in self._handle_anthropic_response(response, llm_messages, api_kwargs, tool_functions, stream_final=True):
-                         yield response_type, content
-                    return
-
-                # Standard text streaming if no tools are involved
-                async with self.client.messages.stream(**api_kwargs) as stream:
-                    full_response = ""
-                    async for text in stream.text_stream:
-                        full_response += text
-                        yield "partial", full_response
-                    yield "final", full_response
-            else: # Non-streaming mode
-                response = await self.client.messages.create(**api_kwargs)
-                async for response_type, content in self._handle_anthropic_response(response, llm_messages, api_kwargs, tool_functions, stream_final=False):
-                     yield response_type, content
-
+            async for response_type, content in self._run_tool_loop(state, tool_functions if tools else None):
+                yield response_type, content
         except Exception as e:
             yield "final", self._handle_error(e)
-
-    async def _handle_anthropic_response(
-        self, response, messages, api_kwargs, tool_functions, stream_final
-    ) -> AsyncGenerator[Tuple[str, str], None]:
-        
-        stop_reason = response.stop_reason
-        response_content = response.content
-
-        if stop_reason == "tool_use" and tool_functions:
-            tool_use_blocks = [block for block in response_content if block.type == 'tool_use']
-            
-            # Append assistant's request message
-            messages.append({"role": "assistant", "content": response_content})
-            
-            tool_results = []
-            for tool_use in tool_use_blocks:
-                tool_name = tool_use.name
-                tool_input = tool_use.input
-                tool_call_id = tool_use.id
-                
-                logger.info(f"Executing tool '{tool_name}' with args: {tool_input}")
-                function_to_call = tool_functions.get(tool_name)
-                if function_to_call:
-                    try:
-                        function_response = function_to_call(**tool_input)
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": tool_call_id,
-                            "content": str(function_response),
-                        })
-                    except Exception as e:
-                        logger.error(f"Error executing tool {tool_name}: {e}")
-                        tool_results.append({
-                            "type": "tool_result",
-                            "tool_use_id": tool_call_id,
-                            "content": f"Error: {e}",
-                            "is_error": True,
-                        })
-                else:
-                    tool_results.append({ "type": "tool_result", "tool_use_id": tool_call_id, "content": f"Error: Tool '{tool_name}' not found."})
-
-            # Append the tool results to the conversation
-            messages.append({"role": "user", "content": tool_results})
-            
-            # Make the second call
-            api_kwargs["messages"] = messages
-            
-            if stream_final:
-                 async with self.client.messages.stream(**api_kwargs) as stream:
-                    full_response = ""
-                    async for text in stream.text_stream:
-                        full_response += text
-                        yield "partial", full_response
-                    yield "final", full_response
-            else:
-                 second_response = await self.client.messages.create(**api_kwargs)
-                 yield "final", second_response.content[0].text
-
-        else: # Normal text response
-            text_content = "".join([block.text for block in response_content if block.type == 'text'])
-            yield "final", text_content
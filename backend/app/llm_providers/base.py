@@ -1,10 +1,26 @@
 # backend/app/llm_providers/base.py
 from abc import ABC, abstractmethod
 from typing import Any, Dict, List, AsyncGenerator, Tuple, Optional, Union
+import inspect
 import logging
 
+from .tool_executor import ToolCall, ToolResult, execute_tool_calls
+
 logger = logging.getLogger(__name__)
 
+DEFAULT_MAX_TOOL_ROUNDS = 4
+
+
+def merge_usage(first: Optional[Dict[str, int]], second: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+    """把两次调用的用量相加；任一方为空时返回另一方。"""
+    if first and second:
+        return {
+            "input_tokens": int(first.get("input_tokens", 0)) + int(second.get("input_tokens", 0)),
+            "output_tokens": int(first.get("output_tokens", 0)) + int(second.get("output_tokens", 0)),
+        }
+    return second or first
+
+
 class LLMProvider(ABC):
     """
     抽象基类，定义了所有LLM提供商的统一接口。
@@ -16,6 +32,9 @@ class LLMProvider(ABC):
         self.model = config.get("model_name")
         self.stream = config.get("stream_response", True)
         self.custom_params = {param["name"]: param["value"] for param in config.get("custom_parameters", [])}
+        self.max_tool_rounds = max(0, int(config.get("llm_max_tool_rounds", DEFAULT_MAX_TOOL_ROUNDS)))
+        # 正在进行的流式请求数；缓存淘汰后要等它归零才能关闭客户端。
+        self.in_flight = 0
         
     @abstractmethod
     async def get_response_stream(
@@ -36,17 +55,99 @@ class LLMProvider(ABC):
 
         Yields:
             Tuple[str, Union[str, Dict[str, int]]]: 一个元组，第一个元素是响应类型:
-              - "partial": 第二个元素是部分文本内容(str)
-              - "final": 第二个元素是最终文本内容(str)
-              - "usage": 第二个元素是用量数据字典(Dict[str, int])
+              - "delta": 第二个元素是新增的文本片段(str)，只包含自上一个片段以来的新内容
+              - "final": 第二个元素是一轮响应的完整文本内容(str)；发生工具调用时每轮各有一个，
+                最后一个是最终回答
+              - "tool_calls": 第二个元素是本轮模型请求的工具调用列表(List[Dict])，随后执行工具并开始下一轮
+              - "usage": 第二个元素是所有轮次累计的用量数据字典(Dict[str, int])
         """
         # 这是一个生成器，所以需要用 yield 来满足类型提示
         # 实际实现应该在子类中，这里只是为了让 linter 满意
         if False:
             yield "final", "This is an abstract method and should be implemented in subclasses."
         
+    async def aclose(self) -> None:
+        """关闭 SDK 客户端及其连接池。google-genai 的异步连接池挂在 client.aio 上，需要单独关闭。"""
+        client = getattr(self, "client", None)
+        if client is None:
+            return
+        for target in (getattr(client, "aio", None), client):
+            if target is None:
+                continue
+            closer = getattr(target, "aclose", None) or getattr(target, "close", None)
+            if closer is None:
+                continue
+            try:
+                result = closer()
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                logger.warning(f"Failed to close {self.__class__.__name__} client: {e}")
+
     def _handle_error(self, e: Exception) -> str:
         """统一处理API调用中的异常，并返回一个带特殊前缀的错误字符串。"""
         error_message = f"LLM_PROVIDER_ERROR: {self.__class__.__name__} encountered an error: {str(e)}"
         logger.error(f"LLM API error in {self.__class__.__name__}: {e}", exc_info=True)
-        return error_message
\ No newline at end of file
+        return error_message
+
+
+class ToolLoopProvider(LLMProvider):
+    """
+    基于 SDK 的提供商的基类：子类只需实现单轮调用和工具结果回填，多轮工具循环由 _run_tool_loop 统一驱动。
+    """
+    @abstractmethod
+    async def _stream_round(self, state: Any, allow_tools: bool) -> AsyncGenerator[Tuple[str, Any], None]:
+        """
+        工具循环的单轮调用，由子类实现。
+
+        Yields:
+            - ("delta", str): 本轮的文本增量，应在模型产出时立即返回
+            - ("tool_call", ToolCall): 本轮请求的工具调用
+            - ("usage", Dict[str, int]): 本轮用量
+        allow_tools 为 False 时应要求模型直接作答，不再调用工具。
+        """
+
+    @abstractmethod
+    def _append_tool_results(self, state: Any, text: str, calls: List[ToolCall], results: List[ToolResult]) -> None:
+        """把本轮模型输出（文本与工具调用）及按顺序排列的工具结果追加到对话状态，由子类实现。"""
+
+    async def _run_tool_loop(
+        self, state: Any, tool_functions: Optional[Dict[str, callable]]
+    ) -> AsyncGenerator[Tuple[str, Union[str, Dict[str, int], List[Dict[str, Any]]]], None]:
+        """
+        与提供商无关的多轮工具调用引擎。
+
+        每一轮都以流式方式调用模型（包括工具调用之前的文本），执行该轮的全部工具调用后继续，
+        直到模型不再调用工具或达到 max_tool_rounds；达到上限后的最后一轮要求模型直接作答。
+        用量在所有轮次间累加，最后统一返回。
+        """
+        self.in_flight += 1
+        try:
+            usage: Optional[Dict[str, int]] = None
+            rounds = 0
+            while True:
+                allow_tools = bool(tool_functions) and rounds < self.max_tool_rounds
+                pieces: List[str] = []
+                calls: List[ToolCall] = []
+                async for kind, data in self._stream_round(state, allow_tools):
+                    if kind == "delta":
+                        pieces.append(data)
+                        yield "delta", data
+                    elif kind == "tool_call":
+                        calls.append(data)
+                    elif kind == "usage":
+                        usage = merge_usage(usage, data)
+                text = "".join(pieces)
+                yield "final", text
+                if not calls or not allow_tools:
+                    break
+
+                rounds += 1
+                yield "tool_calls", [{"id": call.id, "name": call.name, "arguments": call.arguments} for call in calls]
+                results = await execute_tool_calls(calls, tool_functions)
+                self._append_tool_results(state, text, calls, results)
+
+            if usage:
+                yield "usage", usage
+        finally:
+            self.in_flight -= 1
@@ -1,11 +1,20 @@
 # backend/app/llm_providers/factory.py
-from typing import Any, Dict, Type
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple, Type
 
-from .base import LLMProvider
+from ..config_store import config_store
+from .base import DEFAULT_MAX_TOOL_ROUNDS, LLMProvider
 from .openai_provider import OpenAIProvider
 from .google_provider import GoogleProvider
 from .anthropic_provider import AnthropicProvider
 from .xai_provider import XAIProvider
+from .router import RoutedProvider, RouteTarget, backend_health
 
 # A mapping from provider names in the config to their corresponding class.
 PROVIDER_MAP: Dict[str, Type[LLMProvider]] = {
@@ -15,9 +24,185 @@ PROVIDER_MAP: Dict[str, Type[LLMProvider]] = {
     "grok": XAIProvider,
 }
 
+logger = logging.getLogger(__name__)
+
+# Config keys a provider reads in __init__; anything else in the config does not affect the instance.
+PROVIDER_BASE_URL_KEYS: Dict[str, str] = {
+    "openai": "openai_base_url",
+    "anthropic": "anthropic_base_url",
+    "grok": "grok_base_url",
+}
+
+PROVIDER_CLOSE_POLL_SECONDS = 1.0
+# An evicted provider still streaming after this long is closed anyway.
+PROVIDER_CLOSE_MAX_WAIT_SECONDS = 600.0
+
+
+async def _close_when_idle(provider: LLMProvider) -> None:
+    deadline = time.monotonic() + PROVIDER_CLOSE_MAX_WAIT_SECONDS
+    while provider.in_flight > 0 and time.monotonic() < deadline:
+        await asyncio.sleep(PROVIDER_CLOSE_POLL_SECONDS)
+    await provider.aclose()
+
+
+def _resolve_provider_name(config: Dict[str, Any]) -> str:
+    provider_name = (config.get("llm_provider") or "openai").lower()
+    if provider_name == "xai":
+        provider_name = "grok"
+    return provider_name
+
+
+class ProviderRegistry:
+    """
+    Keeps warm provider instances so SDK clients and their keep-alive connection pools are
+    reused across replies, plugin calls and OCR calls.
+
+    Entries are keyed by (provider, base urls, api key hash, model params). Providers are
+    stateless between calls, so one instance can serve concurrent requests. When the config
+    version changes the registry is cleared; requests still streaming on an evicted client
+    keep their reference and finish normally, after which the client and its connection
+    pool are closed.
+    """
+
+    def __init__(self, max_entries: int = 16):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple, LLMProvider]" = OrderedDict()
+        self._config_version: Optional[int] = None
+        self._lock = threading.Lock()
+        # Evicted while no event loop was running; closed on the next call from the loop.
+        self._retired: List[LLMProvider] = []
+        self._closing: Dict[asyncio.Task, LLMProvider] = {}
+
+    @staticmethod
+    def make_key(provider_name: str, config: Dict[str, Any]) -> Tuple:
+        api_key = str(config.get("api_key") or "")
+        api_key_hash = hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+        base_url_key = PROVIDER_BASE_URL_KEYS.get(provider_name)
+        custom_parameters = json.dumps(config.get("custom_parameters", []), sort_keys=True, default=str)
+        return (
+            provider_name,
+            config.get("base_url") or "",
+            (config.get(base_url_key) or "") if base_url_key else "",
+            api_key_hash,
+            config.get("model_name") or "",
+            bool(config.get("stream_response", True)),
+            int(config.get("llm_max_tool_rounds", DEFAULT_MAX_TOOL_ROUNDS)),
+            custom_parameters,
+        )
+
+    def get(self, provider_name: str, provider_class: Type[LLMProvider], config: Dict[str, Any]) -> LLMProvider:
+        key = self.make_key(provider_name, config)
+        version = config_store.version
+        evicted: List[LLMProvider] = []
+        with self._lock:
+            if version != self._config_version:
+                if self._entries:
+                    logger.info(f"Config changed (v{self._config_version} -> v{version}); evicting {len(self._entries)} cached LLM provider(s).")
+                evicted.extend(self._entries.values())
+                self._entries.clear()
+                self._config_version = version
+            provider = self._entries.get(key)
+            if provider is not None:
+                self._entries.move_to_end(key)
+        self._retire(evicted)
+        if provider is not None:
+            return provider
+
+        provider = provider_class(config)
+        evicted = []
+        with self._lock:
+            existing = self._entries.get(key)
+            if existing is None:
+                self._entries[key] = provider
+                while len(self._entries) > self.max_entries:
+                    evicted.append(self._entries.popitem(last=False)[1])
+        if existing is not None:
+            self._retire([provider])
+            return existing
+        self._retire(evicted)
+        return provider
+
+    def _retire(self, providers: List[LLMProvider]) -> None:
+        """Close evicted providers' clients once their in-flight streams have finished."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            with self._lock:
+                self._retired.extend(providers)
+            return
+        with self._lock:
+            providers, self._retired = self._retired + providers, []
+        for provider in providers:
+            task = loop.create_task(_close_when_idle(provider))
+            self._closing[task] = provider
+            task.add_done_callback(lambda done: self._closing.pop(done, None))
+
+    def clear(self) -> None:
+        with self._lock:
+            evicted = list(self._entries.values())
+            self._entries.clear()
+        self._retire(evicted)
+
+    async def aclose(self) -> None:
+        """Close every cached and retired client; called on shutdown."""
+        with self._lock:
+            providers = list(self._entries.values()) + self._retired
+            self._entries.clear()
+            self._retired = []
+        for task, provider in list(self._closing.items()):
+            task.cancel()
+            providers.append(provider)
+        for provider in providers:
+            await provider.aclose()
+
+
+provider_registry = ProviderRegistry()
+
+
+def _backend_label(provider_name: str, config: Dict[str, Any]) -> str:
+    base_url_key = PROVIDER_BASE_URL_KEYS.get(provider_name)
+    base_url = (config.get(base_url_key) if base_url_key else None) or config.get("base_url") or "default"
+    return f"{provider_name}:{config.get('model_name') or '?'}@{base_url}"
+
+
+def _fallback_config(config: Dict[str, Any], target: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Config for one `llm_fallback_targets` entry. Blank fields inherit from the main backend
+    when the entry uses the same provider; for another provider they stay unset.
+    """
+    main_provider = _resolve_provider_name(config)
+    provider_name = _resolve_provider_name({"llm_provider": target.get("provider") or main_provider})
+    same_provider = provider_name == main_provider
+
+    target_config = {key: value for key, value in config.items() if key != "llm_fallback_targets"}
+    target_config["llm_provider"] = provider_name
+    target_config["model_name"] = target.get("model_name") or (config.get("model_name") if same_provider else "")
+    target_config["api_key"] = target.get("api_key") or (config.get("api_key") if same_provider else "")
+    base_url = target.get("base_url")
+    if base_url or not same_provider:
+        target_config["base_url"] = base_url or None
+        for key in PROVIDER_BASE_URL_KEYS.values():
+            target_config[key] = base_url or None
+    return target_config
+
+
+def _route_target(provider_name: str, config: Dict[str, Any]) -> RouteTarget:
+    provider_class = PROVIDER_MAP.get(provider_name)
+    if not provider_class:
+        raise ValueError(f"Unsupported LLM provider: '{provider_name}'. "
+                         f"Supported providers are: {list(PROVIDER_MAP.keys())}")
+    label = _backend_label(provider_name, config)
+    health = backend_health.get(ProviderRegistry.make_key(provider_name, config), label)
+    return RouteTarget(label, provider_registry.get(provider_name, provider_class, config), health)
+
+
 def get_llm_provider(config: Dict[str, Any]) -> LLMProvider:
     """
     Factory function to get an instance of the appropriate LLM provider.
+    Instances are shared through `provider_registry`, so repeated calls with an
+    equivalent config reuse the same warm SDK client. When `llm_fallback_targets`
+    lists further backends, the result is a RoutedProvider that fails over (and
+    optionally hedges) from the main backend to them in order.
 
     Args:
         config (Dict[str, Any]): The part of the bot configuration relevant to the LLM.
@@ -28,14 +213,28 @@ def get_llm_provider(config: Dict[str, Any]) -> LLMProvider:
     Raises:
         ValueError: If the specified provider is not supported.
     """
-    provider_name = config.get("llm_provider", "openai").lower()
-    if provider_name == "xai":
-        provider_name = "grok"
-    
+    provider_name = _resolve_provider_name(config)
+
     provider_class = PROVIDER_MAP.get(provider_name)
     
     if not provider_class:
         raise ValueError(f"Unsupported LLM provider: '{provider_name}'. "
                          f"Supported providers are: {list(PROVIDER_MAP.keys())}")
-                         
-    return provider_class(config)
+
+    fallback_targets = [target for target in config.get("llm_fallback_targets") or [] if isinstance(target, dict)]
+    if not fallback_targets:
+        return provider_registry.get(provider_name, provider_class, config)
+
+    targets = [_route_target(provider_name, config)]
+    for target in fallback_targets:
+        target_config = _fallback_config(config, target)
+        if not target_config.get("model_name") or not target_config.get("api_key"):
+            logger.warning(f"Skipping LLM fallback backend without model name or API key: {target.get('provider')!r}.")
+            continue
+        try:
+            targets.append(_route_target(target_config["llm_provider"], target_config))
+        except ValueError as e:
+            logger.warning(f"Skipping LLM fallback backend: {e}")
+    if len(targets) == 1:
+        return targets[0].provider
+    return RoutedProvider(config, targets)
@@ -6,12 +6,13 @@ from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple, Union
 from google import genai
 from google.genai import types
 
-from .base import LLMProvider
+from .base import ToolLoopProvider
+from .tool_executor import ToolCall, ToolResult
 
 logger = logging.getLogger(__name__)
 
 
-class GoogleProvider(LLMProvider):
+class GoogleProvider(ToolLoopProvider):
     """
     LLMProvider implementation for Google's Gemini API via google-genai SDK.
     """
@@ -154,57 +155,31 @@ class GoogleProvider(LLMProvider):
         function_calls = getattr(response, "function_calls", None)
         return list(function_calls or [])
 
-    def _append_tool_call_turns(
-        self, contents: List[types.Content], function_calls: List[Any], tool_functions: Dict[str, callable]
-    ) -> List[types.Content]:
-        model_parts: List[types.Part] = []
-        tool_parts: List[types.Part] = []
-
-        for function_call in function_calls:
-            fn_name = getattr(function_call, "name", None)
-            fn_args = dict(getattr(function_call, "args", {}) or {})
-            if not fn_name:
-                continue
+    def _append_tool_results(
+        self, state: Dict[str, Any], text: str, calls: List[ToolCall], results: List[ToolResult]
+    ) -> None:
+        model_parts: List[types.Part] = [types.Part.from_text(text=text)] if text else []
+        model_parts.extend(types.Part.from_function_call(name=call.name, args=call.arguments) for call in calls)
 
-            model_parts.append(types.Part.from_function_call(name=fn_name, args=fn_args))
-
-            function_to_call = tool_functions.get(fn_name)
-            if function_to_call:
+        tool_parts: List[types.Part] = []
+        for result in results:
+            if not result.ok:
+                parsed_result: Any = {"error": result.error}
+            elif isinstance(result.output, str):
                 try:
-                    logger.info("Executing tool '%s' with args: %s", fn_name, fn_args)
-                    function_result = function_to_call(**fn_args)
-                    parsed_result: Any = function_result
-                    if isinstance(function_result, str):
-                        try:
-                            parsed_result = json.loads(function_result)
-                        except Exception:
-                            parsed_result = {"result": function_result}
-                    elif not isinstance(function_result, dict):
-                        parsed_result = {"result": function_result}
-
-                    tool_parts.append(
-                        types.Part.from_function_response(name=fn_name, response=parsed_result)
-                    )
-                except Exception as tool_error:
-                    logger.error("Error executing tool %s: %s", fn_name, tool_error)
-                    tool_parts.append(
-                        types.Part.from_function_response(
-                            name=fn_name, response={"error": str(tool_error)}
-                        )
-                    )
+                    parsed_result = json.loads(result.output)
+                except Exception:
+                    parsed_result = {"result": result.output}
+            elif not isinstance(result.output, dict):
+                parsed_result = {"result": result.output}
             else:
-                tool_parts.append(
-                    types.Part.from_function_response(
-                        name=fn_name, response={"error": f"Tool '{fn_name}' not found."}
-                    )
-                )
+                parsed_result = result.output
+
+            tool_parts.append(types.Part.from_function_response(name=result.call.name, response=parsed_result))
 
-        updated_contents = list(contents)
-        if model_parts:
-            updated_contents.append(types.Content(role="model", parts=model_parts))
+        state["contents"].append(types.Content(role="model", parts=model_parts))
         if tool_parts:
-            updated_contents.append(types.Content(role="user", parts=tool_parts))
-        return updated_contents
+            state["contents"].append(types.Content(role="user", parts=tool_parts))
 
     async def _generate_non_stream(self, model: str, contents: List[types.Content], config: types.GenerateContentConfig) -> Any:
         return await self.client.aio.models.generate_content(model=model, contents=contents, config=config)
@@ -217,6 +192,55 @@ class GoogleProvider(LLMProvider):
         ):
             yield chunk
 
+    def _round_config(self, state: Dict[str, Any], allow_tools: bool) -> types.GenerateContentConfig:
+        config = state["config"]
+        if allow_tools or not config.tools:
+            return config
+        # Keep the declarations (the history references them) but force a text answer.
+        return config.model_copy(
+            update={"tool_config": types.ToolConfig(function_calling_config=types.FunctionCallingConfig(mode="NONE"))}
+        )
+
+    def _function_calls(self, response: Any) -> List[ToolCall]:
+        calls: List[ToolCall] = []
+        for function_call in self._extract_function_calls(response):
+            fn_name = getattr(function_call, "name", None)
+            if fn_name:
+                calls.append(ToolCall(getattr(function_call, "id", None), fn_name, dict(getattr(function_call, "args", {}) or {})))
+        return calls
+
+    async def _stream_round(self, state: Dict[str, Any], allow_tools: bool) -> AsyncGenerator[Tuple[str, Any], None]:
+        config = self._round_config(state, allow_tools)
+
+        if not self.stream:
+            response = await self._generate_non_stream(self.model, state["contents"], config)
+            text = self._extract_text_from_response(response)
+            if text:
+                yield "delta", text
+            for call in self._function_calls(response):
+                yield "tool_call", call
+            usage = self._extract_usage(response)
+            if usage:
+                yield "usage", usage
+            return
+
+        latest_usage: Optional[Dict[str, int]] = None
+        calls: List[ToolCall] = []
+        async for chunk in self._generate_stream(self.model, state["contents"], config):
+            chunk_usage = self._extract_usage(chunk)
+            if chunk_usage:
+                latest_usage = chunk_usage
+
+            chunk_text = self._extract_text_from_response(chunk)
+            if chunk_text:
+                yield "delta", chunk_text
+            calls.extend(self._function_calls(chunk))
+
+        for call in calls:
+            yield "tool_call", call
+        if latest_usage:
+            yield "usage", latest_usage
+
     async def get_response_stream(
         self,
         messages: List[Dict[str, Any]],
@@ -233,61 +257,9 @@ class GoogleProvider(LLMProvider):
                 yield "final", self._handle_error(Exception("No valid message content to send."))
                 return
 
-            combined_usage: Optional[Dict[str, int]] = None
-
-            if genai_tools and tool_functions:
-                first_response = await self._generate_non_stream(self.model, contents, config)
-                first_usage = self._extract_usage(first_response)
-                if first_usage:
-                    combined_usage = dict(first_usage)
-
-                function_calls = self._extract_function_calls(first_response)
-                if function_calls:
-                    contents = self._append_tool_call_turns(contents, function_calls, tool_functions)
-
-            if self.stream:
-                full_response = ""
-                latest_usage: Optional[Dict[str, int]] = None
-                async for chunk in self._generate_stream(self.model, contents, config):
-                    chunk_usage = self._extract_usage(chunk)
-                    if chunk_usage:
-                        latest_usage = chunk_usage
-
-                    chunk_text = self._extract_text_from_response(chunk)
-                    if chunk_text:
-                        full_response += chunk_text
-                        yield "partial", full_response
-
-                yield "final", full_response
-
-                final_usage = latest_usage
-                if combined_usage and final_usage:
-                    final_usage = {
-                        "input_tokens": combined_usage["input_tokens"] + final_usage["input_tokens"],
-                        "output_tokens": combined_usage["output_tokens"] + final_usage["output_tokens"],
-                    }
-                elif combined_usage:
-                    final_usage = combined_usage
-
-                if final_usage:
-                    yield "usage", final_usage
-                return
-
-            final_response = await self._generate_non_stream(self.model, contents, config)
-            final_text = self._extract_text_from_response(final_response)
-            yield "final", final_text
-
-            final_usage = self._extract_usage(final_response)
-            if combined_usage and final_usage:
-                final_usage = {
-                    "input_tokens": combined_usage["input_tokens"] + final_usage["input_tokens"],
-                    "output_tokens": combined_usage["output_tokens"] + final_usage["output_tokens"],
-                }
-            elif not final_usage:
-                final_usage = combined_usage
-
-            if final_usage:
-                yield "usage", final_usage
+            state = {"contents": contents, "config": config}
+            async for response_type, data in self._run_tool_loop(state, tool_functions if genai_tools else None):
+                yield response_type, data
 
         except Exception as e:
             yield "final", self._handle_error(e)
@@ -1,15 +1,15 @@
 # backend/app/lll_providers/openai_provider.py
 import openai
 import base64
-import json
 import logging
 from typing import Any, Dict, List, AsyncGenerator, Tuple, Optional, Union
 
-from .base import LLMProvider
+from .base import ToolLoopProvider
+from .tool_executor import ToolCall, ToolResult
 
 logger = logging.getLogger(__name__)
 
-class OpenAIProvider(LLMProvider):
+class OpenAIProvider(ToolLoopProvider):
     """
     LLMProvider implementation for OpenAI's API.
     """
@@ -40,117 +40,85 @@ class OpenAIProvider(LLMProvider):
         prepared_messages[-1] = {"role": last_message["role"], "content": content}
         return prepared_messages
 
-    async def get_response_stream(
-        self,
-        messages: List[Dict[str, Any]],
-        images: Optional[List[bytes]] = None,
-        tools: Optional[List[Dict[str, Any]]] = None,
-        tool_functions: Optional[Dict[str, callable]] = None
-    ) -> AsyncGenerator[Tuple[str, Union[str, Dict[str, int]]], None]:
-        
-        llm_messages = self._prepare_messages(messages, images)
+    async def _stream_round(self, state: Dict[str, Any], allow_tools: bool) -> AsyncGenerator[Tuple[str, Any], None]:
         api_kwargs = {
             "model": self.model,
-            "messages": llm_messages,
+            "messages": state["messages"],
             "stream": self.stream,
             **self.custom_params
         }
-        if tools:
-            api_kwargs["tools"] = tools
-            api_kwargs["tool_choice"] = "auto"
+        if state["tools"]:
+            api_kwargs["tools"] = state["tools"]
+            api_kwargs["tool_choice"] = "auto" if allow_tools else "none"
 
-        try:
-            response = await self.client.chat.completions.create(**api_kwargs)
-            
-            if self.stream:
-                full_response = ""
-                tool_calls = []
-                full_response = ""
-                tool_calls = []
-                usage = None # Initialize usage
-                
-                async for chunk in response:
-                    if hasattr(chunk, 'usage') and chunk.usage:
-                        usage = chunk.usage
-                    
-                    if chunk.choices:
-                        delta = chunk.choices[0].delta
-                        if delta and delta.content:
-                            full_response += delta.content
-                            yield "partial", full_response
-                        
-                        if delta and delta.tool_calls:
-                            for tool_call_chunk in delta.tool_calls:
-                                if len(tool_calls) <= tool_call_chunk.index:
-                                    tool_calls.append({"id": "", "type": "function", "function": {"name": "", "arguments": ""}})
-                                tc = tool_calls[tool_call_chunk.index]
-                                if tool_call_chunk.id: tc["id"] = tool_call_chunk.id
-                                if tool_call_chunk.function.name: tc["function"]["name"] = tool_call_chunk.function.name
-                                if tool_call_chunk.function.arguments: tc["function"]["arguments"] += tool_call_chunk.function.arguments
-                
-                yield "final", full_response
+        response = await self.client.chat.completions.create(**api_kwargs)
 
-                if usage:
-                    yield "usage", {"input_tokens": usage.prompt_tokens, "output_tokens": usage.completion_tokens}
+        if not self.stream:
+            response_message = response.choices[0].message
+            if response_message.content:
+                yield "delta", response_message.content
+            for tool_call in response_message.tool_calls or []:
+                yield "tool_call", ToolCall(tool_call.id, tool_call.function.name, tool_call.function.arguments)
+            if response.usage:
+                yield "usage", {"input_tokens": response.usage.prompt_tokens, "output_tokens": response.usage.completion_tokens}
+            return
 
-                if tool_calls and tool_functions:
-                    llm_messages.append({ "role": "assistant", "tool_calls": tool_calls })
-                    
-                    for tool_call in tool_calls:
-                        function_name = tool_call['function']['name']
-                        function_to_call = tool_functions.get(function_name)
-                        try:
-                            function_args = json.loads(tool_call['function']['arguments'])
-                            function_response = function_to_call(**function_args)
-                            llm_messages.append({ "tool_call_id": tool_call['id'], "role": "tool", "name": function_name, "content": function_response })
-                        except Exception as e:
-                            logger.error(f"Error executing tool {function_name}: {e}")
-                            llm_messages.append({ "tool_call_id": tool_call['id'], "role": "tool", "name": function_name, "content": f"Error: {e}" })
-                    
-                    api_kwargs["messages"] = llm_messages
-                    api_kwargs["stream"] = False
-                    
-                    second_response = await self.client.chat.completions.create(**api_kwargs)
-                    content = second_response.choices[0].message.content
-                    yield "final", content if content else ""
-                    
-                    if second_response.usage:
-                        # Combine usage data from both calls
-                        total_input = (usage.prompt_tokens if usage else 0) + second_response.usage.prompt_tokens
-                        total_output = (usage.completion_tokens if usage else 0) + second_response.usage.completion_tokens
-                        yield "usage", {"input_tokens": total_input, "output_tokens": total_output}
-                    return
+        tool_calls: List[Dict[str, str]] = []
+        usage = None
+        async for chunk in response:
+            if hasattr(chunk, 'usage') and chunk.usage:
+                usage = chunk.usage
 
-            else: # Non-streaming mode
-                response_message = response.choices[0].message
-                total_usage = response.usage
+            if chunk.choices:
+                delta = chunk.choices[0].delta
+                if delta and delta.content:
+                    yield "delta", delta.content
 
-                if response_message.tool_calls and tool_functions:
-                    llm_messages.append(response_message)
-                    
-                    for tool_call in response_message.tool_calls:
-                        function_name = tool_call.function.name
-                        function_to_call = tool_functions.get(function_name)
-                        try:
-                            function_args = json.loads(tool_call.function.arguments)
-                            function_response = function_to_call(**function_args)
-                            llm_messages.append({ "tool_call_id": tool_call.id, "role": "tool", "name": function_name, "content": function_response })
-                        except Exception as e:
-                             llm_messages.append({ "tool_call_id": tool_call.id, "role": "tool", "name": function_name, "content": f"Error: {e}"})
+                if delta and delta.tool_calls:
+                    for tool_call_chunk in delta.tool_calls:
+                        while len(tool_calls) <= tool_call_chunk.index:
+                            tool_calls.append({"id": "", "name": "", "arguments": ""})
+                        tc = tool_calls[tool_call_chunk.index]
+                        if tool_call_chunk.id: tc["id"] = tool_call_chunk.id
+                        if tool_call_chunk.function and tool_call_chunk.function.name: tc["name"] = tool_call_chunk.function.name
+                        if tool_call_chunk.function and tool_call_chunk.function.arguments: tc["arguments"] += tool_call_chunk.function.arguments
 
-                    second_response = await self.client.chat.completions.create(model=self.model, messages=llm_messages, stream=False, **self.custom_params)
-                    content = second_response.choices[0].message.content
-                    yield "final", content if content else ""
-                    
-                    if second_response.usage:
-                        total_usage.prompt_tokens += second_response.usage.prompt_tokens
-                        total_usage.completion_tokens += second_response.usage.completion_tokens
-                else:
-                    content = response_message.content
-                    yield "final", content if content else ""
+        for tc in tool_calls:
+            if tc["name"]:
+                yield "tool_call", ToolCall(tc["id"], tc["name"], tc["arguments"])
+        if usage:
+            yield "usage", {"input_tokens": usage.prompt_tokens, "output_tokens": usage.completion_tokens}
 
-                if total_usage:
-                    yield "usage", {"input_tokens": total_usage.prompt_tokens, "output_tokens": total_usage.completion_tokens}
+    def _append_tool_results(self, state: Dict[str, Any], text: str, calls: List[ToolCall], results: List[ToolResult]) -> None:
+        state["messages"].append({
+            "role": "assistant",
+            "content": text or None,
+            "tool_calls": [
+                {"id": call.id, "type": "function", "function": {"name": call.name, "arguments": call.arguments or "{}"}}
+                for call in calls
+            ],
+        })
+        # One 'tool' message per executed call, in call order.
+        for result in results:
+            state["messages"].append({
+                "tool_call_id": result.call.id,
+                "role": "tool",
+                "name": result.call.name,
+                "content": result.output if result.ok else f"Error: {result.error}",
+            })
 
+    async def get_response_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        images: Optional[List[bytes]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_functions: Optional[Dict[str, callable]] = None
+    ) -> AsyncGenerator[Tuple[str, Union[str, Dict[str, int]]], None]:
+        
+        # A private copy: tool rounds append to it and callers may retry with the same messages.
+        state = {"messages": list(self._prepare_messages(messages, images)), "tools": tools or None}
+        try:
+            async for response_type, data in self._run_tool_loop(state, tool_functions if tools else None):
+                yield response_type, data
         except Exception as e:
-            yield "final", self._handle_error(e)
+            yield "final", self._handle_error(e)
@@ -0,0 +1,343 @@
+# backend/app/llm_providers/router.py
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncGenerator, Deque, Dict, List, NamedTuple, Optional, Tuple, Union
+
+from .base import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+ERROR_PREFIX = "LLM_PROVIDER_ERROR"
+
+# Circuit breaker: a backend is taken out of rotation when, over its last
+# BREAKER_WINDOW calls, the error rate or the p95 time-to-first-token is too high.
+BREAKER_WINDOW = 20
+BREAKER_MIN_SAMPLES = 5
+BREAKER_ERROR_RATE = 0.5
+BREAKER_SLOW_SECONDS = 30.0
+BREAKER_COOLDOWN_SECONDS = 30.0
+
+# Hedging: if the first token has not arrived by the backend's p95 time-to-first-token,
+# a duplicate request goes to the next backend and whichever answers first wins.
+HEDGE_DEFAULT_DELAY_SECONDS = 4.0
+HEDGE_MIN_DELAY_SECONDS = 0.5
+HEDGE_MAX_DELAY_SECONDS = 15.0
+HEDGE_MIN_SAMPLES = 5
+
+
+def _p95(values) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+
+
+def _is_error_event(event: Tuple[str, Any]) -> bool:
+    return event[0] == "final" and str(event[1] or "").startswith(ERROR_PREFIX)
+
+
+class BackendHealth:
+    """
+    Rolling health of one backend: outcomes and first-token latencies of its recent calls,
+    and the circuit breaker state derived from them.
+
+    closed -> open when the window's error rate or p95 latency crosses the thresholds;
+    open -> half_open after the cooldown, letting exactly one probe request through;
+    half_open -> closed if the probe succeeds, back to open if it fails.
+    """
+
+    def __init__(self, label: str):
+        self.label = label
+        self.state = "closed"
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._outcomes: Deque[bool] = deque(maxlen=BREAKER_WINDOW)
+        self._first_token: Deque[float] = deque(maxlen=BREAKER_WINDOW)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= BREAKER_COOLDOWN_SECONDS:
+                self.state = "half_open"
+                self._probe_in_flight = False
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def first_token_deadline(self) -> float:
+        with self._lock:
+            if len(self._first_token) < HEDGE_MIN_SAMPLES:
+                return HEDGE_DEFAULT_DELAY_SECONDS
+            p95 = _p95(self._first_token)
+        return min(HEDGE_MAX_DELAY_SECONDS, max(HEDGE_MIN_DELAY_SECONDS, p95))
+
+    def record_first_token(self, seconds: float) -> None:
+        with self._lock:
+            self._first_token.append(seconds)
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self.calls += 1
+            if not ok:
+                self.failures += 1
+            if self.state == "half_open":
+                self._probe_in_flight = False
+                if ok:
+                    logger.info(f"LLM backend {self.label} recovered; closing its circuit.")
+                    self.state = "closed"
+                    self._outcomes.clear()
+                    self._first_token.clear()
+                else:
+                    self._trip("probe failed")
+                return
+            self._outcomes.append(ok)
+            if self.state != "closed" or len(self._outcomes) < BREAKER_MIN_SAMPLES:
+                return
+            error_rate = self._outcomes.count(False) / len(self._outcomes)
+            p95 = _p95(self._first_token)
+            if error_rate >= BREAKER_ERROR_RATE:
+                self._trip(f"error rate {error_rate:.0%}")
+            elif p95 is not None and len(self._first_token) >= BREAKER_MIN_SAMPLES and p95 > BREAKER_SLOW_SECONDS:
+                self._trip(f"p95 first token {p95:.1f}s")
+
+    def record_hedge_win(self) -> None:
+        with self._lock:
+            self.hedges_won += 1
+
+    def release_probe(self) -> None:
+        """A half-open probe was abandoned (e.g. it lost a hedge race) without an outcome."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def _trip(self, reason: str) -> None:
+        logger.warning(f"Opening circuit for LLM backend {self.label}: {reason}.")
+        self.state = "open"
+        self.opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            p95 = _p95(self._first_token)
+            return {
+                "backend": self.label,
+                "state": self.state,
+                "calls": self.calls,
+                "failures": self.failures,
+                "hedges_won": self.hedges_won,
+                "recent_error_rate": round(self._outcomes.count(False) / len(self._outcomes), 3) if self._outcomes else 0.0,
+                "p95_first_token_seconds": round(p95, 3) if p95 is not None else None,
+            }
+
+
+class BackendHealthRegistry:
+    """Health is kept per backend identity so it survives provider cache evictions and config saves."""
+
+    def __init__(self):
+        self._entries: Dict[Tuple, BackendHealth] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple, label: str) -> BackendHealth:
+        with self._lock:
+            health = self._entries.get(key)
+            if health is None:
+                health = self._entries[key] = BackendHealth(label)
+            return health
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._entries.values())
+        return [health.snapshot() for health in entries]
+
+
+backend_health = BackendHealthRegistry()
+
+
+class RouteTarget(NamedTuple):
+    label: str
+    provider: LLMProvider
+    health: BackendHealth
+
+
+class _Attempt:
+    """One in-flight call to a backend, waiting for its first event."""
+
+    def __init__(self, target: RouteTarget, stream: AsyncGenerator, hedge: bool = False, probe: bool = False):
+        self.target = target
+        self.stream = stream
+        self.hedge = hedge
+        # True when this call is the half-open backend's single probe; abandoning it must free the slot.
+        self.probe = probe
+        self.started = time.monotonic()
+        self.task = asyncio.ensure_future(self._first_event())
+
+    async def _first_event(self) -> Optional[Tuple[str, Any]]:
+        try:
+            return await self.stream.__anext__()
+        except StopAsyncIteration:
+            return None
+
+    def outcome(self) -> Tuple[Optional[Tuple[str, Any]], Optional[str]]:
+        """(first event, None) on success, (None, error text) if the backend failed before answering."""
+        try:
+            event = self.task.result()
+        except Exception as e:
+            return None, f"{ERROR_PREFIX}: {self.target.label} raised: {e}"
+        if event is None:
+            return None, f"{ERROR_PREFIX}: {self.target.label} returned an empty response."
+        if _is_error_event(event):
+            return None, str(event[1])
+        return event, None
+
+    def abandon_probe(self) -> None:
+        if self.probe:
+            self.target.health.release_probe()
+
+    async def cancel(self) -> None:
+        if not self.task.done():
+            self.task.cancel()
+            try:
+                await self.task
+            except (asyncio.CancelledError, Exception):
+                pass
+        try:
+            await self.stream.aclose()
+        except Exception:
+            pass
+
+
+class RoutedProvider(LLMProvider):
+    """
+    Routes a request across an ordered list of backends.
+
+    Backends whose circuit is open are skipped. A backend that fails before producing its first
+    event is abandoned and the next one is tried; once a backend has started answering it owns
+    the reply, since its text may already be on screen and its tool calls may already have run.
+    With hedging enabled, a backend that stays silent past its p95 time-to-first-token gets a
+    duplicate request sent to the next backend and the first to answer wins; the loser is
+    cancelled, though any tokens it already consumed upstream are still billed.
+    """
+
+    def __init__(self, config: Dict[str, Any], targets: List[RouteTarget]):
+        super().__init__(config)
+        if not targets:
+            raise ValueError("RoutedProvider needs at least one backend.")
+        self.targets = targets
+        self.hedge_enabled = bool(config.get("llm_hedge_enabled", False))
+
+    @staticmethod
+    def _take(pending: List[RouteTarget], bypass: bool) -> Tuple[Optional[RouteTarget], bool]:
+        """
+        Pop the next backend allowed to run and whether it is a half-open probe. The breaker is
+        only asked right before a launch, so backends that are never called hold no probe slot.
+        """
+        while pending:
+            target = pending.pop(0)
+            if bypass:
+                return target, False
+            if target.health.allow():
+                return target, target.health.state == "half_open"
+        return None, False
+
+    async def get_response_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        images: Optional[List[bytes]] = None,
+        tools: Optional[List[Dict[str, Any]]] = None,
+        tool_functions: Optional[Dict[str, callable]] = None
+    ) -> AsyncGenerator[Tuple[str, Union[str, Dict[str, int]]], None]:
+
+        def launch(target: RouteTarget, probe: bool, hedge: bool = False) -> _Attempt:
+            return _Attempt(target, target.provider.get_response_stream(messages, images, tools, tool_functions), hedge, probe)
+
+        pending = list(self.targets)
+        bypass = False
+        launched = 0
+        attempts: List[_Attempt] = []
+        winner: Optional[_Attempt] = None
+        first_event: Optional[Tuple[str, Any]] = None
+        last_error = f"{ERROR_PREFIX}: no LLM backend available."
+        recorded = False
+        try:
+            while winner is None:
+                if not attempts:
+                    target, probe = self._take(pending, bypass)
+                    if target is None and not launched:
+                        # Every circuit is open: trying in priority order beats refusing outright.
+                        logger.warning("All LLM backend circuits are open; trying every backend in order.")
+                        bypass, pending = True, list(self.targets)
+                        target, probe = self._take(pending, bypass)
+                    if target is None:
+                        break
+                    attempts.append(launch(target, probe))
+                    launched += 1
+
+                timeout = None
+                if self.hedge_enabled and pending and len(attempts) == 1:
+                    deadline = attempts[0].started + attempts[0].target.health.first_token_deadline()
+                    timeout = max(0.0, deadline - time.monotonic())
+                done, _ = await asyncio.wait([attempt.task for attempt in attempts], timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedge, probe = self._take(pending, bypass)
+                    if hedge is not None:
+                        logger.info(f"No first token from {attempts[0].target.label} after {time.monotonic() - attempts[0].started:.2f}s; hedging to {hedge.label}.")
+                        attempts.append(launch(hedge, probe, hedge=True))
+                        launched += 1
+                    continue
+
+                for attempt in [attempt for attempt in attempts if attempt.task in done]:
+                    event, error = attempt.outcome()
+                    if error is None:
+                        winner, first_event = attempt, event
+                        break
+                    logger.warning(f"LLM backend {attempt.target.label} failed before answering; failing over. {error}")
+                    attempt.target.health.record(False)
+                    attempts.remove(attempt)
+                    await attempt.cancel()
+                    last_error = error
+
+            for attempt in attempts:
+                if attempt is not winner:
+                    attempt.abandon_probe()
+                    await attempt.cancel()
+            attempts = []
+
+            if winner is None:
+                yield "final", last_error
+                return
+
+            health = winner.target.health
+            health.record_first_token(time.monotonic() - winner.started)
+            if winner.hedge:
+                health.record_hedge_win()
+            if len(self.targets) > 1 and winner.target is not self.targets[0]:
+                logger.info(f"Reply served by fallback LLM backend {winner.target.label}.")
+            ok = True
+            yield first_event
+            async for event in winner.stream:
+                if _is_error_event(event):
+                    ok = False
+                yield event
+            health.record(ok)
+            recorded = True
+        finally:
+            for attempt in attempts:
+                attempt.abandon_probe()
+                await attempt.cancel()
+            if winner is not None:
+                if not recorded:
+                    # The caller stopped reading mid-reply; that says nothing about the backend.
+                    winner.abandon_probe()
+                try:
+                    await winner.stream.aclose()
+                except Exception:
+                    pass
@@ -0,0 +1,103 @@
+# backend/app/llm_providers/tool_executor.py
+import asyncio
+import functools
+import inspect
+import json
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+TOOL_TIMEOUT_SECONDS = 30.0
+
+
+class ToolCall(NamedTuple):
+    id: Optional[str]
+    name: str
+    # A dict, or the raw JSON string the model produced.
+    arguments: Any
+
+
+class ToolResult(NamedTuple):
+    call: ToolCall
+    output: Any = None
+    error: Optional[str] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def tool_timeout(seconds: float) -> Callable[[Callable], Callable]:
+    """Decorator giving one tool its own timeout instead of TOOL_TIMEOUT_SECONDS."""
+    def decorate(func: Callable) -> Callable:
+        func.tool_timeout = float(seconds)
+        return func
+    return decorate
+
+
+def _unwrap(func: Callable) -> Callable:
+    while isinstance(func, functools.partial):
+        func = func.func
+    return getattr(func, "__func__", func)
+
+
+def _timeout_for(func: Callable, default: float) -> float:
+    value = getattr(func, "tool_timeout", None) or getattr(_unwrap(func), "tool_timeout", None)
+    return float(value) if value else default
+
+
+def _parse_arguments(arguments: Any) -> Dict[str, Any]:
+    if arguments is None or arguments == "":
+        return {}
+    if isinstance(arguments, str):
+        arguments = json.loads(arguments)
+    if not isinstance(arguments, dict):
+        raise ValueError(f"Tool arguments must be an object, got {type(arguments).__name__}.")
+    return dict(arguments)
+
+
+async def _run_one(call: ToolCall, tool_functions: Dict[str, Callable], default_timeout: float) -> ToolResult:
+    function_to_call = tool_functions.get(call.name)
+    if function_to_call is None:
+        return ToolResult(call, error=f"Tool '{call.name}' not found.")
+    try:
+        arguments = _parse_arguments(call.arguments)
+    except Exception as e:
+        return ToolResult(call, error=f"Invalid arguments: {e}")
+
+    timeout = _timeout_for(function_to_call, default_timeout)
+    logger.info("Executing tool '%s' with args: %s", call.name, arguments)
+    try:
+        if inspect.iscoroutinefunction(_unwrap(function_to_call)):
+            output = await asyncio.wait_for(function_to_call(**arguments), timeout)
+        else:
+            # Sync tools (SQLite, difflib scans, ...) run on a worker thread so the event loop keeps
+            # streaming. A timed-out thread cannot be interrupted; its result is simply discarded.
+            output = await asyncio.wait_for(asyncio.to_thread(function_to_call, **arguments), timeout)
+            if inspect.isawaitable(output):
+                output = await asyncio.wait_for(output, timeout)
+    except asyncio.TimeoutError:
+        logger.error("Tool '%s' timed out after %.1fs", call.name, timeout)
+        return ToolResult(call, error=f"Tool '{call.name}' timed out after {timeout:g}s.")
+    except Exception as e:
+        logger.error("Error executing tool %s: %s", call.name, e)
+        return ToolResult(call, error=str(e))
+    return ToolResult(call, output=output)
+
+
+async def execute_tool_calls(
+    calls: Sequence[ToolCall],
+    tool_functions: Optional[Dict[str, Callable]],
+    default_timeout: float = TOOL_TIMEOUT_SECONDS,
+) -> List[ToolResult]:
+    """
+    Run every tool call of one model turn concurrently and return the results in call order.
+
+    Async tools run as tasks, sync tools on threads; each call is bounded by its own timeout
+    (see tool_timeout()). Failures never raise: they come back as ToolResult.error so the
+    provider can report them to the model.
+    """
+    if not calls:
+        return []
+    return list(await asyncio.gather(*(_run_one(call, tool_functions or {}, default_timeout) for call in calls)))
@@ -10,12 +10,13 @@ from xai_sdk.chat import tool_result as xai_tool_result
 from xai_sdk.proto import chat_pb2
 
 from ..xai_sdk_utils import create_xai_async_client, xai_sampling_usage_to_dict
-from .base import LLMProvider
+from .base import ToolLoopProvider
+from .tool_executor import ToolCall, ToolResult
 
 logger = logging.getLogger(__name__)
 
 
-class XAIProvider(LLMProvider):
+class XAIProvider(ToolLoopProvider):
     def __init__(self, config: Dict[str, Any]):
         super().__init__(config)
         base_url = config.get("grok_base_url") or self.base_url
@@ -149,18 +150,6 @@ class XAIProvider(LLMProvider):
 
         return kwargs
 
-    @staticmethod
-    def _merge_usage(
-        first: Optional[Dict[str, int]],
-        second: Optional[Dict[str, int]],
-    ) -> Optional[Dict[str, int]]:
-        if first and second:
-            return {
-                "input_tokens": int(first.get("input_tokens", 0)) + int(second.get("input_tokens", 0)),
-                "output_tokens": int(first.get("output_tokens", 0)) + int(second.get("output_tokens", 0)),
-            }
-        return second or first
-
     @staticmethod
     def _tool_result_payload(result: Any) -> str:
         if isinstance(result, str):
@@ -170,44 +159,64 @@ class XAIProvider(LLMProvider):
         except Exception:
             return str(result)
 
-    def _append_tool_results(self, chat: Any, response: Any, tool_functions: Dict[str, callable]) -> None:
-        chat.append(response)
+    def _append_tool_results(self, state: Dict[str, Any], text: str, calls: List[ToolCall], results: List[ToolResult]) -> None:
+        chat = state["chat"]
+        chat.append(state.pop("last_response"))
+        for result in results:
+            tool_output = result.output if result.ok else f"Error: {result.error}"
+            chat.append(
+                xai_tool_result(
+                    self._tool_result_payload(tool_output),
+                    tool_call_id=result.call.id,
+                )
+            )
 
-        for tool_call in response.tool_calls:
+    @staticmethod
+    def _tool_calls(response: Any) -> List[ToolCall]:
+        calls: List[ToolCall] = []
+        for tool_call in getattr(response, "tool_calls", None) or []:
             function_name = getattr(getattr(tool_call, "function", None), "name", None)
             raw_arguments = getattr(getattr(tool_call, "function", None), "arguments", "") or "{}"
             if not function_name:
                 continue
 
-            function_to_call = tool_functions.get(function_name)
             try:
                 function_args = json.loads(raw_arguments)
                 if not isinstance(function_args, dict):
                     function_args = {}
             except Exception:
                 function_args = {}
-
-            if function_to_call:
-                try:
-                    logger.info("Executing xAI tool '%s' with args: %s", function_name, function_args)
-                    tool_output = function_to_call(**function_args)
-                except Exception as tool_error:
-                    logger.error("Error executing xAI tool %s: %s", function_name, tool_error)
-                    tool_output = f"Error: {tool_error}"
-            else:
-                tool_output = f"Error: Tool '{function_name}' not found."
-
-            chat.append(
-                xai_tool_result(
-                    self._tool_result_payload(tool_output),
-                    tool_call_id=getattr(tool_call, "id", None),
-                )
-            )
+            calls.append(ToolCall(getattr(tool_call, "id", None), function_name, function_args))
+        return calls
 
     async def _sample_chat(self, chat: Any) -> Tuple[str, Optional[Dict[str, int]], Any]:
         response = await chat.sample()
         return response.content or "", xai_sampling_usage_to_dict(response.usage), response
 
+    async def _stream_round(self, state: Dict[str, Any], allow_tools: bool) -> AsyncGenerator[Tuple[str, Any], None]:
+        # The xAI chat object fixes its tools at creation; once the round cap is reached any
+        # further tool calls are ignored by the loop instead of being executed.
+        chat = state["chat"]
+        if self.stream:
+            response = None
+            async for streamed_response, chunk in chat.stream():
+                response = streamed_response
+                if chunk.content:
+                    yield "delta", chunk.content
+            usage = xai_sampling_usage_to_dict(response.usage) if response else None
+        else:
+            text, usage, response = await self._sample_chat(chat)
+            if text:
+                yield "delta", text
+
+        if response is None:
+            return
+        state["last_response"] = response
+        for call in self._tool_calls(response):
+            yield "tool_call", call
+        if usage:
+            yield "usage", usage
+
     async def get_response_stream(
         self,
         messages: List[Dict[str, Any]],
@@ -222,43 +231,9 @@ class XAIProvider(LLMProvider):
                 return
 
             prepared_tools = self._prepare_tools(tools) if tools and tool_functions else None
-            chat = self.client.chat.create(**self._chat_kwargs(prepared_messages, prepared_tools))
-
-            usage_data: Optional[Dict[str, int]] = None
-            if prepared_tools and tool_functions:
-                first_text, first_usage, first_response = await self._sample_chat(chat)
-                usage_data = self._merge_usage(usage_data, first_usage)
-
-                if first_response.tool_calls:
-                    self._append_tool_results(chat, first_response, tool_functions)
-                else:
-                    yield "final", first_text
-                    if usage_data:
-                        yield "usage", usage_data
-                    return
-
-            if self.stream:
-                final_response = None
-                async for streamed_response, chunk in chat.stream():
-                    final_response = streamed_response
-                    if chunk.content:
-                        yield "partial", streamed_response.content
-
-                final_text = final_response.content if final_response else ""
-                yield "final", final_text
-
-                final_usage = xai_sampling_usage_to_dict(final_response.usage) if final_response else None
-                usage_data = self._merge_usage(usage_data, final_usage)
-                if usage_data:
-                    yield "usage", usage_data
-                return
-
-            final_text, final_usage, _ = await self._sample_chat(chat)
-            yield "final", final_text
-
-            usage_data = self._merge_usage(usage_data, final_usage)
-            if usage_data:
-                yield "usage", usage_data
+            state = {"chat": self.client.chat.create(**self._chat_kwargs(prepared_messages, prepared_tools))}
+            async for response_type, data in self._run_tool_loop(state, tool_functions if prepared_tools else None):
+                yield response_type, data
 
         except Exception as e:
             yield "final", self._handle_error(e)
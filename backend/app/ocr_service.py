@@ -3,6 +3,7 @@ import re
 from typing import Any, Dict, List, Optional, Tuple
 
 from .llm_providers.factory import get_llm_provider
+from .provider_config import build_endpoint, fallback_base_url, normalize_provider
 
 logger = logging.getLogger(__name__)
 OCR_TIMEOUT_SECONDS = 15
@@ -42,46 +43,10 @@ def get_ocr_timeout_seconds(config: Dict[str, Any]) -> Optional[int]:
     return max(1, min(86400, timeout_seconds))
 
 
-def _normalize_provider(provider: str) -> str:
-    normalized = (provider or "").strip().lower()
-    if normalized in {"openai_compatible", "openai-compatible"}:
-        return "openai"
-    if normalized in {"gemini", "google"}:
-        return "google"
-    if normalized in {"anthropic_compatible", "anthropic-compatible"}:
-        return "anthropic"
-    if normalized in {"xai", "grok", "x.ai"}:
-        return "grok"
-    return normalized
-
-
-def _build_endpoint(base_url: Optional[str], port: Optional[str]) -> Optional[str]:
-    cleaned_base = str(base_url or "").strip()
-    cleaned_port = str(port or "").strip()
-    if not cleaned_base:
-        return None
-    if not cleaned_port:
-        return cleaned_base
-    normalized = cleaned_base.rstrip("/")
-    if re.search(r":\d+$", normalized):
-        return normalized
-    return f"{normalized}:{cleaned_port}"
-
-
-def _fallback_base_url(config: Dict[str, Any], normalized_provider: str) -> Optional[str]:
-    if normalized_provider == "openai":
-        return config.get("openai_base_url") or config.get("base_url")
-    if normalized_provider == "anthropic":
-        return config.get("anthropic_base_url") or config.get("base_url")
-    if normalized_provider == "grok":
-        return config.get("grok_base_url") or config.get("base_url")
-    return None
-
-
 def build_ocr_runtime_config(config: Dict[str, Any]) -> Dict[str, Any]:
     provider_raw = str(config.get("ocr_provider") or "openai").strip()
-    normalized_provider = _normalize_provider(provider_raw)
-    endpoint = _build_endpoint(config.get("ocr_base_url"), config.get("ocr_port")) or _fallback_base_url(
+    normalized_provider = normalize_provider(provider_raw)
+    endpoint = build_endpoint(config.get("ocr_base_url"), config.get("ocr_port")) or fallback_base_url(
         config, normalized_provider
     )
 
@@ -0,0 +1,40 @@
+# backend/app/provider_config.py
+import re
+from typing import Any, Dict, Optional
+
+
+def normalize_provider(provider: str) -> str:
+    normalized = (provider or "").strip().lower()
+    if normalized in {"openai_compatible", "openai-compatible"}:
+        return "openai"
+    if normalized in {"gemini", "google"}:
+        return "google"
+    if normalized in {"anthropic_compatible", "anthropic-compatible"}:
+        return "anthropic"
+    if normalized in {"xai", "grok", "x.ai"}:
+        return "grok"
+    return normalized
+
+
+def build_endpoint(base_url: Optional[str], port: Optional[str]) -> Optional[str]:
+    cleaned_base = str(base_url or "").strip()
+    cleaned_port = str(port or "").strip()
+    if not cleaned_base:
+        return None
+    if not cleaned_port:
+        return cleaned_base
+    normalized = cleaned_base.rstrip("/")
+    if re.search(r":\d+$", normalized):
+        return normalized
+    return f"{normalized}:{cleaned_port}"
+
+
+def fallback_base_url(config: Dict[str, Any], normalized_provider: str) -> Optional[str]:
+    """Base URL of the main LLM settings for `normalized_provider`, used when a feature has none of its own."""
+    if normalized_provider == "openai":
+        return config.get("openai_base_url") or config.get("base_url")
+    if normalized_provider == "anthropic":
+        return config.get("anthropic_base_url") or config.get("base_url")
+    if normalized_provider == "grok":
+        return config.get("grok_base_url") or config.get("base_url")
+    return None
@@ -0,0 +1,380 @@
+# backend/app/redis_service.py
+import asyncio
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+REDIS_MAX_CONNECTIONS = 20
+REDIS_SOCKET_TIMEOUT_SECONDS = 2.0
+REDIS_RETRY_INITIAL_SECONDS = 1.0
+REDIS_RETRY_MAX_SECONDS = 60.0
+
+MESSAGE_LOCK_PREFIX = "discord:message_lock:"
+MESSAGE_DONE_PREFIX = "discord:message_done:"
+MESSAGE_LOCK_TTL_SECONDS = 60.0
+# Once a message has been answered no instance picks it up again, even after the lock expires.
+MESSAGE_DONE_TTL_SECONDS = 6 * 3600
+# A stuck handler stops extending its lock after this long, so the lock eventually frees itself.
+MESSAGE_LOCK_MAX_HOLD_SECONDS = 15 * 60
+LOCAL_DONE_MARKERS_LIMIT = 4096
+LOCK_TIMING_SAMPLES = 512
+
+
+def _env_flag(name: str, default: str = "false") -> bool:
+    return os.getenv(name, default).strip().lower() in {"1", "true", "yes", "on"}
+
+
+class RedisService:
+    """
+    Lazily connected, pooled redis.asyncio client shared by the bot.
+
+    Nothing touches the network at import time. The first caller connects; after a failure
+    the service backs off exponentially (1s up to 60s) and callers get None until the next
+    retry, so a Redis outage costs one fast failure instead of a timeout per message.
+    """
+
+    def __init__(
+        self,
+        host: Optional[str] = None,
+        port: Optional[int] = None,
+        db: int = 0,
+        max_connections: Optional[int] = None,
+        client: Any = None,
+    ):
+        self.host = host or os.getenv("REDIS_HOST", "localhost")
+        self.port = int(port or os.getenv("REDIS_PORT", 6379))
+        self.db = db
+        self.max_connections = int(max_connections or os.getenv("REDIS_MAX_CONNECTIONS", REDIS_MAX_CONNECTIONS))
+        self.fail_fast = _env_flag("FAIL_ON_REDIS_ERROR")
+        self._client = client
+        self._client_lock = threading.Lock()
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._connected = False
+        self._failures = 0
+        self._retry_at = 0.0
+        self._last_error: Optional[str] = None
+
+    @property
+    def available(self) -> bool:
+        return self._connected
+
+    def client(self) -> Any:
+        """The pooled client itself, without a connection attempt or backoff; prefer get_client()."""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    import redis.asyncio as redis_asyncio
+
+                    pool = redis_asyncio.ConnectionPool(
+                        host=self.host,
+                        port=self.port,
+                        db=self.db,
+                        max_connections=self.max_connections,
+                        socket_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+                        socket_connect_timeout=REDIS_SOCKET_TIMEOUT_SECONDS,
+                        health_check_interval=30,
+                        decode_responses=True,
+                    )
+                    self._client = redis_asyncio.Redis(connection_pool=pool)
+        return self._client
+
+    async def get_client(self) -> Optional[Any]:
+        """A connected client, or None while Redis is unreachable and the backoff has not elapsed."""
+        if self._connected:
+            return self._client
+        if time.monotonic() < self._retry_at:
+            return None
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._connected:
+                return self._client
+            if time.monotonic() < self._retry_at:
+                return None
+            try:
+                client = self.client()
+                await client.ping()
+            except Exception as e:
+                self.mark_failure(e)
+                return None
+            self._connected = True
+            self._failures = 0
+            self._last_error = None
+            logger.info(f"Connected to Redis at {self.host}:{self.port}.")
+            return client
+
+    def mark_failure(self, error: BaseException) -> None:
+        """Record a failed command; the next get_client() waits out the backoff before reconnecting."""
+        self._connected = False
+        self._failures += 1
+        delay = min(REDIS_RETRY_MAX_SECONDS, REDIS_RETRY_INITIAL_SECONDS * (2 ** (self._failures - 1)))
+        self._retry_at = time.monotonic() + delay
+        self._last_error = str(error)
+        logger.warning(f"Redis at {self.host}:{self.port} unavailable ({error}); retrying in {delay:.0f}s.")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "host": self.host,
+            "port": self.port,
+            "connected": self._connected,
+            "consecutive_failures": self._failures,
+            "retry_in_seconds": round(max(0.0, self._retry_at - time.monotonic()), 1),
+            "last_error": self._last_error,
+            "fail_fast": self.fail_fast,
+        }
+
+    async def close(self) -> None:
+        client, self._client = self._client, None
+        self._connected = False
+        if client is None:
+            return
+        try:
+            await client.close()
+            pool = getattr(client, "connection_pool", None)
+            if pool is not None:
+                await pool.disconnect()
+        except Exception as e:
+            logger.warning(f"Error while closing Redis client: {e}")
+
+
+class _TimingStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._recent: Deque[float] = deque(maxlen=LOCK_TIMING_SAMPLES)
+
+    def add(self, elapsed_ms: float) -> None:
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        self._recent.append(elapsed_ms)
+
+    def snapshot(self) -> Dict[str, Any]:
+        recent = sorted(self._recent)
+        p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p95_ms": round(p95, 2),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+class MessageLock:
+    """A held message lock. release() must be called once processing ends."""
+
+    def __init__(self, service: "MessageLockService", message_id: str, token: str, local: bool):
+        self.service = service
+        self.message_id = message_id
+        self.token = token
+        self.local = local
+        self.acquired_at = time.perf_counter()
+        self._keepalive: Optional[asyncio.Task] = None
+        self._released = False
+
+    async def release(self, done: bool = True) -> None:
+        """Drop the lock; with done=True the message is marked answered so no instance retries it."""
+        if self._released:
+            return
+        self._released = True
+        if self._keepalive is not None:
+            self._keepalive.cancel()
+        await self.service._release(self, done)
+
+
+class MessageLockService:
+    """
+    Per-message processing lock so only one bot instance answers a triggering message.
+
+    Each lock carries a random token; it is extended while the handler runs and released
+    (compare-and-delete) when it finishes, which also leaves a "done" marker behind. When
+    Redis is unreachable the service degrades to an in-process lock, unless
+    FAIL_ON_REDIS_ERROR is set, in which case messages are skipped rather than risking
+    duplicate replies from several instances.
+    """
+
+    ACQUIRE_LUA = """
+    if redis.call('EXISTS', KEYS[2]) == 1 then
+        return 0
+    end
+    if redis.call('SET', KEYS[1], ARGV[1], 'NX', 'PX', ARGV[2]) then
+        return 1
+    end
+    return 0
+    """
+
+    EXTEND_LUA = """
+    if redis.call('GET', KEYS[1]) == ARGV[1] then
+        return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    end
+    return 0
+    """
+
+    RELEASE_LUA = """
+    local owned = redis.call('GET', KEYS[1]) == ARGV[1]
+    if owned then
+        redis.call('DEL', KEYS[1])
+    end
+    if ARGV[2] == '1' then
+        redis.call('SET', KEYS[2], '1', 'EX', ARGV[3])
+    end
+    if owned then
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(
+        self,
+        redis: RedisService,
+        ttl_seconds: float = MESSAGE_LOCK_TTL_SECONDS,
+        done_ttl_seconds: int = MESSAGE_DONE_TTL_SECONDS,
+        max_hold_seconds: float = MESSAGE_LOCK_MAX_HOLD_SECONDS,
+    ):
+        self._redis = redis
+        self.ttl_seconds = ttl_seconds
+        self.done_ttl_seconds = int(done_ttl_seconds)
+        self.max_hold_seconds = max_hold_seconds
+        self._scripts: Optional[Dict[str, Any]] = None
+        self._scripts_client: Any = None
+        self._local_locks: Dict[str, str] = {}
+        self._local_done: "OrderedDict[str, None]" = OrderedDict()
+        self._wait = _TimingStats()
+        self._hold = _TimingStats()
+        self._counters: Dict[str, int] = {
+            "acquired": 0,
+            "acquired_local": 0,
+            "contended": 0,
+            "already_done": 0,
+            "skipped_redis_down": 0,
+            "redis_errors": 0,
+            "extend_failures": 0,
+            "lost_on_release": 0,
+        }
+
+    def _scripts_for(self, client: Any) -> Dict[str, Any]:
+        if self._scripts is None or self._scripts_client is not client:
+            self._scripts = {
+                "acquire": client.register_script(self.ACQUIRE_LUA),
+                "extend": client.register_script(self.EXTEND_LUA),
+                "release": client.register_script(self.RELEASE_LUA),
+            }
+            self._scripts_client = client
+        return self._scripts
+
+    def _keys(self, message_id: str):
+        return [f"{MESSAGE_LOCK_PREFIX}{message_id}", f"{MESSAGE_DONE_PREFIX}{message_id}"]
+
+    async def acquire(self, message_id: Any) -> Optional[MessageLock]:
+        """Try to take the lock for `message_id` without waiting; None if another handler owns it."""
+        message_id = str(message_id)
+        token = uuid.uuid4().hex
+        started = time.perf_counter()
+        try:
+            client = await self._redis.get_client()
+            if client is not None:
+                try:
+                    acquired = await self._scripts_for(client)["acquire"](
+                        keys=self._keys(message_id), args=[token, int(self.ttl_seconds * 1000)]
+                    )
+                except Exception as e:
+                    self._counters["redis_errors"] += 1
+                    self._redis.mark_failure(e)
+                else:
+                    if not int(acquired):
+                        self._counters["contended"] += 1
+                        return None
+                    lock = MessageLock(self, message_id, token, local=False)
+                    lock._keepalive = asyncio.create_task(self._keepalive(lock))
+                    self._counters["acquired"] += 1
+                    return lock
+            if self._redis.fail_fast:
+                self._counters["skipped_redis_down"] += 1
+                logger.error(f"Redis unavailable and FAIL_ON_REDIS_ERROR is set; not processing message {message_id}.")
+                return None
+            return self._acquire_local(message_id, token)
+        finally:
+            self._wait.add((time.perf_counter() - started) * 1000)
+
+    def _acquire_local(self, message_id: str, token: str) -> Optional[MessageLock]:
+        if message_id in self._local_done:
+            self._counters["already_done"] += 1
+            return None
+        if message_id in self._local_locks:
+            self._counters["contended"] += 1
+            return None
+        self._local_locks[message_id] = token
+        self._counters["acquired_local"] += 1
+        return MessageLock(self, message_id, token, local=True)
+
+    async def _keepalive(self, lock: MessageLock) -> None:
+        interval = self.ttl_seconds / 3
+        try:
+            while time.perf_counter() - lock.acquired_at < self.max_hold_seconds:
+                await asyncio.sleep(interval)
+                client = await self._redis.get_client()
+                if client is None:
+                    continue
+                try:
+                    extended = await self._scripts_for(client)["extend"](
+                        keys=self._keys(lock.message_id)[:1], args=[lock.token, int(self.ttl_seconds * 1000)]
+                    )
+                except Exception as e:
+                    self._counters["redis_errors"] += 1
+                    self._redis.mark_failure(e)
+                    continue
+                if not int(extended):
+                    self._counters["extend_failures"] += 1
+                    logger.warning(f"Lost the processing lock for message {lock.message_id} before finishing.")
+                    return
+        except asyncio.CancelledError:
+            pass
+
+    async def _release(self, lock: MessageLock, done: bool) -> None:
+        self._hold.add((time.perf_counter() - lock.acquired_at) * 1000)
+        if done:
+            self._remember_local_done(lock.message_id)
+        if lock.local:
+            if self._local_locks.get(lock.message_id) == lock.token:
+                del self._local_locks[lock.message_id]
+            return
+        client = await self._redis.get_client()
+        if client is None:
+            return
+        try:
+            owned = await self._scripts_for(client)["release"](
+                keys=self._keys(lock.message_id), args=[lock.token, "1" if done else "0", self.done_ttl_seconds]
+            )
+        except Exception as e:
+            self._counters["redis_errors"] += 1
+            self._redis.mark_failure(e)
+            return
+        if not int(owned):
+            self._counters["lost_on_release"] += 1
+
+    def _remember_local_done(self, message_id: str) -> None:
+        self._local_done[message_id] = None
+        self._local_done.move_to_end(message_id)
+        while len(self._local_done) > LOCAL_DONE_MARKERS_LIMIT:
+            self._local_done.popitem(last=False)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "redis": self._redis.status(),
+            "mode": "redis" if self._redis.available else ("unavailable" if self._redis.fail_fast else "local"),
+            "held_local": len(self._local_locks),
+            "counters": dict(self._counters),
+            "wait": self._wait.snapshot(),
+            "hold": self._hold.snapshot(),
+        }
+
+
+redis_service = RedisService()
+message_lock_service = MessageLockService(redis_service)
@@ -1,84 +1,296 @@
 # backend/app/usage_tracker.py
 import json
+import logging
 import os
-from datetime import datetime, timedelta, timezone
-from typing import Dict, Any, List, Optional
-import asyncio
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right
 from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+
 import pytz
 
+from .core_logic.sqlite_pool import SQLitePool
+
+logger = logging.getLogger(__name__)
+
+# 每累计这么多条新事件就触发一次日汇总（统计查询前也会汇总）
+USAGE_ROLLUP_EVERY_EVENTS = 200
+# 已汇总的原始事件保留天数，更早的会被压缩删除
+USAGE_EVENT_RETENTION_DAYS = 7
+
+USAGE_VIEWS: Tuple[Tuple[str, str], ...] = (
+    ("user", "user_id"),
+    ("role", "role_id"),
+    ("channel", "channel_id"),
+    ("guild", "guild_id"),
+)
+METADATA_KINDS = ("users", "roles", "channels", "guilds", "channel_users")
+# 内存中保留累计快照的天数（需覆盖 today/week/month 以及时区偏移）
+USAGE_CUBE_WINDOW_DAYS = 40
+
+# (view, item_key, model)；view 为 '' 时表示总量
+CubeKey = Tuple[str, str, str]
+CubeRow = Tuple[str, str, str, int, int, int]
+
+USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS usage_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    day TEXT NOT NULL,
+    model TEXT NOT NULL,
+    input_tokens INTEGER NOT NULL,
+    output_tokens INTEGER NOT NULL,
+    user_id TEXT,
+    role_id TEXT,
+    channel_id TEXT,
+    guild_id TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_events_day ON usage_events(day);
+
+-- view = '' 为当天总量（item_key 为空），其余为 user/role/channel/guild 维度
+CREATE TABLE IF NOT EXISTS usage_rollups (
+    day TEXT NOT NULL,
+    view TEXT NOT NULL,
+    item_key TEXT NOT NULL,
+    model TEXT NOT NULL,
+    requests INTEGER NOT NULL DEFAULT 0,
+    input_tokens INTEGER NOT NULL DEFAULT 0,
+    output_tokens INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (day, view, item_key, model)
+);
+
+CREATE TABLE IF NOT EXISTS usage_metadata (
+    kind TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (kind, item_id)
+);
+
+CREATE TABLE IF NOT EXISTS usage_state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {"requests": 0, "input_tokens": 0, "output_tokens": 0}
+
+
+class UsageCubes:
+    """
+    按天的累计聚合（前缀和）：cumulative[day][(view, key, model)] 为截至该天（含）的总量。
+    任意日期区间 = cumulative[end] - cumulative[start 前一天]，查询代价只与 key 的数量有关。
+    只保留最近 USAGE_CUBE_WINDOW_DAYS 个有数据的日期，更早的区间起点不受支持（'all' 不需要起点）。
+    """
+
+    def __init__(self):
+        self._days: List[str] = []
+        self._cumulative: Dict[str, Dict[CubeKey, List[int]]] = {}
+        self.first_day: Optional[str] = None
+
+    def load(self, rows_by_day: Dict[str, List[CubeRow]]) -> None:
+        """启动时一次性构建；窗口之外的旧日期只累加进基线，不保存逐日快照。"""
+        self._days = []
+        self._cumulative = {}
+        days = sorted(rows_by_day)
+        self.first_day = days[0] if days else None
+        older, recent = days[:-USAGE_CUBE_WINDOW_DAYS], days[-USAGE_CUBE_WINDOW_DAYS:]
+        if older:
+            base: Dict[CubeKey, List[int]] = {}
+            for day in older:
+                self._accumulate(base, rows_by_day[day])
+            self._days.append(older[-1])
+            self._cumulative[older[-1]] = base
+        for day in recent:
+            self.add(day, rows_by_day[day])
+
+    @staticmethod
+    def _accumulate(cube: Dict[CubeKey, List[int]], rows: Iterable[CubeRow]) -> None:
+        for view, item_key, model, requests, input_tokens, output_tokens in rows:
+            counts = cube.get((view, item_key, model))
+            if counts is None:
+                cube[(view, item_key, model)] = [requests, input_tokens, output_tokens]
+            else:
+                counts[0] += requests
+                counts[1] += input_tokens
+                counts[2] += output_tokens
+
+    def add(self, day: str, rows: List[CubeRow]) -> None:
+        if day not in self._cumulative:
+            index = bisect_left(self._days, day)
+            previous = self._cumulative[self._days[index - 1]] if index > 0 else {}
+            self._cumulative[day] = {key: list(counts) for key, counts in previous.items()}
+            self._days.insert(index, day)
+        # 通常只有最后一天（今天）需要更新
+        for later_day in self._days[bisect_left(self._days, day):]:
+            self._accumulate(self._cumulative[later_day], rows)
+        if self.first_day is None or day < self.first_day:
+            self.first_day = day
+        while len(self._days) > USAGE_CUBE_WINDOW_DAYS:
+            del self._cumulative[self._days.pop(0)]
+
+    def _as_of(self, day: Optional[str]) -> Dict[CubeKey, List[int]]:
+        """截至 day（含）的累计；day 为 None 或早于所有快照时为空。"""
+        if day is None:
+            return {}
+        index = bisect_right(self._days, day)
+        return self._cumulative[self._days[index - 1]] if index > 0 else {}
+
+    def between(self, start_date: Optional[str], end_date: str) -> Iterator[Tuple[CubeKey, Tuple[int, int, int]]]:
+        """区间 [start_date, end_date] 内有用量的每个 key 及其 (requests, input_tokens, output_tokens)。"""
+        before_start = None
+        if start_date is not None:
+            before_start = (datetime.strptime(start_date, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        end = self._as_of(end_date)
+        base = self._as_of(before_start)
+        for key, counts in end.items():
+            prior = base.get(key)
+            delta = (counts[0] - prior[0], counts[1] - prior[1], counts[2] - prior[2]) if prior else tuple(counts)
+            if any(delta):
+                yield key, delta
+
+
 class UsageTracker:
-    def __init__(self, data_file="data/usage_data.json"):
+    """
+    用量统计。每次回复只追加一条事件（与历史数据量无关），事件定期汇总为按天的
+    rollup，超过保留期的已汇总事件会被删除。统计查询由内存中的累计聚合（UsageCubes）
+    直接计算，启动时从 rollup 与未汇总事件构建。旧的 usage_data.json 在首次启动时导入。
+    """
+
+    def __init__(self, data_file="data/usage_data.json", db_file="data/usage.sqlite"):
         self.data_file = data_file
         # 确保数据目录存在
-        data_dir = os.path.dirname(data_file)
-        if data_dir:
-            os.makedirs(data_dir, exist_ok=True)
-            
-        self.usage_data = self._load_data()
-        self.lock = asyncio.Lock()
-        
-    def _load_data(self) -> Dict[str, Any]:
+        for path in (data_file, db_file):
+            data_dir = os.path.dirname(path)
+            if data_dir:
+                os.makedirs(data_dir, exist_ok=True)
+
+        self._pool = SQLitePool(db_file, max_readers=2)
+        self._metadata_lock = threading.Lock()
+        self._metadata: Dict[str, Dict[str, Any]] = {kind: {} for kind in METADATA_KINDS}
+        self._events_since_rollup = 0
+        # 只在事件循环线程里修改；get_statistics 读取期间不 await，因此无需加锁即可看到一致快照
+        self._cubes = UsageCubes()
+        self._init_db()
+        self._cubes.load(self._load_cube_rows())
+
+    def _init_db(self) -> None:
+        with self._pool.write() as conn:
+            conn.executescript(USAGE_SCHEMA)
+            migrated = self._migrate_json_file(conn)
+            for row in conn.execute("SELECT kind, item_id, data FROM usage_metadata"):
+                if row["kind"] in self._metadata:
+                    self._metadata[row["kind"]][row["item_id"]] = json.loads(row["data"])
+        if migrated:
+            # 导入已提交，保留旧文件作为备份
+            os.replace(self.data_file, self.data_file + ".migrated")
+
+    def _migrate_json_file(self, conn: sqlite3.Connection) -> bool:
+        """把旧版 usage_data.json 的 daily / metadata 导入 SQLite，只执行一次。"""
+        if conn.execute("SELECT 1 FROM usage_state WHERE key='json_migrated'").fetchone():
+            return False
+        imported = False
         if os.path.exists(self.data_file):
             try:
                 with open(self.data_file, 'r') as f:
                     data = json.load(f)
-                    metadata = data.get("metadata", {})
-                    if "channel_users" not in metadata:
-                        metadata["channel_users"] = {}
-                    return {
-                        "daily": defaultdict(lambda: {
-                            "requests": 0, 
-                            "input_tokens": 0, 
-                            "output_tokens": 0, 
-                            "total_tokens": 0,
-                            "detailed": {
-                                "by_user": {},
-                                "by_role": {},
-                                "by_channel": {},
-                                "by_guild": {}
-                            }
-                        }, data.get("daily", {})),
-                        "metadata": metadata
-                    }
             except Exception as e:
-                print(f"Error loading usage data: {e}")
-        return {
-            "daily": defaultdict(lambda: {
-                "requests": 0, 
-                "input_tokens": 0, 
-                "output_tokens": 0, 
-                "total_tokens": 0,
-                "detailed": {
-                    "by_user": {},
-                    "by_role": {},
-                    "by_channel": {},
-                    "by_guild": {}
-                }
-            }),
-            "metadata": {
-                "users": {},
-                "roles": {},
-                "channels": {},
-                "guilds": {},
-                "channel_users": {}
-            }
-        }
-    
-    async def save_data(self):
-        async with self.lock:
-            data_to_save = {
-                "daily": dict(self.usage_data["daily"]),
-                "metadata": self.usage_data["metadata"]
-            }
-            with open(self.data_file, 'w') as f:
-                json.dump(data_to_save, f, indent=2)
-    
+                logger.error(f"Error loading legacy usage data from {self.data_file}: {e}")
+                return False
+            rollups: List[Tuple[str, str, str, str, int, int, int]] = []
+            for day, day_data in (data.get("daily") or {}).items():
+                # 旧格式的当天总量不分模型，用空模型名保存
+                rollups.append((day, "", "", "", int(day_data.get("requests", 0)), int(day_data.get("input_tokens", 0)), int(day_data.get("output_tokens", 0))))
+                for view, _ in USAGE_VIEWS:
+                    for key, item_data in (day_data.get("detailed", {}).get("by_" + view) or {}).items():
+                        for model_key, stats in (item_data.get("models") or {}).items():
+                            rollups.append((day, view, key, model_key, int(stats.get("requests", 0)), int(stats.get("input_tokens", 0)), int(stats.get("output_tokens", 0))))
+            conn.executemany(
+                """
+                INSERT INTO usage_rollups (day, view, item_key, model, requests, input_tokens, output_tokens)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(day, view, item_key, model) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    input_tokens = input_tokens + excluded.input_tokens,
+                    output_tokens = output_tokens + excluded.output_tokens
+                """,
+                rollups,
+            )
+            metadata = data.get("metadata") or {}
+            conn.executemany(
+                "INSERT OR REPLACE INTO usage_metadata (kind, item_id, data) VALUES (?, ?, ?)",
+                [
+                    (kind, str(item_id), json.dumps(item))
+                    for kind in METADATA_KINDS
+                    for item_id, item in (metadata.get(kind) or {}).items()
+                ],
+            )
+            logger.info(f"Imported {len(rollups)} usage rollup rows from {self.data_file}.")
+            imported = True
+        conn.execute("INSERT OR REPLACE INTO usage_state (key, value) VALUES ('json_migrated', '1')")
+        return imported
+
+    def close(self) -> None:
+        try:
+            self.rollup()
+        except sqlite3.Error as e:
+            logger.error(f"Failed to roll up usage events on shutdown: {e}")
+        self._pool.close()
+
+    def _metadata_updates(
+        self,
+        user_id: Optional[str], user_name: Optional[str], user_display_name: Optional[str],
+        role_id: Optional[str], role_name: Optional[str],
+        channel_id: Optional[str], channel_name: Optional[str],
+        guild_id: Optional[str], guild_name: Optional[str],
+    ) -> List[Tuple[str, str, str]]:
+        """更新内存中的元数据，只返回真正变化的条目以便写入。"""
+        wanted: List[Tuple[str, str, Dict[str, Any]]] = []
+        if user_id:
+            wanted.append(("users", user_id, {"name": user_name, "display_name": user_display_name}))
+        if role_id:
+            wanted.append(("roles", role_id, {"name": role_name}))
+        if channel_id:
+            wanted.append(("channels", channel_id, {"name": channel_name}))
+        if guild_id:
+            wanted.append(("guilds", guild_id, {"name": guild_name}))
+        changed: List[Tuple[str, str, str]] = []
+        with self._metadata_lock:
+            for kind, item_id, item in wanted:
+                if self._metadata[kind].get(item_id) != item:
+                    self._metadata[kind][item_id] = item
+                    changed.append((kind, item_id, json.dumps(item)))
+            if channel_id and user_id:
+                per_channel = self._metadata["channel_users"].get(channel_id)
+                user_ids = per_channel.get("user_ids") if isinstance(per_channel, dict) else None
+                if not isinstance(user_ids, list):
+                    user_ids = []
+                if user_id not in user_ids:
+                    per_channel = {"user_ids": user_ids + [user_id]}
+                    self._metadata["channel_users"][channel_id] = per_channel
+                    changed.append(("channel_users", channel_id, json.dumps(per_channel)))
+        return changed
+
+    def _append_event(self, event: Tuple[Any, ...], metadata_rows: List[Tuple[str, str, str]]) -> None:
+        with self._pool.write() as conn:
+            conn.execute(
+                """
+                INSERT INTO usage_events (ts, day, model, input_tokens, output_tokens, user_id, role_id, channel_id, guild_id)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                event,
+            )
+            if metadata_rows:
+                conn.executemany("INSERT OR REPLACE INTO usage_metadata (kind, item_id, data) VALUES (?, ?, ?)", metadata_rows)
+
     async def record_usage(
-        self, 
-        provider: str, 
-        model: str, 
-        input_tokens: int, 
+        self,
+        provider: str,
+        model: str,
+        input_tokens: int,
         output_tokens: int,
         user_id: Optional[str] = None,
         user_name: Optional[str] = None,
@@ -90,214 +302,140 @@ class UsageTracker:
         guild_id: Optional[str] = None,
         guild_name: Optional[str] = None
     ):
-        async with self.lock:
-            today = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-            model_key = f"{provider}:{model}"
-            
-            # 更新元数据
-            if user_id:
-                self.usage_data["metadata"]["users"][user_id] = {
-                    "name": user_name,
-                    "display_name": user_display_name
-                }
-            if role_id:
-                self.usage_data["metadata"]["roles"][role_id] = {
-                    "name": role_name
-                }
-            if channel_id:
-                self.usage_data["metadata"]["channels"][channel_id] = {
-                    "name": channel_name
-                }
-                channel_users = self.usage_data["metadata"].setdefault("channel_users", {})
-                per_channel = channel_users.setdefault(channel_id, {"user_ids": []})
-                if "user_ids" not in per_channel or not isinstance(per_channel.get("user_ids"), list):
-                    per_channel["user_ids"] = []
-                if user_id and user_id not in per_channel["user_ids"]:
-                    per_channel["user_ids"].append(user_id)
-            if guild_id:
-                self.usage_data["metadata"]["guilds"][guild_id] = {
-                    "name": guild_name
-                }
-            
-            # 初始化当天数据
-            if today not in self.usage_data["daily"]:
-                self.usage_data["daily"][today] = {
-                    "requests": 0,
-                    "input_tokens": 0,
-                    "output_tokens": 0,
-                    "total_tokens": 0,
-                    "detailed": {
-                        "by_user": {},
-                        "by_role": {},
-                        "by_channel": {},
-                        "by_guild": {}
-                    }
-                }
-            
-            daily = self.usage_data["daily"][today]
-            daily["requests"] += 1
-            daily["input_tokens"] += input_tokens
-            daily["output_tokens"] += output_tokens
-            daily["total_tokens"] += input_tokens + output_tokens
-            
-            # 记录用户-模型详细数据
-            if user_id:
-                if user_id not in daily["detailed"]["by_user"]:
-                    daily["detailed"]["by_user"][user_id] = {
-                        "total": {"requests": 0, "input_tokens": 0, "output_tokens": 0},
-                        "models": {}
-                    }
-                
-                user_data = daily["detailed"]["by_user"][user_id]
-                user_data["total"]["requests"] += 1
-                user_data["total"]["input_tokens"] += input_tokens
-                user_data["total"]["output_tokens"] += output_tokens
-                
-                if model_key not in user_data["models"]:
-                    user_data["models"][model_key] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
-                
-                user_data["models"][model_key]["requests"] += 1
-                user_data["models"][model_key]["input_tokens"] += input_tokens
-                user_data["models"][model_key]["output_tokens"] += output_tokens
-            
-            # 记录身份组-模型详细数据
-            if role_id:
-                if role_id not in daily["detailed"]["by_role"]:
-                    daily["detailed"]["by_role"][role_id] = {
-                        "total": {"requests": 0, "input_tokens": 0, "output_tokens": 0},
-                        "models": {}
-                    }
-                
-                role_data = daily["detailed"]["by_role"][role_id]
-                role_data["total"]["requests"] += 1
-                role_data["total"]["input_tokens"] += input_tokens
-                role_data["total"]["output_tokens"] += output_tokens
-                
-                if model_key not in role_data["models"]:
-                    role_data["models"][model_key] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
-                
-                role_data["models"][model_key]["requests"] += 1
-                role_data["models"][model_key]["input_tokens"] += input_tokens
-                role_data["models"][model_key]["output_tokens"] += output_tokens
-            
-            # 记录频道-模型详细数据
-            if channel_id:
-                if channel_id not in daily["detailed"]["by_channel"]:
-                    daily["detailed"]["by_channel"][channel_id] = {
-                        "total": {"requests": 0, "input_tokens": 0, "output_tokens": 0},
-                        "models": {}
-                    }
-                
-                channel_data = daily["detailed"]["by_channel"][channel_id]
-                channel_data["total"]["requests"] += 1
-                channel_data["total"]["input_tokens"] += input_tokens
-                channel_data["total"]["output_tokens"] += output_tokens
-                
-                if model_key not in channel_data["models"]:
-                    channel_data["models"][model_key] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
-                
-                channel_data["models"][model_key]["requests"] += 1
-                channel_data["models"][model_key]["input_tokens"] += input_tokens
-                channel_data["models"][model_key]["output_tokens"] += output_tokens
-            
-            # 记录服务器-模型详细数据
-            if guild_id:
-                if guild_id not in daily["detailed"]["by_guild"]:
-                    daily["detailed"]["by_guild"][guild_id] = {
-                        "total": {"requests": 0, "input_tokens": 0, "output_tokens": 0},
-                        "models": {}
-                    }
-                
-                guild_data = daily["detailed"]["by_guild"][guild_id]
-                guild_data["total"]["requests"] += 1
-                guild_data["total"]["input_tokens"] += input_tokens
-                guild_data["total"]["output_tokens"] += output_tokens
-                
-                if model_key not in guild_data["models"]:
-                    guild_data["models"][model_key] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
-                
-                guild_data["models"][model_key]["requests"] += 1
-                guild_data["models"][model_key]["input_tokens"] += input_tokens
-                guild_data["models"][model_key]["output_tokens"] += output_tokens
-            
-        # 异步保存
-        asyncio.create_task(self.save_data())
-    
-    async def get_statistics(self, period: str = "today", view: str = "user", timezone_str: str = "UTC") -> Dict[str, Any]:
-        async with self.lock:
+        now = datetime.now(timezone.utc)
+        model_key = f"{provider}:{model}"
+        metadata_rows = self._metadata_updates(
+            user_id, user_name, user_display_name, role_id, role_name, channel_id, channel_name, guild_id, guild_name
+        )
+        event = (
+            now.isoformat(), now.strftime("%Y-%m-%d"), model_key, int(input_tokens), int(output_tokens),
+            user_id or None, role_id or None, channel_id or None, guild_id or None,
+        )
+        await self._pool.run(self._append_event, event, metadata_rows)
+        self._cubes.add(event[1], self._event_cube_rows(model_key, event[3], event[4], *event[5:]))
+
+        self._events_since_rollup += 1
+        if self._events_since_rollup >= USAGE_ROLLUP_EVERY_EVENTS:
+            self._events_since_rollup = 0
             try:
-                user_tz = pytz.timezone(timezone_str)
-            except pytz.UnknownTimeZoneError:
-                user_tz = pytz.utc
-
-            now_in_user_tz = datetime.now(user_tz)
-            
-            if period == "today":
-                start_date = now_in_user_tz.strftime("%Y-%m-%d")
-                end_date = start_date
-            elif period == "week":
-                # 以用户时区的“今天”为基准，往前推7天
-                start_of_today = now_in_user_tz.replace(hour=0, minute=0, second=0, microsecond=0)
-                start_date_dt = start_of_today - timedelta(days=6) # 包括今天在内总共7天
-                start_date = start_date_dt.strftime("%Y-%m-%d")
-                end_date = now_in_user_tz.strftime("%Y-%m-%d")
-            elif period == "month":
-                # 以用户时区的“今天”为基准，往前推30天
-                start_of_today = now_in_user_tz.replace(hour=0, minute=0, second=0, microsecond=0)
-                start_date_dt = start_of_today - timedelta(days=29) # 包括今天在内总共30天
-                start_date = start_date_dt.strftime("%Y-%m-%d")
-                end_date = now_in_user_tz.strftime("%Y-%m-%d")
-            else:  # all time
-                dates = list(self.usage_data["daily"].keys())
-                start_date = min(dates) if dates else now_in_user_tz.strftime("%Y-%m-%d")
-                end_date = now_in_user_tz.strftime("%Y-%m-%d")
-            
-            # 聚合数据
-            total_stats = {
-                "requests": 0,
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-                "detailed_by_" + view: {}
-            }
-            
-            for date_str, data in self.usage_data["daily"].items():
-                if start_date <= date_str <= end_date:
-                    total_stats["requests"] += data["requests"]
-                    total_stats["input_tokens"] += data["input_tokens"]
-                    total_stats["output_tokens"] += data["output_tokens"]
-                    total_stats["total_tokens"] += data["total_tokens"]
-                    
-                    # 聚合详细数据
-                    view_data = data.get("detailed", {}).get("by_" + view, {})
-                    for key, item_data in view_data.items():
-                        if key not in total_stats["detailed_by_" + view]:
-                            total_stats["detailed_by_" + view][key] = {
-                                "total": {"requests": 0, "input_tokens": 0, "output_tokens": 0},
-                                "models": {}
-                            }
-                        
-                        dest = total_stats["detailed_by_" + view][key]
-                        dest["total"]["requests"] += item_data["total"]["requests"]
-                        dest["total"]["input_tokens"] += item_data["total"]["input_tokens"]
-                        dest["total"]["output_tokens"] += item_data["total"]["output_tokens"]
-                        
-                        for model_key, model_stats in item_data.get("models", {}).items():
-                            if model_key not in dest["models"]:
-                                dest["models"][model_key] = {"requests": 0, "input_tokens": 0, "output_tokens": 0}
-                            
-                            dest["models"][model_key]["requests"] += model_stats["requests"]
-                            dest["models"][model_key]["input_tokens"] += model_stats["input_tokens"]
-                            dest["models"][model_key]["output_tokens"] += model_stats["output_tokens"]
-            
-            return {
-                "period": period,
-                "view": view,
-                "start_date": start_date,
-                "end_date": end_date,
-                "stats": total_stats,
-                "metadata": self.usage_data["metadata"]
-            }
+                await self._pool.run(self.rollup)
+            except sqlite3.Error as e:
+                logger.error(f"Failed to roll up usage events: {e}", exc_info=True)
+
+    def rollup(self) -> int:
+        """把尚未汇总的事件累加进按天 rollup，并删除超过保留期的已汇总事件。返回汇总的事件数。"""
+        with self._pool.write() as conn:
+            row = conn.execute("SELECT value FROM usage_state WHERE key='rolled_up_event_id'").fetchone()
+            watermark = int(row["value"]) if row else 0
+            latest = conn.execute("SELECT COALESCE(MAX(id), 0) FROM usage_events").fetchone()[0]
+            if latest > watermark:
+                selections = [("''", "''", "1")] + [(f"'{view}'", column, f"{column} IS NOT NULL AND {column} <> ''") for view, column in USAGE_VIEWS]
+                for view_sql, key_sql, condition in selections:
+                    conn.execute(
+                        f"""
+                        INSERT INTO usage_rollups (day, view, item_key, model, requests, input_tokens, output_tokens)
+                        SELECT day, {view_sql}, {key_sql}, model, COUNT(*), SUM(input_tokens), SUM(output_tokens)
+                        FROM usage_events
+                        WHERE id > ? AND id <= ? AND {condition}
+                        GROUP BY day, {key_sql}, model
+                        ON CONFLICT(day, view, item_key, model) DO UPDATE SET
+                            requests = requests + excluded.requests,
+                            input_tokens = input_tokens + excluded.input_tokens,
+                            output_tokens = output_tokens + excluded.output_tokens
+                        """,
+                        (watermark, latest),
+                    )
+                conn.execute("INSERT OR REPLACE INTO usage_state (key, value) VALUES ('rolled_up_event_id', ?)", (str(latest),))
+            cutoff = (datetime.now(timezone.utc) - timedelta(days=USAGE_EVENT_RETENTION_DAYS)).strftime("%Y-%m-%d")
+            conn.execute("DELETE FROM usage_events WHERE id <= ? AND day < ?", (latest, cutoff))
+        return max(0, latest - watermark)
+
+    def _load_cube_rows(self) -> Dict[str, List[CubeRow]]:
+        """已汇总的 rollup 加上尚未汇总的事件，按天分组。"""
+        rows_by_day: Dict[str, List[CubeRow]] = defaultdict(list)
+        with self._pool.read() as conn:
+            for row in conn.execute("SELECT day, view, item_key, model, requests, input_tokens, output_tokens FROM usage_rollups"):
+                rows_by_day[row["day"]].append(tuple(row[1:]))
+            state = conn.execute("SELECT value FROM usage_state WHERE key='rolled_up_event_id'").fetchone()
+            watermark = int(state["value"]) if state else 0
+            for row in conn.execute(
+                "SELECT day, model, input_tokens, output_tokens, user_id, role_id, channel_id, guild_id FROM usage_events WHERE id > ?",
+                (watermark,),
+            ):
+                rows_by_day[row["day"]].extend(self._event_cube_rows(
+                    row["model"], row["input_tokens"], row["output_tokens"],
+                    row["user_id"], row["role_id"], row["channel_id"], row["guild_id"],
+                ))
+        return rows_by_day
+
+    @staticmethod
+    def _event_cube_rows(
+        model_key: str, input_tokens: int, output_tokens: int,
+        user_id: Optional[str], role_id: Optional[str], channel_id: Optional[str], guild_id: Optional[str],
+    ) -> List[CubeRow]:
+        rows: List[CubeRow] = [("", "", model_key, 1, input_tokens, output_tokens)]
+        for (view, _), item_key in zip(USAGE_VIEWS, (user_id, role_id, channel_id, guild_id)):
+            if item_key:
+                rows.append((view, item_key, model_key, 1, input_tokens, output_tokens))
+        return rows
+
+    async def get_statistics(self, period: str = "today", view: str = "user", timezone_str: str = "UTC") -> Dict[str, Any]:
+        try:
+            user_tz = pytz.timezone(timezone_str)
+        except pytz.UnknownTimeZoneError:
+            user_tz = pytz.utc
+
+        now_in_user_tz = datetime.now(user_tz)
+        end_date = now_in_user_tz.strftime("%Y-%m-%d")
+
+        if period == "today":
+            start_date = end_date
+        elif period == "week":
+            # 以用户时区的“今天”为基准，往前推7天
+            start_of_today = now_in_user_tz.replace(hour=0, minute=0, second=0, microsecond=0)
+            start_date_dt = start_of_today - timedelta(days=6) # 包括今天在内总共7天
+            start_date = start_date_dt.strftime("%Y-%m-%d")
+        elif period == "month":
+            # 以用户时区的“今天”为基准，往前推30天
+            start_of_today = now_in_user_tz.replace(hour=0, minute=0, second=0, microsecond=0)
+            start_date_dt = start_of_today - timedelta(days=29) # 包括今天在内总共30天
+            start_date = start_date_dt.strftime("%Y-%m-%d")
+        else:  # all time
+            start_date = None
+
+        # 聚合数据
+        total_stats = {
+            "requests": 0,
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "detailed_by_" + view: {}
+        }
+        detailed = total_stats["detailed_by_" + view]
+        for (item_view, item_key, model_key), (requests, input_tokens, output_tokens) in self._cubes.between(start_date, end_date):
+            if item_view == "":
+                total_stats["requests"] += requests
+                total_stats["input_tokens"] += input_tokens
+                total_stats["output_tokens"] += output_tokens
+                total_stats["total_tokens"] += input_tokens + output_tokens
+            elif item_view == view:
+                dest = detailed.setdefault(item_key, {"total": _empty_counts(), "models": {}})
+                dest["total"]["requests"] += requests
+                dest["total"]["input_tokens"] += input_tokens
+                dest["total"]["output_tokens"] += output_tokens
+                dest["models"][model_key] = {"requests": requests, "input_tokens": input_tokens, "output_tokens": output_tokens}
+
+        with self._metadata_lock:
+            metadata = json.loads(json.dumps(self._metadata))
+
+        return {
+            "period": period,
+            "view": view,
+            "start_date": start_date or self._cubes.first_day or end_date,
+            "end_date": end_date,
+            "stats": total_stats,
+            "metadata": metadata
+        }
 
 # 全局实例
 usage_tracker = UsageTracker()
@@ -3,11 +3,12 @@ import json
 import logging
 import os
 import asyncio
+import functools
 import ipaddress
 import socket
 from urllib.parse import urlparse
-from typing import List, Dict, Any, Optional
-import re
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
 from datetime import datetime
 import pytz # Timezone library
 
@@ -18,6 +19,8 @@ import anthropic
 from logging.handlers import RotatingFileHandler
 from pathlib import Path
 
+from .core_logic.keyword_index import build_trigger_index
+
 logger = logging.getLogger(__name__)
 
 # --- 日志系统设置 (最终优化版) ---
@@ -170,6 +173,27 @@ def escape_content(text: str) -> str:
     return text.replace('[', '&#91;').replace(']', '&#93;')
 
 
+def compile_trigger_matcher(
+    trigger_keywords: List[str],
+    match_mode: str = "contains",
+    case_sensitive: bool = False,
+) -> Callable[[str], bool]:
+    """
+    Compiles the trigger keyword list into a single matcher callable backed by a shared
+    keyword index (Aho-Corasick for literal modes, a precompiled regex union for regex mode).
+    Supported modes: contains, starts_with, exact, regex.
+    """
+    index = build_trigger_index(trigger_keywords, match_mode=match_mode, case_sensitive=case_sensitive)
+    if not len(index):
+        return lambda message_content: False
+    return index.matches_any
+
+
+@functools.lru_cache(maxsize=64)
+def _cached_trigger_matcher(trigger_keywords: Tuple[str, ...], match_mode: str, case_sensitive: bool) -> Callable[[str], bool]:
+    return compile_trigger_matcher(list(trigger_keywords), match_mode, case_sensitive)
+
+
 def matches_trigger_keywords(
     message_content: str,
     trigger_keywords: List[str],
@@ -183,74 +207,114 @@ def matches_trigger_keywords(
     if not message_content or not trigger_keywords:
         return False
 
-    mode = (match_mode or "contains").strip().lower()
-    content = message_content if case_sensitive else message_content.lower()
+    keywords = tuple(str(keyword) for keyword in trigger_keywords if keyword)
+    matcher = _cached_trigger_matcher(keywords, match_mode or "contains", bool(case_sensitive))
+    return matcher(message_content)
 
-    for keyword in trigger_keywords:
-        if not keyword:
-            continue
-        kw = str(keyword).strip()
-        if not kw:
-            continue
+IMAGE_DOWNLOAD_TIMEOUT_SECONDS = 20
+IMAGE_DOWNLOAD_CONCURRENCY = 4
+IMAGE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+IMAGE_CACHE_MAX_ITEM_BYTES = 8 * 1024 * 1024
 
-        kw_for_match = kw if case_sensitive else kw.lower()
 
-        if mode == "starts_with":
-            if content.startswith(kw_for_match):
-                return True
-        elif mode == "exact":
-            if content == kw_for_match:
-                return True
-        elif mode == "regex":
-            flags = 0 if case_sensitive else re.IGNORECASE
-            try:
-                if re.search(kw, message_content, flags=flags):
-                    return True
-            except re.error:
-                logger.warning("Invalid trigger keyword regex skipped: %s", kw)
-        else:
-            # Default mode: contains
-            if kw_for_match in content:
-                return True
+class ImageByteCache:
+    """按 URL 缓存图片字节的 LRU 缓存，按总字节数（而非条目数）限制容量。"""
+
+    def __init__(self, max_bytes: int = IMAGE_CACHE_MAX_BYTES, max_item_bytes: int = IMAGE_CACHE_MAX_ITEM_BYTES):
+        self.max_bytes = max_bytes
+        self.max_item_bytes = max_item_bytes
+        self._items: "OrderedDict[str, bytes]" = OrderedDict()
+        self._size = 0
+
+    def get(self, url: str) -> bytes | None:
+        data = self._items.get(url)
+        if data is not None:
+            self._items.move_to_end(url)
+        return data
+
+    def put(self, url: str, data: bytes) -> None:
+        if not data or len(data) > self.max_item_bytes:
+            return
+        previous = self._items.pop(url, None)
+        if previous is not None:
+            self._size -= len(previous)
+        self._items[url] = data
+        self._size += len(data)
+        while self._size > self.max_bytes and self._items:
+            _, evicted = self._items.popitem(last=False)
+            self._size -= len(evicted)
+
+    def clear(self) -> None:
+        self._items.clear()
+        self._size = 0
+
+
+image_cache = ImageByteCache()
+_image_session: Optional[aiohttp.ClientSession] = None
+_image_session_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def _get_image_session() -> aiohttp.ClientSession:
+    """返回长期复用的下载会话；会话关闭或事件循环变化时重新创建。"""
+    global _image_session, _image_session_loop
+    loop = asyncio.get_running_loop()
+    if _image_session is None or _image_session.closed or _image_session_loop is not loop:
+        timeout = aiohttp.ClientTimeout(total=IMAGE_DOWNLOAD_TIMEOUT_SECONDS)
+        _image_session = aiohttp.ClientSession(timeout=timeout)
+        _image_session_loop = loop
+    return _image_session
+
+
+async def close_image_session() -> None:
+    global _image_session, _image_session_loop
+    session = _image_session
+    _image_session = None
+    _image_session_loop = None
+    if session is not None and not session.closed:
+        await session.close()
 
-    return False
 
 async def download_image(url: str, max_size_mb: int = 100) -> bytes | None:
     """
     安全地下载一张图片，增加了超时和大小限制。
+    使用共享的 aiohttp 会话，并优先命中按 URL 缓存的字节数据。
     :param url: 图片的URL
     :param max_size_mb: 允许下载的最大文件大小（单位：MB）
     :return: 图片的字节数据，如果失败则返回None
     """
     max_size_bytes = max_size_mb * 1024 * 1024
-    # 设置一个合理的超时，防止请求永久挂起
-    timeout = aiohttp.ClientTimeout(total=20) # 总超时20秒
+    cached = image_cache.get(url)
+    if cached is not None and len(cached) <= max_size_bytes:
+        logger.info(f"Image cache hit for {url}, size: {len(cached) / 1024:.2f}KB")
+        return cached
 
     try:
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            async with session.get(url) as resp:
-                if resp.status != 200:
-                    logger.warning(f"Failed to download image from {url}, status code: {resp.status}")
-                    return None
+        session = _get_image_session()
+        async with session.get(url) as resp:
+            if resp.status != 200:
+                logger.warning(f"Failed to download image from {url}, status code: {resp.status}")
+                return None
 
-                content_length = resp.headers.get('Content-Length')
-                if content_length and int(content_length) > max_size_bytes:
-                    logger.warning(f"Image from {url} exceeds size limit of {max_size_mb}MB. "
-                                   f"Reported size: {int(content_length) / 1024 / 1024:.2f}MB.")
+            content_length = resp.headers.get('Content-Length')
+            if content_length and int(content_length) > max_size_bytes:
+                logger.warning(f"Image from {url} exceeds size limit of {max_size_mb}MB. "
+                               f"Reported size: {int(content_length) / 1024 / 1024:.2f}MB.")
+                return None
+
+            downloaded_size = 0
+            image_data = bytearray()
+            # 逐块读取响应，而不是一次性加载到内存
+            async for chunk in resp.content.iter_chunked(8192): # 8KB per chunk
+                downloaded_size += len(chunk)
+                if downloaded_size > max_size_bytes:
+                    logger.warning(f"Image download from {url} aborted, exceeded size limit of {max_size_mb}MB.")
                     return None
+                image_data.extend(chunk)
 
-                downloaded_size = 0
-                image_data = bytearray()
-                # 逐块读取响应，而不是一次性加载到内存
-                async for chunk in resp.content.iter_chunked(8192): # 8KB per chunk
-                    downloaded_size += len(chunk)
-                    if downloaded_size > max_size_bytes:
-                        logger.warning(f"Image download from {url} aborted, exceeded size limit of {max_size_mb}MB.")
-                        return None
-                    image_data.extend(chunk)
-                
-                logger.info(f"Successfully downloaded image from {url}, size: {downloaded_size / 1024:.2f}KB")
-                return bytes(image_data)
+            logger.info(f"Successfully downloaded image from {url}, size: {downloaded_size / 1024:.2f}KB")
+            data = bytes(image_data)
+            image_cache.put(url, data)
+            return data
 
     except asyncio.TimeoutError:
         logger.warning(f"Timeout when downloading image from {url}")
@@ -259,6 +323,27 @@ async def download_image(url: str, max_size_mb: int = 100) -> bytes | None:
         logger.error(f"An unexpected error occurred while downloading image from {url}", exc_info=True)
         return None
 
+
+async def download_images(descriptors: List[Dict[str, Any]], concurrency: int = IMAGE_DOWNLOAD_CONCURRENCY) -> List[Dict[str, Any]]:
+    """
+    并发下载多个图片描述符（受 concurrency 限制），保持输入顺序。
+    :return: 下载成功的描述符列表，每项附带 "bytes" 字段
+    """
+    if not descriptors:
+        return []
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def _fetch(descriptor: Dict[str, Any]) -> bytes | None:
+        async with semaphore:
+            return await download_image(descriptor["url"])
+
+    results = await asyncio.gather(*(_fetch(descriptor) for descriptor in descriptors))
+    return [
+        {**descriptor, "bytes": data}
+        for descriptor, data in zip(descriptors, results)
+        if data
+    ]
+
 # --- 插件 HTTP 请求工具 ---
 
 # [SECURITY] Add utility to check for internal/private IPs to prevent SSRF
@@ -345,8 +430,8 @@ async def _execute_http_request(plugin_config: Dict[str, Any], message: discord.
 
 def transform_memories_for_prompt(memories: List[Dict[str, Any]], target_timezone_str: str = 'UTC') -> List[str]:
     """
-    Transforms raw memory entries from the database into human-readable strings for the LLM prompt.
-    It converts the stored UTC timestamp to a target timezone.
+    Transforms memory rows from the database into human-readable strings for the LLM prompt.
+    Uses the stored plain text and attribute columns, converting the UTC timestamp to a target timezone.
     """
     transformed_memories = []
     
@@ -357,50 +442,19 @@ def transform_memories_for_prompt(memories: List[Dict[str, Any]], target_timezon
         target_tz = pytz.utc
 
     for memory in memories:
-        content = memory.get('content', '')
-        
-        # Regex to find the structured tag: [memory key="value" ...]
-        tag_match = re.search(r'\[memory\s+(.*?)\]', content)
-        
-        if not tag_match:
-            # If no tag, return content as-is
-            transformed_memories.append(content)
+        plain_content = memory.get('plain_content')
+        if plain_content is None:
+            # Not a memory table row; return content as-is
+            transformed_memories.append(memory.get('content', ''))
             continue
 
-        tag_content = tag_match.group(1)
-        # Regex to parse attributes from the tag content
-        attributes = dict(re.findall(r'(\w+)="(.*?)"', tag_content))
-        
-        original_timestamp_str = attributes.get('timestamp')
-        user_name = attributes.get('user_name', 'Unknown')
-        
-        if not original_timestamp_str:
-            # If tag is malformed without a timestamp, strip the tag and return content
-            clean_content = content.replace(tag_match.group(0), '').strip()
-            transformed_memories.append(clean_content)
+        ts_epoch = memory.get('ts_epoch')
+        if ts_epoch is None:
+            transformed_memories.append(plain_content)
             continue
-            
-        try:
-            # Parse the UTC timestamp from ISO format
-            utc_timestamp = datetime.fromisoformat(original_timestamp_str.replace('Z', '+00:00'))
-            
-            # Convert to target timezone
-            local_timestamp = utc_timestamp.astimezone(target_tz)
-            
-            # Format for display
-            formatted_time = local_timestamp.strftime('%Y-%m-%d %H:%M:%S %Z')
-            
-            # Create the natural language prefix
-            nl_prefix = f"[由 {user_name} 在 {formatted_time} 记录]"
-            
-            # Replace the structured tag with the natural language prefix
-            final_content = content.replace(tag_match.group(0), nl_prefix).strip()
-            transformed_memories.append(final_content)
-            
-        except (ValueError, TypeError) as e:
-            logger.error(f"Could not parse or convert timestamp '{original_timestamp_str}': {e}")
-            # Fallback: just strip the tag
-            clean_content = content.replace(tag_match.group(0), '').strip()
-            transformed_memories.append(clean_content)
+
+        formatted_time = datetime.fromtimestamp(float(ts_epoch), tz=target_tz).strftime('%Y-%m-%d %H:%M:%S %Z')
+        user_name = memory.get('user_name') or 'Unknown'
+        transformed_memories.append(f"[由 {user_name} 在 {formatted_time} 记录] {plain_content}".strip())
 
     return transformed_memories
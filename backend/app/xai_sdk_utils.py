@@ -128,3 +128,26 @@ def probe_xai_embedding(
         vector_dim = len(response.embeddings[0].embeddings[0].float_array)
 
     return vector_dim, xai_embedding_usage_to_dict(response.usage)
+
+
+def embed_xai_texts(
+    client: XAISyncClient,
+    model_name: str,
+    texts: List[str],
+) -> List[List[float]]:
+    stub = embed_pb2_grpc.EmbedderStub(client._api_channel)
+    response = stub.Embed(
+        embed_pb2.EmbedRequest(
+            input=[embed_pb2.EmbedInput(string=text) for text in texts],
+            model=model_name,
+            encoding_format=embed_pb2.FORMAT_FLOAT,
+        )
+    )
+
+    vectors: List[List[float]] = []
+    for item in sorted(response.embeddings, key=lambda e: getattr(e, "index", 0)):
+        if item.embeddings:
+            vectors.append(list(item.embeddings[0].float_array))
+        else:
+            vectors.append([])
+    return vectors
@@ -35,6 +35,18 @@ class BasePlugin(ABC):
         """
         pass
 
+    def get_trigger_hints(self) -> Optional[Dict[str, Any]]:
+        """
+        如果插件的触发条件可以静态描述，则重写此方法，让机器人在预判阶段直接跳过无关消息。
+        :return:
+            - None: 无法预判（默认），每条消息都会调用 handle_message。
+            - dict: {"prefixes": [...], "keywords": [...], "requires_main_trigger": bool}
+              prefixes 为区分大小写的消息前缀；keywords 为不区分大小写的子串（用于粗筛，
+              插件仍会在 handle_message 中做精确判断）；requires_main_trigger 表示只有在
+              消息本身已触发机器人时插件才可能生效。两个列表都为空表示插件从不由消息触发。
+        """
+        return None
+
     def get_tools(self) -> List[Dict[str, Any]]:
         """
         如果插件提供可供LLM使用的工具，则重写此方法。
@@ -28,6 +28,17 @@ class ConfigurablePlugin(BasePlugin):
         
         return None
 
+    def get_trigger_hints(self) -> Optional[Dict[str, Any]]:
+        trigger_type = self.plugin_config.get('trigger_type', 'command')
+        triggers = [trigger for trigger in self.plugin_config.get('triggers', []) if isinstance(trigger, str)]
+        if trigger_type == 'command':
+            return {"prefixes": triggers, "keywords": [], "requires_main_trigger": False}
+        if trigger_type == 'keyword':
+            if any(not trigger for trigger in triggers):
+                return None  # r'\b\b' matches almost anything; let handle_message decide.
+            return {"prefixes": [], "keywords": [trigger.lower() for trigger in triggers], "requires_main_trigger": False}
+        return {"prefixes": [], "keywords": [], "requires_main_trigger": False}
+
     def _check_trigger(self, message: discord.Message) -> Tuple[bool, str]:
         """根据插件配置检查触发条件。"""
         trigger_type = self.plugin_config.get('trigger_type', 'command')
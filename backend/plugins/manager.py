@@ -66,6 +66,19 @@ class PluginManager:
         logger.info("--- Plugin Loading Complete ---")
 
 
+    def get_trigger_hints(self) -> List[Optional[Dict[str, Any]]]:
+        """Collects trigger hints from all enabled plugins (None = plugin must always run)."""
+        hints = []
+        for plugin in self.plugins:
+            if not getattr(plugin, 'enabled', True):
+                continue
+            try:
+                hints.append(plugin.get_trigger_hints())
+            except Exception as e:
+                logger.error(f"Failed to read trigger hints from plugin '{plugin.name}': {e}", exc_info=True)
+                hints.append(None)
+        return hints
+
     def get_all_tools(self) -> List[Dict[str, Any]]:
         """Collects tools from all loaded plugins."""
         all_tools = []
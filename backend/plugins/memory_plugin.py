@@ -22,6 +22,9 @@ class MemoryPlugin(BasePlugin):
         # This plugin does not get triggered by user messages, it only provides tools.
         return None
 
+    def get_trigger_hints(self) -> Optional[Dict[str, Any]]:
+        return {"prefixes": [], "keywords": [], "requires_main_trigger": False}
+
     def get_tools(self) -> List[Dict[str, Any]]:
         """Returns the function definitions for the LLM."""
         return [
@@ -157,7 +160,7 @@ class MemoryPlugin(BasePlugin):
             threshold = self._resolve_threshold(config, "memory_dedup_threshold")
             if threshold > 0:
                 all_memories = knowledge_manager.get_all_memories()
-                if self._is_duplicate(content, all_memories, threshold, "content"):
+                if self._is_duplicate(content, all_memories, threshold, "plain_content"):
                     return json.dumps({"status": "duplicate_found", "message": "A similar memory entry already exists."})
 
             timestamp = datetime.now(timezone.utc).isoformat()
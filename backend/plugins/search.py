@@ -74,6 +74,19 @@ class SearchPlugin(BasePlugin):
             logger.warning(f"Search query rewrite failed, fallback to raw query. Error: {e}")
             return query
 
+    def get_trigger_hints(self) -> Optional[Dict[str, Any]]:
+        """Both command modes require the lowered command somewhere in the message."""
+        if not self.enabled:
+            return {"prefixes": [], "keywords": [], "requires_main_trigger": False}
+        if self.trigger_mode == "command":
+            cmd_lower = (self.command or "").strip().lower()
+            keywords = [cmd_lower] if cmd_lower else []
+        elif self.trigger_mode == "keyword":
+            keywords = [str(keyword).lower() for keyword in self.keywords]
+        else:
+            keywords = []
+        return {"prefixes": [], "keywords": keywords, "requires_main_trigger": self.require_main_trigger}
+
     async def handle_message(self, message: discord.Message, bot_config: Dict[str, Any]) -> Optional[Tuple[str, List[str]] | bool]:
         """Handles incoming messages and injects search results when triggered."""
         if not self.enabled:
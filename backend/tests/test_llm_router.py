@@ -0,0 +1,286 @@
+# backend/tests/test_llm_router.py
+import asyncio
+import json
+import time
+
+from aiohttp import web
+
+from app.llm_providers import router
+from app.llm_providers.base import LLMProvider
+from app.llm_providers.factory import get_llm_provider, provider_registry
+from app.llm_providers.router import BREAKER_MIN_SAMPLES, BackendHealth, RoutedProvider, RouteTarget
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+class FakeProvider(LLMProvider):
+    """
+    A scripted backend. `fail` is None (answer normally), "error" (error event before any
+    text), "raise", or "error_after_start" (some text, then an error); `delay` holds back the
+    first event. Streams that are closed or cancelled before they finish count as abandoned.
+    """
+
+    def __init__(self, name: str, fail=None, delay: float = 0.0):
+        super().__init__({})
+        self.name = name
+        self.fail = fail
+        self.delay = delay
+        self.calls = 0
+        self.abandoned = 0
+
+    async def get_response_stream(self, messages, images=None, tools=None, tool_functions=None):
+        self.calls += 1
+        finished = False
+        try:
+            await asyncio.sleep(self.delay)
+            if self.fail == "raise":
+                finished = True
+                raise RuntimeError(f"{self.name} is down")
+            if self.fail == "error":
+                finished = True
+                yield "final", f"LLM_PROVIDER_ERROR: {self.name} is down"
+                return
+            yield "delta", f"hello from {self.name}"
+            if self.fail == "error_after_start":
+                finished = True
+                yield "final", f"LLM_PROVIDER_ERROR: {self.name} dropped the stream"
+                return
+            yield "final", f"hello from {self.name}"
+            yield "usage", {"input_tokens": 1, "output_tokens": 3}
+            finished = True
+        finally:
+            if not finished:
+                self.abandoned += 1
+
+
+def _routed(*providers: FakeProvider, hedge: bool = False) -> RoutedProvider:
+    targets = [RouteTarget(provider.name, provider, BackendHealth(provider.name)) for provider in providers]
+    return RoutedProvider({"llm_hedge_enabled": hedge}, targets)
+
+
+def _health(routed: RoutedProvider, index: int) -> BackendHealth:
+    return routed.targets[index].health
+
+
+async def _collect(provider: LLMProvider):
+    return [event async for event in provider.get_response_stream(MESSAGES)]
+
+
+def _final(events):
+    return [data for kind, data in events if kind == "final"][-1]
+
+
+def _open_circuit(health: BackendHealth, cooldown_elapsed: bool = False) -> None:
+    for _ in range(BREAKER_MIN_SAMPLES):
+        health.record(False)
+    assert health.state == "open"
+    if cooldown_elapsed:
+        health.opened_at -= router.BREAKER_COOLDOWN_SECONDS + 1
+
+
+def test_fails_over_when_the_primary_errors_before_answering():
+    for fail in ("error", "raise"):
+        primary, fallback = FakeProvider("primary", fail=fail), FakeProvider("fallback")
+        routed = _routed(primary, fallback)
+        events = asyncio.run(_collect(routed))
+        assert _final(events) == "hello from fallback"
+        assert ("usage", {"input_tokens": 1, "output_tokens": 3}) in events
+        assert _health(routed, 0).failures == 1
+        assert _health(routed, 1).snapshot()["calls"] == 1
+
+
+def test_no_failover_once_the_backend_started_answering():
+    primary, fallback = FakeProvider("primary", fail="error_after_start"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    events = asyncio.run(_collect(routed))
+    assert events[0] == ("delta", "hello from primary")
+    assert _final(events).startswith("LLM_PROVIDER_ERROR")
+    assert fallback.calls == 0
+    assert _health(routed, 0).failures == 1
+
+
+def test_reports_the_last_error_when_every_backend_fails():
+    routed = _routed(FakeProvider("primary", fail="error"), FakeProvider("fallback", fail="raise"))
+    events = asyncio.run(_collect(routed))
+    assert events == [("final", "LLM_PROVIDER_ERROR: fallback raised: fallback is down")]
+
+
+def test_breaker_opens_and_skips_the_failing_backend():
+    primary, fallback = FakeProvider("primary", fail="error"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    for _ in range(BREAKER_MIN_SAMPLES):
+        asyncio.run(_collect(routed))
+    assert _health(routed, 0).state == "open"
+
+    events = asyncio.run(_collect(routed))
+    assert _final(events) == "hello from fallback"
+    assert primary.calls == BREAKER_MIN_SAMPLES
+
+
+def test_half_open_probe_closes_the_circuit_on_success():
+    primary, fallback = FakeProvider("primary"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    _open_circuit(_health(routed, 0), cooldown_elapsed=True)
+
+    events = asyncio.run(_collect(routed))
+    assert _final(events) == "hello from primary"
+    assert _health(routed, 0).state == "closed"
+    assert fallback.calls == 0
+
+
+def test_half_open_probe_reopens_the_circuit_on_failure():
+    primary, fallback = FakeProvider("primary", fail="error"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    _open_circuit(_health(routed, 0), cooldown_elapsed=True)
+
+    events = asyncio.run(_collect(routed))
+    assert _final(events) == "hello from fallback"
+    assert primary.calls == 1
+    assert _health(routed, 0).state == "open"
+
+
+def test_half_open_lets_a_single_probe_through():
+    async def run():
+        primary, fallback = FakeProvider("primary", delay=0.05), FakeProvider("fallback")
+        routed = _routed(primary, fallback)
+        _open_circuit(_health(routed, 0), cooldown_elapsed=True)
+        results = await asyncio.gather(*(_collect(routed) for _ in range(4)))
+        assert primary.calls == 1
+        assert fallback.calls == 3
+        assert [_final(events) for events in results].count("hello from primary") == 1
+        assert _health(routed, 0).state == "closed"
+
+    asyncio.run(run())
+
+
+def test_unused_fallback_does_not_hold_its_probe_slot():
+    primary, fallback = FakeProvider("primary"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    _open_circuit(_health(routed, 1), cooldown_elapsed=True)
+
+    # The primary answers, so the fallback is never launched and must not take its probe.
+    for _ in range(2):
+        assert _final(asyncio.run(_collect(routed))) == "hello from primary"
+    assert fallback.calls == 0
+
+    primary.fail = "error"
+    events = asyncio.run(_collect(routed))
+    assert _final(events) == "hello from fallback"
+    assert _health(routed, 1).state == "closed"
+
+
+def test_tries_every_backend_when_all_circuits_are_open():
+    primary, fallback = FakeProvider("primary", fail="error"), FakeProvider("fallback")
+    routed = _routed(primary, fallback)
+    _open_circuit(_health(routed, 0))
+    _open_circuit(_health(routed, 1))
+
+    events = asyncio.run(_collect(routed))
+    assert _final(events) == "hello from fallback"
+    assert (primary.calls, fallback.calls) == (1, 1)
+
+
+def test_hedge_wins_and_cancels_the_slow_backend(monkeypatch):
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    primary, fallback = FakeProvider("primary", delay=5.0), FakeProvider("fallback")
+    routed = _routed(primary, fallback, hedge=True)
+
+    started = time.monotonic()
+    events = asyncio.run(_collect(routed))
+    assert time.monotonic() - started < 1.0
+    assert _final(events) == "hello from fallback"
+    assert primary.abandoned == 1
+    assert _health(routed, 1).hedges_won == 1
+    # Losing a hedge race is not a failure.
+    assert _health(routed, 0).snapshot()["calls"] == 0
+
+
+def test_no_hedge_when_the_primary_answers_in_time(monkeypatch):
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY_SECONDS", 1.0)
+    primary, fallback = FakeProvider("primary", delay=0.01), FakeProvider("fallback")
+    routed = _routed(primary, fallback, hedge=True)
+    assert _final(asyncio.run(_collect(routed))) == "hello from primary"
+    assert fallback.calls == 0
+
+
+def test_losing_hedge_releases_its_probe(monkeypatch):
+    monkeypatch.setattr(router, "HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    primary, fallback = FakeProvider("primary", delay=0.2), FakeProvider("fallback", delay=5.0)
+    routed = _routed(primary, fallback, hedge=True)
+    _open_circuit(_health(routed, 1), cooldown_elapsed=True)
+
+    assert _final(asyncio.run(_collect(routed))) == "hello from primary"
+    assert fallback.calls == 1 and fallback.abandoned == 1
+    assert _health(routed, 1).allow()
+
+
+def test_caller_closing_early_records_nothing():
+    async def run():
+        primary, fallback = FakeProvider("primary"), FakeProvider("fallback")
+        routed = _routed(primary, fallback)
+        _open_circuit(_health(routed, 0), cooldown_elapsed=True)
+        stream = routed.get_response_stream(MESSAGES)
+        assert await stream.__anext__() == ("delta", "hello from primary")
+        await stream.aclose()
+        assert primary.abandoned == 1
+        health = _health(routed, 0)
+        assert health.state == "half_open" and health.calls == BREAKER_MIN_SAMPLES
+        # The abandoned probe gave its slot back.
+        assert health.allow()
+
+    asyncio.run(run())
+
+
+async def _openai_stub():
+    """A minimal OpenAI-compatible streaming endpoint; only the key "good-key" is accepted."""
+
+    async def chat_completions(request: web.Request) -> web.StreamResponse:
+        if request.headers.get("Authorization") != "Bearer good-key":
+            return web.json_response({"error": {"message": "Incorrect API key provided", "type": "invalid_request_error"}}, status=401)
+        body = await request.json()
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for piece in ("Hello", " from ", body["model"]):
+            chunk = {
+                "id": "chatcmpl-test",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": body["model"],
+                "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    app = web.Application()
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    return runner, f"http://127.0.0.1:{port}/v1"
+
+
+def test_openai_backend_fails_over_through_the_factory():
+    async def run():
+        runner, base_url = await _openai_stub()
+        try:
+            provider = get_llm_provider({
+                "llm_provider": "openai",
+                "model_name": "main-model",
+                "api_key": "revoked-key",
+                "base_url": base_url,
+                "llm_fallback_targets": [{"provider": "openai", "model_name": "backup-model", "api_key": "good-key"}],
+            })
+            assert isinstance(provider, RoutedProvider)
+            events = await _collect(provider)
+            assert [data for kind, data in events if kind == "delta"] == ["Hello", " from ", "backup-model"]
+            assert _final(events) == "Hello from backup-model"
+            assert provider.targets[0].health.failures == 1
+            assert provider.targets[1].health.snapshot()["calls"] == 1
+        finally:
+            await provider_registry.aclose()
+            await runner.cleanup()
+
+    asyncio.run(run())
@@ -0,0 +1,88 @@
+# backend/tests/test_memory_vector_recall.py
+import asyncio
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from app.core_logic import knowledge_manager as km_module
+from app.core_logic.knowledge_manager import KnowledgeManager
+
+CONFIG = {
+    "memory_vector_recall_enabled": True,
+    "embedding_provider": "local",
+    "embedding_dimensions": 256,
+}
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = KnowledgeManager(db_path=str(tmp_path / "knowledge.sqlite"))
+    yield manager
+    manager.close()
+
+
+def _add(manager: KnowledgeManager, content: str) -> int:
+    return manager.add_memory(content, datetime.now(timezone.utc).isoformat(), "1", "alice", "manual")
+
+
+def _wait_for_vectors(manager: KnowledgeManager, count: int) -> None:
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        with manager._pool.read() as conn:
+            if conn.execute("SELECT COUNT(*) FROM memory_embeddings").fetchone()[0] >= count:
+                return
+        time.sleep(0.02)
+    raise AssertionError("memories were not embedded in the background")
+
+
+def test_vector_recall_finds_a_memory_without_shared_tokens(manager):
+    target = _add(manager, "alice keeps a golden retriever called biscuit")
+    _add(manager, "the weekly meeting moved to thursday afternoon")
+    manager.schedule_embedding(CONFIG)
+    _wait_for_vectors(manager, 2)
+
+    async def run():
+        return await manager.get_relevant_memories_async("retrievers", top_k=1, config=CONFIG)
+
+    assert [row["id"] for row in asyncio.run(run())] == [target]
+
+
+def test_slow_query_embedding_does_not_hold_pool_workers(manager, monkeypatch):
+    _add(manager, "alice keeps a golden retriever called biscuit")
+    monkeypatch.setattr(km_module, "QUERY_EMBED_TIMEOUT_SECONDS", 0.3)
+
+    def slow_embed(texts, config):
+        time.sleep(1.0)
+        return None
+
+    monkeypatch.setattr(km_module, "embed_texts", slow_embed)
+
+    async def run():
+        # More concurrent recalls than the pool has workers.
+        recalls = [manager.get_relevant_memories_async("golden retriever", config=CONFIG) for _ in range(8)]
+        started = time.monotonic()
+        results = await asyncio.gather(*recalls, manager.run(manager.get_all_memories))
+        return time.monotonic() - started, results
+
+    elapsed, results = asyncio.run(run())
+    assert elapsed < 0.9
+    # Recall fell back to lexical scoring.
+    assert all(len(memories) == 1 for memories in results[:8])
+    assert manager._embed_failures >= 1
+
+
+def test_embedding_batches_keep_the_memory_arrays_cache(manager):
+    for i in range(5):
+        _add(manager, f"memory number {i} about topic {i}")
+    arrays = manager._get_memory_arrays()
+    while manager.embed_pending_memories(CONFIG, limit=2) > 0:
+        pass
+    assert manager._get_memory_arrays() is arrays
+    ids, matrix = manager._get_memory_vectors("local:hash:256")
+    assert ids.shape[0] == matrix.shape[0] == 5
+
+    # Deleting a memory invalidates both caches.
+    assert manager.delete_memory(int(ids[0]))
+    assert manager._get_memory_arrays() is not arrays
+    assert manager._get_memory_vectors("local:hash:256")[0].shape[0] == 4
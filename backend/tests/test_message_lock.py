@@ -0,0 +1,180 @@
+# backend/tests/test_message_lock.py
+import asyncio
+
+import fakeredis
+
+from app.redis_service import MESSAGE_DONE_PREFIX, MESSAGE_LOCK_PREFIX, MessageLockService, RedisService
+
+
+class _DownRedis:
+    """A client whose every command fails, as if the server were unreachable."""
+
+    async def ping(self):
+        raise ConnectionError("connection refused")
+
+
+class _ResettingRedis:
+    """Answers ping, then drops the connection on every script call."""
+
+    async def ping(self):
+        return True
+
+    def register_script(self, script):
+        async def call(keys, args):
+            raise ConnectionError("connection reset")
+
+        return call
+
+
+def _service(**kwargs):
+    redis = RedisService(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    return MessageLockService(redis, **kwargs)
+
+
+def test_only_one_handler_gets_the_lock():
+    async def run():
+        # Two services on one server stand in for two bot instances.
+        server = fakeredis.FakeServer()
+        services = [
+            MessageLockService(RedisService(client=fakeredis.FakeAsyncRedis(server=server, decode_responses=True)))
+            for _ in range(2)
+        ]
+        locks = await asyncio.gather(*(services[i % 2].acquire(42) for i in range(10)))
+        held = [lock for lock in locks if lock is not None]
+        assert len(held) == 1
+        assert not held[0].local
+        assert sum(service.metrics()["counters"]["contended"] for service in services) == 9
+        await held[0].release(done=False)
+        assert await services[1].acquire(42) is not None
+
+    asyncio.run(run())
+
+
+def test_release_only_deletes_own_token():
+    async def run():
+        service = _service()
+        client = await service._redis.get_client()
+        lock = await service.acquire(1)
+        # The lock expired and another instance took it over.
+        await client.set(f"{MESSAGE_LOCK_PREFIX}1", "someone-else")
+        await lock.release(done=False)
+        assert await client.get(f"{MESSAGE_LOCK_PREFIX}1") == "someone-else"
+        assert service.metrics()["counters"]["lost_on_release"] == 1
+
+    asyncio.run(run())
+
+
+def test_done_marker_blocks_reacquire():
+    async def run():
+        service = _service(done_ttl_seconds=300)
+        client = await service._redis.get_client()
+        lock = await service.acquire(7)
+        await lock.release(done=True)
+        assert await client.exists(f"{MESSAGE_LOCK_PREFIX}7") == 0
+        assert 0 < await client.ttl(f"{MESSAGE_DONE_PREFIX}7") <= 300
+        assert await service.acquire(7) is None
+        assert await MessageLockService(RedisService(client=client)).acquire(7) is None
+
+    asyncio.run(run())
+
+
+def test_release_without_done_lets_message_be_retried():
+    async def run():
+        service = _service()
+        lock = await service.acquire(8)
+        await lock.release(done=False)
+        client = await service._redis.get_client()
+        assert await client.exists(f"{MESSAGE_DONE_PREFIX}8") == 0
+        assert await MessageLockService(RedisService(client=client)).acquire(8) is not None
+
+    asyncio.run(run())
+
+
+def test_keepalive_extends_the_lock():
+    async def run():
+        service = _service(ttl_seconds=0.3)
+        client = await service._redis.get_client()
+        lock = await service.acquire(9)
+        # Well past the TTL: without the keepalive the key would be gone.
+        await asyncio.sleep(0.6)
+        assert await client.get(f"{MESSAGE_LOCK_PREFIX}9") == lock.token
+        assert 0 < await client.pttl(f"{MESSAGE_LOCK_PREFIX}9") <= 300
+        await lock.release()
+        assert lock._keepalive.cancelled() or lock._keepalive.done()
+
+    asyncio.run(run())
+
+
+def test_keepalive_stops_after_max_hold():
+    async def run():
+        service = _service(ttl_seconds=0.15, max_hold_seconds=0.1)
+        client = await service._redis.get_client()
+        lock = await service.acquire(10)
+        await asyncio.sleep(0.4)
+        assert await client.exists(f"{MESSAGE_LOCK_PREFIX}10") == 0
+        assert lock._keepalive.done()
+        await lock.release()
+
+    asyncio.run(run())
+
+
+def test_keepalive_notices_a_lost_lock():
+    async def run():
+        service = _service(ttl_seconds=0.3)
+        client = await service._redis.get_client()
+        lock = await service.acquire(11)
+        await client.set(f"{MESSAGE_LOCK_PREFIX}11", "someone-else")
+        await asyncio.sleep(0.2)
+        assert lock._keepalive.done()
+        assert service.metrics()["counters"]["extend_failures"] == 1
+        await lock.release()
+
+    asyncio.run(run())
+
+
+def test_falls_back_to_local_locks_when_redis_is_down():
+    async def run():
+        service = MessageLockService(RedisService(client=_DownRedis()))
+        service._redis.fail_fast = False
+        lock = await service.acquire(5)
+        assert lock is not None and lock.local
+        assert await service.acquire(5) is None
+        await lock.release(done=True)
+        assert await service.acquire(5) is None
+        assert service.metrics()["counters"]["already_done"] == 1
+        assert service.metrics()["mode"] == "local"
+
+        other = await service.acquire(6)
+        await other.release(done=False)
+        assert await service.acquire(6) is not None
+        assert service.metrics()["redis"]["consecutive_failures"] == 1
+
+    asyncio.run(run())
+
+
+def test_fail_on_redis_error_skips_messages(monkeypatch):
+    monkeypatch.setenv("FAIL_ON_REDIS_ERROR", "true")
+
+    async def run():
+        service = MessageLockService(RedisService(client=_DownRedis()))
+        assert service._redis.fail_fast
+        assert await service.acquire(5) is None
+        assert await service.acquire(6) is None
+        metrics = service.metrics()
+        assert metrics["counters"]["skipped_redis_down"] == 2
+        assert metrics["mode"] == "unavailable"
+        assert metrics["held_local"] == 0
+
+    asyncio.run(run())
+
+
+def test_redis_error_mid_command_degrades_to_local_lock():
+    async def run():
+        service = MessageLockService(RedisService(client=_ResettingRedis()))
+        service._redis.fail_fast = False
+        lock = await service.acquire(12)
+        assert lock is not None and lock.local
+        assert service.metrics()["counters"]["redis_errors"] == 1
+        assert not service._redis.available
+
+    asyncio.run(run())
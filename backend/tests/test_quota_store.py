@@ -0,0 +1,238 @@
+# backend/tests/test_quota_store.py
+import asyncio
+import time
+
+import fakeredis
+
+from app.core_logic import quota_store
+from app.core_logic.quota_store import RedisQuotaStore, SQLiteQuotaStore
+from app.redis_service import RedisService
+
+
+class _DownRedis:
+    """A client whose every command fails, as if the server were unreachable."""
+
+    async def ping(self):
+        raise ConnectionError("connection refused")
+
+
+def _redis_store(tmp_path, **kwargs):
+    redis = RedisService(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+    return RedisQuotaStore(redis, fallback=SQLiteQuotaStore(str(tmp_path / "fallback.sqlite")), **kwargs)
+
+
+async def _reserve_many(stores, count, message_limit=None, token_limit=None, tokens=0):
+    calls = [stores[i % len(stores)].reserve("u1", None, message_limit, token_limit, tokens) for i in range(count)]
+    results = await asyncio.gather(*calls)
+    return [reservation for reservation, _ in results if reservation is not None]
+
+
+def test_sqlite_concurrent_reserve_cannot_overspend(tmp_path):
+    async def run():
+        # Two stores on one file stand in for two bot instances.
+        db_path = str(tmp_path / "quota.sqlite")
+        stores = [SQLiteQuotaStore(db_path), SQLiteQuotaStore(db_path)]
+        try:
+            granted = await _reserve_many(stores, 20, message_limit=5)
+            assert len(granted) == 5
+            for reservation in granted:
+                await stores[0].release(reservation)
+
+            granted = await _reserve_many(stores, 20, token_limit=1000, tokens=300)
+            assert len(granted) == 3
+        finally:
+            for store in stores:
+                await store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_commit_charges_usage_and_release_frees_the_hold(tmp_path):
+    async def run():
+        store = SQLiteQuotaStore(str(tmp_path / "quota.sqlite"))
+        try:
+            first, _ = await store.reserve("u1", None, 2, None, 0)
+            second, usage = await store.reserve("u1", None, 2, None, 0)
+            assert first and second
+            assert usage["reserved_messages"] == 1
+            assert (await store.reserve("u1", None, 2, None, 0))[0] is None
+
+            await store.release(second)
+            usage = await store.commit(first, 1, 120)
+            assert (usage["message_count"], usage["total_tokens"]) == (1, 120)
+
+            third, usage = await store.reserve("u1", None, 2, None, 0)
+            assert third is not None
+            assert (usage["message_count"], usage["reserved_messages"]) == (1, 0)
+            assert (await store.reserve("u1", None, 2, None, 0))[0] is None
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_expired_reservations_stop_counting(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota_store, "QUOTA_RESERVATION_TTL_SECONDS", 0.05)
+
+    async def run():
+        store = SQLiteQuotaStore(str(tmp_path / "quota.sqlite"))
+        try:
+            assert (await store.reserve("u1", None, 1, None, 0))[0] is not None
+            assert (await store.reserve("u1", None, 1, None, 0))[0] is None
+            await asyncio.sleep(0.1)
+            reservation, usage = await store.reserve("u1", None, 1, None, 0)
+            assert reservation is not None
+            assert usage["reserved_messages"] == 0
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_evicts_idle_users(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota_store, "QUOTA_EVICT_INTERVAL_SECONDS", 0.0)
+
+    async def run():
+        store = SQLiteQuotaStore(str(tmp_path / "quota.sqlite"), idle_ttl_seconds=0.05)
+        try:
+            await store.add_usage("idle", 3, 500)
+            await asyncio.sleep(0.1)
+            await store.get_usage("active", None)
+            usage = await store.get_usage("idle", None)
+            assert (usage["message_count"], usage["total_tokens"]) == (0, 0)
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_concurrent_reserve_cannot_overspend(tmp_path):
+    async def run():
+        store = _redis_store(tmp_path)
+        try:
+            await store.add_usage("u1", 2, 0)
+            granted = await _reserve_many([store], 20, message_limit=5)
+            assert len(granted) == 3
+            for reservation in granted:
+                await store.release(reservation)
+
+            granted = await _reserve_many([store], 20, token_limit=1000, tokens=300)
+            assert len(granted) == 3
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_commit_charges_usage_and_release_frees_the_hold(tmp_path):
+    async def run():
+        store = _redis_store(tmp_path)
+        try:
+            first, _ = await store.reserve("u1", None, 2, None, 0)
+            second, usage = await store.reserve("u1", None, 2, None, 0)
+            assert first and second
+            assert usage["reserved_messages"] == 1
+            assert (await store.reserve("u1", None, 2, None, 0))[0] is None
+
+            await store.release(second)
+            usage = await store.commit(first, 1, 120)
+            assert (usage["message_count"], usage["total_tokens"]) == (1, 120)
+
+            third, usage = await store.reserve("u1", None, 2, None, 0)
+            assert third is not None
+            assert (usage["message_count"], usage["reserved_messages"]) == (1, 0)
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_expired_reservations_stop_counting(tmp_path, monkeypatch):
+    monkeypatch.setattr(quota_store, "QUOTA_RESERVATION_TTL_SECONDS", 0.05)
+
+    async def run():
+        store = _redis_store(tmp_path)
+        try:
+            assert (await store.reserve("u1", None, 1, None, 0))[0] is not None
+            assert (await store.reserve("u1", None, 1, None, 0))[0] is None
+            await asyncio.sleep(0.1)
+            reservation, usage = await store.reserve("u1", None, 1, None, 0)
+            assert reservation is not None
+            assert usage["reserved_messages"] == 0
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_keys_expire_after_idle_ttl(tmp_path):
+    async def run():
+        store = _redis_store(tmp_path, idle_ttl_seconds=120)
+        try:
+            reservation, _ = await store.reserve("u1", None, None, None, 10)
+            client = await store._redis.get_client()
+            assert 0 < await client.ttl(f"{quota_store.QUOTA_KEY_PREFIX}u1") <= 120
+            assert 0 < await client.ttl(f"{quota_store.QUOTA_RESERVATION_KEY_PREFIX}u1") <= 120
+            await store.commit(reservation, 1, 10)
+            assert 0 < await client.ttl(f"{quota_store.QUOTA_KEY_PREFIX}u1") <= 120
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_window_resets_after_refresh_period(tmp_path):
+    async def run():
+        store = _redis_store(tmp_path)
+        try:
+            await store.add_usage("u1", 4, 400)
+            assert (await store.get_usage("u1", 3600))["message_count"] == 4
+            await asyncio.sleep(0.05)
+            usage = await store.get_usage("u1", 0.01)
+            assert (usage["message_count"], usage["total_tokens"]) == (0, 0)
+        finally:
+            await store.close()
+
+    asyncio.run(run())
+
+
+def test_redis_down_falls_back_to_local_store(tmp_path):
+    async def run():
+        fallback = SQLiteQuotaStore(str(tmp_path / "fallback.sqlite"))
+        store = RedisQuotaStore(RedisService(client=_DownRedis()), fallback=fallback)
+        try:
+            started = time.monotonic()
+            granted = await _reserve_many([store], 5, message_limit=2)
+            assert len(granted) == 2
+            # After the first failure the backoff keeps callers off the network.
+            assert time.monotonic() - started < 1.0
+
+            usage = await store.commit(granted[0], 1, 50)
+            assert (usage["message_count"], usage["total_tokens"]) == (1, 50)
+            await store.release(granted[1])
+            assert (await fallback.get_usage("u1", None))["message_count"] == 1
+            assert store._redis.status()["consecutive_failures"] == 1
+        finally:
+            await store.close()
+            await fallback.close()
+
+    asyncio.run(run())
+
+
+def test_redis_commit_during_outage_is_counted_locally(tmp_path):
+    async def run():
+        redis = RedisService(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+        fallback = SQLiteQuotaStore(str(tmp_path / "fallback.sqlite"))
+        store = RedisQuotaStore(redis, fallback=fallback)
+        try:
+            reservation, _ = await store.reserve("u1", None, None, None, 0)
+            assert reservation is not None
+            redis.mark_failure(ConnectionError("connection reset"))
+            usage = await store.commit(reservation, 1, 80)
+            assert (usage["message_count"], usage["total_tokens"]) == (1, 80)
+        finally:
+            await store.close()
+            await fallback.close()
+
+    asyncio.run(run())
+
@@ -14,6 +14,8 @@ const defaultConfig = {
     grok_base_url: '',
     model_name: 'gpt-4o', 
     llm_is_multimodal: true,
+    llm_fallback_targets: [],
+    llm_hedge_enabled: false,
     ocr_provider: 'openai',
     ocr_api_key: '',
     ocr_base_url: '',
@@ -34,6 +36,8 @@ const defaultConfig = {
     rerank_base_url: '',
     rerank_port: '',
     rerank_model_name: 'gpt-4.1-mini',
+    rerank_enabled: false,
+    rerank_timeout_seconds: 3,
     system_prompt: '', 
     blocked_prompt_response: '',
     trigger_keywords: [],
@@ -49,6 +53,7 @@ const defaultConfig = {
     repeat_parrot_min_length: 2,
     repeat_parrot_require_multiple_users: true,
     stream_response: true, 
+    llm_max_tool_rounds: 4,
     auto_memory_enabled: true,
     auto_memory_min_length: 8,
     auto_memory_cooldown_seconds: 45,
@@ -59,6 +64,7 @@ const defaultConfig = {
     auto_memory_recall_top_k: 12,
     auto_memory_recall_char_limit: 2200,
     auto_memory_recall_max_age_days: 365,
+    memory_vector_recall_enabled: false,
     user_personas: {},
     role_based_config: {},
     scoped_prompts: { guilds: {}, channels: {} },
@@ -82,6 +88,8 @@ export const coreConfig = writable({
     grok_base_url: '',
     model_name: 'gpt-4o',
     llm_is_multimodal: true,
+    llm_fallback_targets: [],
+    llm_hedge_enabled: false,
     ocr_provider: 'openai',
     ocr_api_key: '',
     ocr_base_url: '',
@@ -102,6 +110,8 @@ export const coreConfig = writable({
     rerank_base_url: '',
     rerank_port: '',
     rerank_model_name: 'gpt-4.1-mini',
+    rerank_enabled: false,
+    rerank_timeout_seconds: 3,
     api_secret_key: ''
 });
 
@@ -122,6 +132,7 @@ export const behaviorConfig = writable({
     repeat_parrot_min_length: 2,
     repeat_parrot_require_multiple_users: true,
     stream_response: true,
+    llm_max_tool_rounds: 4,
     memory_dedup_threshold: 0.0,
     world_book_dedup_threshold: 0.0,
     auto_memory_enabled: true,
@@ -133,7 +144,8 @@ export const behaviorConfig = writable({
     auto_memory_direct_promote_ai_tag: false,
     auto_memory_recall_top_k: 12,
     auto_memory_recall_char_limit: 2200,
-    auto_memory_recall_max_age_days: 365
+    auto_memory_recall_max_age_days: 365,
+    memory_vector_recall_enabled: false
 });
 
 export const contextConfig = writable({
@@ -241,6 +253,8 @@ export async function fetchConfig(options = {}) {
                 grok_base_url: mergedConfig.grok_base_url || '',
                 model_name: mergedConfig.model_name,
                 llm_is_multimodal: mergedConfig.llm_is_multimodal !== false,
+                llm_fallback_targets: mergedConfig.llm_fallback_targets || [],
+                llm_hedge_enabled: !!mergedConfig.llm_hedge_enabled,
                 ocr_provider: mergedConfig.ocr_provider || 'openai',
                 ocr_api_key: mergedConfig.ocr_api_key || '',
                 ocr_base_url: mergedConfig.ocr_base_url || '',
@@ -259,6 +273,8 @@ export async function fetchConfig(options = {}) {
                 rerank_base_url: mergedConfig.rerank_base_url || '',
                 rerank_port: mergedConfig.rerank_port || '',
                 rerank_model_name: mergedConfig.rerank_model_name || 'gpt-4.1-mini',
+                rerank_enabled: !!mergedConfig.rerank_enabled,
+                rerank_timeout_seconds: mergedConfig.rerank_timeout_seconds ?? 3,
                 api_secret_key: mergedConfig.api_secret_key
             });
             behaviorConfig.set({
@@ -278,6 +294,7 @@ export async function fetchConfig(options = {}) {
                 repeat_parrot_min_length: mergedConfig.repeat_parrot_min_length ?? 2,
                 repeat_parrot_require_multiple_users: mergedConfig.repeat_parrot_require_multiple_users !== false,
                 stream_response: mergedConfig.stream_response,
+                llm_max_tool_rounds: mergedConfig.llm_max_tool_rounds ?? 4,
                 memory_dedup_threshold: mergedConfig.memory_dedup_threshold ?? 0.0,
                 world_book_dedup_threshold: mergedConfig.world_book_dedup_threshold ?? 0.0,
                 auto_memory_enabled: mergedConfig.auto_memory_enabled !== false,
@@ -289,7 +306,8 @@ export async function fetchConfig(options = {}) {
                 auto_memory_direct_promote_ai_tag: !!mergedConfig.auto_memory_direct_promote_ai_tag,
                 auto_memory_recall_top_k: mergedConfig.auto_memory_recall_top_k ?? 12,
                 auto_memory_recall_char_limit: mergedConfig.auto_memory_recall_char_limit ?? 2200,
-                auto_memory_recall_max_age_days: mergedConfig.auto_memory_recall_max_age_days ?? 365
+                auto_memory_recall_max_age_days: mergedConfig.auto_memory_recall_max_age_days ?? 365,
+                memory_vector_recall_enabled: !!mergedConfig.memory_vector_recall_enabled
             });
             contextConfig.set({
                 context_mode: mergedConfig.context_mode,
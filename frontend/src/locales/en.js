@@ -72,6 +72,17 @@ export default {
     multimodalInfo: 'Enable this when the main model can read images directly. Disable it to route images through a separate OCR model before they reach the text-only LLM.',
     ocrHiddenHint: 'OCR settings are hidden because the main model will consume images directly.'
   },
+  fallbackBackends: {
+    title: 'Fallback Backends',
+    info: 'Tried in order when the main backend fails before replying or its circuit breaker is open. Blank fields reuse the main backend settings when the provider is the same.',
+    modelName: 'Model name',
+    baseUrl: 'Base URL (optional)',
+    apiKey: 'API key (optional for the same provider)',
+    add: 'Add Backend',
+    remove: 'Remove',
+    hedgeLabel: 'Hedge slow requests',
+    hedgeInfo: 'If the first token is later than the backend usually takes (p95), send the same request to the next backend and keep whichever answers first. Faster under load, but the abandoned request may still be billed.'
+  },
   modelProviders: {
     openai: 'OpenAI',
     grok: 'Grok (xAI)',
@@ -95,7 +106,10 @@ export default {
     apiKey: 'Rerank API Key',
     baseUrl: 'Rerank Base URL',
     port: 'Rerank Port',
-    modelName: 'Rerank Model'
+    modelName: 'Rerank Model',
+    enabled: 'Rerank recalled memories and world book entries',
+    timeoutSeconds: 'Rerank Timeout (seconds)',
+    info: 'Candidates are scored in one request per message. If the rerank model is slower than the timeout, the original recall order is kept.'
   },
   ocrSettings: {
     title: 'OCR Model Settings',
@@ -144,7 +158,9 @@ export default {
     modes: {
       stream: 'Stream Response (show typing)',
       nonStream: 'Complete Response (send at once)'
-    }
+    },
+    maxToolRounds: 'Max tool call rounds',
+    maxToolRoundsHint: 'per reply; 0 disables tools'
   },
   automation: {
     title: 'Automation',
@@ -556,6 +572,7 @@ export default {
       autoMemoryRecallTopK: 'Memory recall top K',
       autoMemoryRecallCharLimit: 'Memory recall character budget',
       autoMemoryRecallMaxAgeDays: 'Memory max age (days)',
+      memoryVectorRecallEnabled: 'Use embeddings for memory recall (embedding model settings)',
      save: 'Save Deduplication Settings'
    },
    confirmDeleteMemory: 'Are you sure you want to delete this memory item?',
@@ -60,6 +60,17 @@ export default {
     fetchModelsTooltip: '获取或刷新可用模型列表',
     modelListInfo: '已加载 {count} 个可用模型，可切换为手动输入'
   },
+  fallbackBackends: {
+    title: '备用后端',
+    info: '主后端在回复前出错或熔断打开时，按顺序尝试这些后端。提供商与主后端相同时，留空的字段沿用主后端设置。',
+    modelName: '模型名称',
+    baseUrl: '基础 URL（可选）',
+    apiKey: 'API Key（同一提供商可留空）',
+    add: '添加后端',
+    remove: '删除',
+    hedgeLabel: '对慢请求进行对冲',
+    hedgeInfo: '首个 token 晚于该后端通常耗时（p95）时，把同一请求发给下一个后端，采用先返回的结果。负载高时更快，但被放弃的请求仍可能计费。'
+  },
   defaultBehavior: {
     title: '默认行为',
     modelName: '模型名称',
@@ -88,7 +99,9 @@ export default {
     modes: {
       stream: '流式响应（边生成边显示）',
       nonStream: '完整响应（一次性发送）'
-    }
+    },
+    maxToolRounds: '工具调用最大轮数',
+    maxToolRoundsHint: '每次回复；0 表示禁用工具'
   },
   automation: {
     title: '自动互动',
@@ -370,6 +383,7 @@ export default {
       memoryDedupThreshold: '记忆库查重阈值',
       worldBookDedupThreshold: '世界书查重阈值',
       dedupDescription: '设置查重阈值。0% 表示关闭查重，100% 只阻止完全相同的内容。推荐值为 80-90%。',
+      memoryVectorRecallEnabled: '使用向量嵌入召回记忆（需配置嵌入模型）',
       save: '保存查重设置'
     },
     confirmDeleteMemory: '确定要删除这条记忆吗？',
@@ -18,7 +18,11 @@ CREATE TABLE IF NOT EXISTS memory (
     timestamp TEXT NOT NULL,
     user_id TEXT,
     user_name TEXT,
-    source TEXT
+    source TEXT,
+    normalized_content TEXT,
+    plain_content TEXT,
+    tokens TEXT,
+    ts_epoch REAL
 );
 
 -- 2.1 创建 memory_candidates 表（自动记忆候选池）
@@ -57,6 +61,19 @@ CREATE TABLE IF NOT EXISTS memory_stats (
     FOREIGN KEY(memory_id) REFERENCES memory(id) ON DELETE CASCADE
 );
 
+-- 2.3 创建 memory_embeddings 表（记忆向量，float32 小端序）
+CREATE TABLE IF NOT EXISTS memory_embeddings (
+    memory_id INTEGER PRIMARY KEY,
+    model_key TEXT NOT NULL,
+    dim INTEGER NOT NULL,
+    vector BLOB NOT NULL,
+    created_at TEXT NOT NULL,
+    FOREIGN KEY(memory_id) REFERENCES memory(id) ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_memory_embeddings_model_key
+ON memory_embeddings(model_key);
+
 -- 3. 创建 FTS 虚拟表和触发器
 CREATE VIRTUAL TABLE IF NOT EXISTS world_book_fts
 USING fts5(keywords, content, content='world_book', content_rowid='id');